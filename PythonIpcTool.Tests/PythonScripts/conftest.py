@@ -0,0 +1,7 @@
+﻿# Tests for the scripts under PythonIpcTool/PythonScripts. The scripts are
+# standalone, so their folders go on sys.path and they are imported by name.
+import os, sys
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "PythonIpcTool", "PythonScripts")
+for folder in ("LocalSocket", "StandardIO", ""):
+    sys.path.insert(0, os.path.abspath(os.path.join(SCRIPTS, folder)))
@@ -0,0 +1,55 @@
+﻿import pytest
+import db_query_tool
+
+@pytest.fixture(params=["memory", "file"])
+def database(request, tmp_path):
+    data = {} if request.param == "memory" else {"database": str(tmp_path / "test.db"), "options": {"timeout": 1}}
+    database = db_query_tool.Database(db_query_tool.connection_factory(data), 4,
+                                      readers_block_writers=db_query_tool.driver_name(data) == "sqlite3")
+    database.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    for i in range(10):
+        database.execute("INSERT INTO items (name) VALUES (?)", [f"item{i}"])
+    yield database
+    database.close()
+
+def test_write_while_a_cursor_is_open(database):
+    first = database.execute("SELECT id, name FROM items ORDER BY id", batch_size=3)
+    assert not first["done"]
+
+    assert database.execute("UPDATE items SET name = 'changed' WHERE id = 1")["rowcount"] == 1
+
+    rows = first["rows"]
+    while True:
+        batch = database.fetch(first["cursor_id"], 3)
+        rows += batch["rows"]
+        if batch["done"]:
+            break
+    assert [row[0] for row in rows] == list(range(1, 11))
+    assert database.execute("SELECT name FROM items WHERE id = 1")["rows"] == [["changed"]]
+
+def test_returning_write_is_committed(database):
+    result = database.execute("INSERT INTO items (name) VALUES ('new') RETURNING id, name")
+    assert result["rows"] == [[11, "new"]]
+    # Seen from a different pooled connection than the one that wrote it
+    held = database.execute("SELECT id FROM items", batch_size=1)
+    assert database.execute("SELECT count(*) FROM items WHERE name = 'new'")["rows"] == [[1]]
+    database.close_cursor(held["cursor_id"])
+
+@pytest.mark.parametrize("sql, write", [
+    ("select * from items", False),
+    ("SELECT replace(name, 'a', 'b') FROM items", False),
+    ("delete from items where id = 1 returning id", True),
+    ("WITH x AS (SELECT 1) INSERT INTO items (name) SELECT 'a' FROM x", True),
+    ("create table t (a)", True),
+])
+def test_is_write(sql, write):
+    assert db_query_tool.is_write(sql) is write
+
+def test_returning_write_invalidates_cached_results(database):
+    database.cache = db_query_tool.QueryCache()
+    sent = []
+    query = {"sql": "SELECT count(*) AS n FROM items"}
+    db_query_tool.run_query(database, query, sent.append)
+    db_query_tool.run_query(database, {"sql": "INSERT INTO items (name) VALUES ('x') RETURNING id"}, sent.append)
+    db_query_tool.run_query(database, query, sent.append)
+    assert '"n": 10' in sent[0] and '"n": 11' in sent[-1]
@@ -0,0 +1,67 @@
+﻿import io, json, os
+import pytest
+import pytest_runner
+
+pytestmark = pytest.mark.skipif(not pytest_runner.coverage_available(), reason="needs coverage")
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def run(project, **options):
+    out = io.StringIO()
+    pytest_runner.run_tests(out, str(project), dict(options, workers=1))
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+def ran_files(messages):
+    return {m["name"].split("::")[0] for m in messages if m.get("event") == "test_finished"}
+
+def test_shared_module_change_selects_every_importer(tmp_path, monkeypatch):
+    monkeypatch.setattr(pytest_runner, "STATE_ROOT", str(tmp_path / "state"))
+    project = tmp_path / "project"
+    project.mkdir()
+    write(project / "mod.py", "VALUE = 1\n")
+    write(project / "test_a.py", "import mod\n\ndef test_a():\n    assert mod.VALUE == 1\n")
+    write(project / "test_b.py", "import mod\n\ndef test_b():\n    assert mod.VALUE == 1\n")
+
+    # One worker runs both files, so the second one finds mod already imported
+    assert ran_files(run(project)) == {"test_a.py", "test_b.py"}
+
+    write(project / "mod.py", "VALUE = 22\n")
+    messages = run(project, incremental=True)
+    assert ran_files(messages) == {"test_a.py", "test_b.py"}
+    assert messages[-1]["exitstatus"] == int(pytest.ExitCode.TESTS_FAILED)
+
+def make_project(tmp_path, monkeypatch):
+    monkeypatch.setattr(pytest_runner, "STATE_ROOT", str(tmp_path / "state"))
+    project = tmp_path / "project"
+    for folder in ("src", "tests/unit", "tests/other"):
+        (project / folder).mkdir(parents=True)
+    write(project / "pyproject.toml", '[tool.pytest.ini_options]\npythonpath = ["src"]\n')
+    write(project / "src" / "mod.py", "def value():\n    return 1\n")
+    write(project / "tests" / "unit" / "test_a.py", "import mod\n\ndef test_a():\n    assert mod.value() == 1\n")
+    write(project / "tests" / "other" / "test_b.py", "import mod\n\ndef test_b():\n    assert mod.value() == 1\n")
+    return project
+
+def test_subfolder_target_sees_changes_to_code_under_test(tmp_path, monkeypatch):
+    project = make_project(tmp_path, monkeypatch)
+    assert ran_files(run(project / "tests")) == {"tests/unit/test_a.py", "tests/other/test_b.py"}
+
+    write(project / "src" / "mod.py", "def value():\n    return 2\n")
+    messages = run(project / "tests", incremental=True)
+    assert messages[0]["mode"] == "incremental"
+    assert ran_files(messages) == {"tests/unit/test_a.py", "tests/other/test_b.py"}
+
+def test_narrow_run_keeps_change_pending_for_other_tests(tmp_path, monkeypatch):
+    project = make_project(tmp_path, monkeypatch)
+    run(project)
+
+    write(project / "src" / "mod.py", "def value():\n    return 2\n")
+    assert ran_files(run(project / "tests" / "unit", incremental=True)) == {"tests/unit/test_a.py"}
+    # test_b depends on the same edit and hasn't run since
+    assert ran_files(run(project, incremental=True)) == {"tests/unit/test_a.py", "tests/other/test_b.py"}
+    assert ran_files(run(project, incremental=True)) == {"tests/unit/test_a.py", "tests/other/test_b.py"}
+
+    write(project / "src" / "mod.py", "def value():\n    return 1\n")
+    run(project, incremental=True)
+    assert ran_files(run(project, incremental=True)) == set()
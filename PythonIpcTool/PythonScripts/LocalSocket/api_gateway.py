@@ -1,37 +1,232 @@
 ﻿# File: PythonScripts/api_gateway.py
-import sys, json, socket, requests
+import os, sys, json, socket, time, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from line_writer import LineWriter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from http_cache import HttpCache, CachedResponse
+
+DEFAULT_OPTIONS = {
+    "base_url": None,      # Relative request URLs are resolved against this
+    "max_workers": 16,     # Upstream requests in flight across all hosts
+    "per_host_limit": 6,   # ...and per host, like a browser
+    "timeout": 10.0,       # Seconds, connect and read
+    "retries": 2,          # Extra attempts on connection errors and RETRY_STATUSES
+    "backoff": 0.2,        # Seconds; doubles on each retry (Retry-After is honoured)
+    "max_body": 1024 * 1024,  # Bytes of a response body passed back to the host
+    "cache": True,         # Serve GETs through the shared HTTP cache
+}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class Gateway:
+    """Runs upstream HTTP requests on a thread pool over one keep-alive session.
+
+    Requests beyond a host's limit wait in that host's queue rather than on
+    a worker thread, so one slow upstream can't tie up the pool while other
+    hosts have work. Results are sent as soon as each request completes,
+    tagged with the caller's ids.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.options = dict(DEFAULT_OPTIONS)
+        self.session = requests.Session()
+        self.cache = HttpCache()
+        self.executor = None
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.configure({})
+
+    def configure(self, options):
+        unknown = set(options) - set(DEFAULT_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown option(s): {', '.join(sorted(unknown))}.")
+        old_workers = self.options["max_workers"] if self.executor else None
+        self.options.update(options)
+        retry = Retry(total=int(self.options["retries"]), backoff_factor=float(self.options["backoff"]),
+                      status_forcelist=RETRY_STATUSES, respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=int(self.options["per_host_limit"]),
+                              max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if old_workers != self.options["max_workers"]:
+            if self.executor:
+                self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=int(self.options["max_workers"]),
+                                               thread_name_prefix="upstream")
+        return dict(self.options)
+
+    def submit(self, spec, callback):
+        """Queues one request; callback(result) runs on a pool thread when it completes."""
+        try:
+            spec = dict(spec, url=self.resolve(spec.get("url")))
+        except ValueError as e:
+            callback({"id": spec.get("id"), "status": "error", "message": str(e), "elapsed": 0.0})
+            return
+        host = urlparse(spec["url"]).netloc
+        with self._lock:
+            state = self._hosts.setdefault(host, {"active": 0, "pending": deque()})
+            if state["active"] >= int(self.options["per_host_limit"]):
+                state["pending"].append((spec, callback))
+                return
+            state["active"] += 1
+        self.executor.submit(self._run, host, spec, callback)
+
+    def _run(self, host, spec, callback):
+        try:
+            callback(self.fetch(spec))
+        finally:
+            # Hand this host's slot straight to its next queued request, if any
+            with self._lock:
+                state = self._hosts[host]
+                queued = state["pending"].popleft() if state["pending"] else None
+                if queued is None:
+                    state["active"] -= 1
+            if queued is not None:
+                self.executor.submit(self._run, host, *queued)
+
+    def resolve(self, url):
+        if not url:
+            raise ValueError("Missing 'url'.")
+        base = self.options["base_url"]
+        return urljoin(base, url) if base else url
+
+    def _download(self, method, url, spec, extra_headers):
+        headers = dict(spec.get("headers") or {}, **extra_headers)
+        max_body = int(self.options["max_body"])
+        response = self.session.request(
+            method, url, json=spec.get("json"), data=spec.get("data"), headers=headers,
+            timeout=float(spec.get("timeout", self.options["timeout"])), stream=True)
+        with response:
+            # Stop reading at the size limit instead of downloading bodies nobody will see
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                body += chunk
+                if len(body) > max_body:
+                    break
+        return CachedResponse(response.status_code, response.headers, bytes(body[:max_body]),
+                              complete=len(body) <= max_body, cache="bypass")
+
+    def fetch(self, spec):
+        """Performs one request described by `spec` and returns a result message."""
+        result = {"id": spec.get("id")}
+        started = time.perf_counter()
+        try:
+            method = spec.get("method", "GET").upper()
+            url = requests.Request(method, self.resolve(spec.get("url")), params=spec.get("params")).prepare().url
+            result["url"] = url
+            download = lambda extra_headers: self._download(method, url, spec, extra_headers)
+            if (method == "GET" and self.options["cache"] and spec.get("cache", True)
+                    and spec.get("json") is None and spec.get("data") is None):
+                # The session's headers (login's Authorization among them) go out too, so the cache must see them
+                headers = dict(self.session.headers, **(spec.get("headers") or {}))
+                response = self.cache.request(url, download, headers)
+            else:
+                response = download({})
+            result.update(status="success", status_code=response.status_code,
+                          ok=response.status_code < 400, headers=response.headers, cache=response.cache)
+            if not response.complete:
+                result["truncated"] = True
+            body = response.body
+            encoding = requests.utils.get_encoding_from_headers(response.headers) or "utf-8"
+            if "json" in response.headers.get("content-type", "") and response.complete:
+                try:
+                    result["json"] = json.loads(body)
+                except ValueError:
+                    result["text"] = body.decode(encoding, errors="replace")
+            else:
+                result["text"] = body.decode(encoding, errors="replace")
+        except Exception as e:
+            result.update(status="error", message=str(e))
+        result["elapsed"] = round(time.perf_counter() - started, 4)
+        return result
+
+    def fan_out(self, batch_id, specs):
+        """Starts every request at once; each result and a final summary are sent as they happen."""
+        if not specs:
+            self.send({"type": "batch_done", "batch_id": batch_id, "count": 0, "succeeded": 0,
+                       "failed": 0, "elapsed": 0.0})
+            return
+        started = time.perf_counter()
+        state = {"remaining": len(specs), "failed": 0}
+        lock = threading.Lock()
+
+        def done(result):
+            self.send(dict(result, type="response", batch_id=batch_id))
+            with lock:
+                state["remaining"] -= 1
+                state["failed"] += result["status"] != "success" or not result.get("ok")
+                finished = state["remaining"] == 0
+            if finished:
+                self.send({"type": "batch_done", "batch_id": batch_id, "count": len(specs),
+                           "succeeded": len(specs) - state["failed"], "failed": state["failed"],
+                           "elapsed": round(time.perf_counter() - started, 4)})
+
+        for index, spec in enumerate(specs):
+            spec = dict(spec)
+            spec.setdefault("id", index)
+            self.submit(spec, done)
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
 
 def run_socket_mode(port):
-    session = requests.Session() # Persistent session object
-    
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect(('localhost', port))
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
-            
-            while True:
-                line = reader.readline()
-                if not line: break
-                
-                try:
-                    data = json.loads(line)
-                    command = data.get("command")
-                    if command == "login":
-                        # Simulate login
-                        session.headers.update({'Authorization': 'Bearer FAKE_TOKEN'})
-                        response = {"status": "success", "message": "Logged in."}
-                    elif command == "get_data":
-                        # In a real app: resp = session.get(...)
-                        response = {"status": "success", "data": {"user": "test", "permissions": ["read"]}}
-                    else:
-                        raise ValueError("Unknown command")
-                except Exception as e:
-                    response = {"status": "error", "message": str(e)}
-
-                writer.write(json.dumps(response) + '\n')
-                writer.flush()
+
+            # Upstream results arrive on pool threads; one writer thread serializes them
+            output = LineWriter(writer)
+            gateway = Gateway(output.send)  # Persistent session and connection pools
+
+            try:
+                while True:
+                    line = reader.readline()
+                    if not line: break
+
+                    try:
+                        data = json.loads(line)
+                        command = data.get("command")
+                        if command == "login":
+                            token = data.get("token", "FAKE_TOKEN")
+                            gateway.session.headers.update({'Authorization': f'Bearer {token}'})
+                            response = {"status": "success", "message": "Logged in."}
+                        elif command == "configure":
+                            response = {"status": "success", "options": gateway.configure(data.get("options", {}))}
+                        elif command == "get_data":
+                            # Single request; the reply still arrives without blocking other commands
+                            spec = dict(data.get("request", {}), url=data.get("url"), id=data.get("id"))
+                            gateway.submit(spec, lambda result: output.send(dict(result, type="data")))
+                            continue
+                        elif command == "cache_stats":
+                            response = {"status": "success", "cache": gateway.cache.stats()}
+                        elif command == "clear_cache":
+                            gateway.cache.clear()
+                            response = {"status": "success", "message": "Cache cleared."}
+                        elif command == "fan_out":
+                            gateway.fan_out(data.get("batch_id"), data.get("requests", []))
+                            continue
+                        else:
+                            raise ValueError("Unknown command")
+                    except Exception as e:
+                        response = {"status": "error", "message": str(e)}
+
+                    output.send(response)
+            finally:
+                gateway.close()
+                output.close()
     except Exception as e:
         sys.stderr.write(f"API Gateway Error: {e}\n")
 
-# ... (main template)
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'socket':
+        run_socket_mode(int(sys.argv[2]))
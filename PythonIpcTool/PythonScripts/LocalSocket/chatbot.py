@@ -1,28 +1,37 @@
 ﻿# chatbot.py
-import sys, json, socket
-from textblob import TextBlob
+import os, sys, json, socket
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from nlp_service import SentimentScorer
 
-def process_data_line(json_line, writer):
+def reply_for(query, polarity):
+    # Simple rule-based chatbot + sentiment analysis
+    if "weather" in query.lower():
+        return "It's always sunny in the world of code!"
+    elif "name" in query.lower():
+        return "You can call me PyBot."
+    # Use the sentiment score for a generic response
+    if polarity > 0.5:
+        return "That's great to hear!"
+    elif polarity < -0.5:
+        return "I'm sorry to hear that."
+    return "Interesting. Tell me more."
+
+def process_data_line(json_line, writer, scorer):
     try:
         data = json.loads(json_line)
-        query = data.get("query", "")
-        
-        # Simple rule-based chatbot + sentiment analysis
-        if "weather" in query.lower():
-            response_text = "It's always sunny in the world of code!"
-        elif "name" in query.lower():
-            response_text = "You can call me PyBot."
+        if "texts" in data:
+            # Batch sentiment scoring with the lexicon this process already has loaded
+            response = {"results": scorer.analyze_many(data["texts"], int(data.get("workers", 1)))}
+        elif "queries" in data:
+            queries = [str(query) for query in data["queries"]]
+            scores = scorer.score_many(queries, int(data.get("workers", 1)))
+            response = {"responses": [reply_for(query, polarity) for query, (polarity, _) in zip(queries, scores)]}
+        elif data.get("command") == "stats":
+            response = scorer.stats()
         else:
-            # Use TextBlob for a generic sentiment response
-            sentiment = TextBlob(query).sentiment.polarity
-            if sentiment > 0.5:
-                response_text = "That's great to hear!"
-            elif sentiment < -0.5:
-                response_text = "I'm sorry to hear that."
-            else:
-                response_text = "Interesting. Tell me more."
-                
-        response = {"response": response_text}
+            query = str(data.get("query", ""))
+            response = {"response": reply_for(query, scorer.score(query)[0])}
+
         writer.write(json.dumps(response) + '\n')
         writer.flush()
 
@@ -31,6 +40,7 @@ def process_data_line(json_line, writer):
 
 # --- Standard Socket/Stdio template from here ---
 def run_socket_mode(port):
+    scorer = SentimentScorer()  # Loaded before connecting, so the first query is already fast
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect(('localhost', port))
@@ -39,9 +49,11 @@ def run_socket_mode(port):
             while True:
                 line = reader.readline()
                 if not line: break
-                process_data_line(line, writer)
+                process_data_line(line, writer, scorer)
     except Exception as e:
         sys.stderr.write(f"Socket Error: {e}\n")
+    finally:
+        scorer.close()
 
 if __name__ == "__main__":
     if len(sys.argv) == 3 and sys.argv[1] == 'socket':
@@ -1,42 +1,573 @@
 ﻿# File: PythonScripts/db_query_tool.py
-import sys, json, socket
-# import pyodbc # Uncomment for real use
+import sys, re, json, socket, time, base64, itertools, importlib, threading, queue
+from collections import OrderedDict, deque
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+
+DEFAULT_DRIVER = "sqlite3"
+DRIVER_ALIASES = {"sqlite": "sqlite3", "odbc": "pyodbc", "postgres": "psycopg2", "mysql": "pymysql"}
+POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 64  # Prepared statements kept per connection
+BATCH_SIZE = 500  # Rows per message
+CURSOR_IDLE_TIMEOUT = 300.0  # Seconds before an abandoned cursor gives its connection back
+CACHE_MAX_BYTES = 32 * 1024 * 1024  # Encoded responses kept by the result cache
+CACHE_MAX_ENTRY_BYTES = 1024 * 1024  # Larger results are never cached
+CACHE_TTL = 30.0  # Seconds; bounds staleness from writes made outside this tool
+
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")  # String literals and quoted identifiers
+_TABLE_NAME = r'([\w$.`"\[\]]+)'
+_TABLE_LIST = _TABLE_NAME[1:-1] + r'(?:\s+(?:as\s+)?\w+)?'  # name [alias]
+_READ_TABLES = re.compile(r'\b(?:from|join)\s+(' + _TABLE_LIST + r'(?:\s*,\s*' + _TABLE_LIST + r')*)')
+_WRITE_TABLES = re.compile(r'\b(?:insert\s+(?:or\s+\w+\s+)?into|replace\s+into|update(?:\s+or\s+\w+)?'
+                           r'|delete\s+from|truncate(?:\s+table)?|merge\s+into)\s+' + _TABLE_NAME)
+_WRITE_KEYWORDS = re.compile(r'\b(?:insert|update|delete|replace|merge|truncate|create|drop|alter'
+                             r'|attach|detach|pragma|vacuum|reindex|exec|execute|call)\b')
+_SCHEMA_KEYWORDS = re.compile(r'\b(?:create|drop|alter|attach|detach|vacuum|exec|execute|call)\b')
+_READ_ONLY_STATEMENTS = ("select", "values", "explain", "show", "describe", "desc ")
+_VOLATILE = re.compile(r'\b(?:random|randomblob|now|current_timestamp|current_date|current_time|changes'
+                       r'|last_insert_rowid|newid|getdate|sysdate|nextval)\b')
+
+_memory_databases = itertools.count(1)
+
+def load_driver(name):
+    """Imports any DB-API 2.0 module by name (e.g. "sqlite3", "pyodbc", "psycopg2")."""
+    name = DRIVER_ALIASES.get(name, name)
+    module = importlib.import_module(name)
+    if not hasattr(module, "connect"):
+        raise ValueError(f"'{name}' is not a DB-API driver (no connect()).")
+    return module
+
+def driver_name(data):
+    name = data.get("driver", DEFAULT_DRIVER)
+    return DRIVER_ALIASES.get(name, name)
+
+def connection_factory(data):
+    """Builds a zero-argument connect function from a "connect" command."""
+    driver = load_driver(data.get("driver", DEFAULT_DRIVER))
+    target = data.get("database", data.get("connection_string"))
+    options = dict(data.get("options", {}))
+    if driver.__name__ == "sqlite3":
+        target = target or ":memory:"
+        if target == ":memory:":
+            # Every pooled connection has to see the same in-memory database
+            target = f"file:ipc_memdb{next(_memory_databases)}?mode=memory&cache=shared"
+            options["uri"] = True
+        options.setdefault("check_same_thread", False)
+        options.setdefault("cached_statements", STATEMENT_CACHE_SIZE)
+        return lambda: driver.connect(target, **options)
+    if target is not None:
+        return lambda: driver.connect(target, **options)
+    return lambda: driver.connect(**options)
+
+def _json_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _row(row):
+    return [_json_value(value) for value in row]
+
+class PooledConnection:
+    """A connection plus its own LRU cache of cursors, keyed by SQL text.
+
+    DB-API has no explicit prepare(), but drivers reuse the prepared plan when
+    the same cursor executes the same SQL again (pyodbc, cx_Oracle, ...), and
+    sqlite3 keeps its own per-connection statement cache. Handing back the
+    cursor that last ran a given statement gets that reuse for free.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cursor(self, sql):
+        cursor = self.statements.pop(sql, None)
+        if cursor is None:
+            self.misses += 1
+            return self.conn.cursor()
+        self.hits += 1
+        return cursor
+
+    def release_cursor(self, sql, cursor):
+        """Returns a finished cursor to the cache so the next run of `sql` can reuse it."""
+        old = self.statements.pop(sql, None)
+        if old is not None and old is not cursor:
+            old.close()
+        self.statements[sql] = cursor
+        while len(self.statements) > STATEMENT_CACHE_SIZE:
+            _sql, evicted = self.statements.popitem(last=False)
+            evicted.close()
+
+    def close(self):
+        for cursor in self.statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self.statements.clear()
+        self.conn.close()
+
+class ConnectionPool:
+    """Keeps up to `size` open connections and hands them out one at a time."""
+
+    def __init__(self, connect, size=POOL_SIZE):
+        self.connect = connect
+        self.size = max(1, int(size))
+        self._idle = queue.LifoQueue()  # Most recently used first: its caches are warmest
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created >= self.size:
+                # Only open cursors hold connections, and the host has to close those
+                raise RuntimeError(f"All {self.size} pooled connections are busy; "
+                                   "fetch or close an open cursor first.")
+            self._created += 1
+        try:
+            return PooledConnection(self.connect())
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, pooled, broken=False):
+        if broken:
+            with self._lock:
+                self._created -= 1
+            try:
+                pooled.close()
+            except Exception:
+                pass
+            return
+        self._idle.put(pooled)
+
+    def stats(self):
+        idle = list(self._idle.queue)
+        return {"size": self.size, "open": self._created, "idle": len(idle),
+                "statement_hits": sum(p.hits for p in idle), "statement_misses": sum(p.misses for p in idle)}
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+class StreamingCursor:
+    """An executed query whose rows are read in batches as the host asks for them.
+
+    `read_ahead` fetches everything left and gives the connection back
+    early; later batches then come from memory.
+    """
+
+    def __init__(self, cursor_id, pool, pooled, sql, cursor):
+        self.id = cursor_id
+        self.pool = pool
+        self.pooled = pooled
+        self.sql = sql
+        self.cursor = cursor
+        self.columns = [d[0] for d in cursor.description]
+        self.rows_sent = 0
+        self.last_used = time.monotonic()
+        self.pending = None  # Rows already read from the database, after read_ahead()
+        self.done = False
+        self._released = False
+
+    def fetch(self, size):
+        self.last_used = time.monotonic()
+        if self.pending is not None:
+            rows = [self.pending.popleft() for _ in range(min(size, len(self.pending)))]
+            self.done = not self.pending
+        else:
+            rows = self.cursor.fetchmany(size)
+            if len(rows) < size:
+                self.close()
+        self.rows_sent += len(rows)
+        return [_row(row) for row in rows]
+
+    def read_ahead(self):
+        """Reads the remaining rows into memory and releases the connection (and any read lock it holds)."""
+        if self.pending is None and not self.done:
+            rows = self.cursor.fetchall()
+            self.pending = deque(rows)
+            self._release()
+
+    def close(self, broken=False):
+        self.done = True
+        self.pending = None
+        self._release(broken)
+
+    def _release(self, broken=False):
+        if self._released:
+            return
+        self._released = True
+        if broken:
+            self.pool.release(self.pooled, broken=True)
+            return
+        try:
+            self.pooled.release_cursor(self.sql, self.cursor)
+        except Exception:
+            broken = True
+        self.pool.release(self.pooled, broken=broken)
+
+def normalize_sql(sql):
+    """Returns (normalized SQL, skeleton). Outside quotes, whitespace is collapsed and
+    keywords are lowercased; the skeleton also replaces string literals with '?'."""
+    parts = _QUOTED.split(sql.strip().rstrip(';').strip())
+    normalized, skeleton = [], []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            part = re.sub(r'\s+', ' ', part).lower()
+            normalized.append(part)
+            skeleton.append(part)
+        else:
+            normalized.append(part)  # Quoted text is case- and space-sensitive
+            skeleton.append("?" if part.startswith("'") else part)
+    return "".join(normalized), "".join(skeleton)
+
+def is_write(sql):
+    """Whether a statement may change data or schema, judged by its text.
+
+    The result shape can't tell: "INSERT ... RETURNING" produces rows like a
+    query does, and still has to be committed.
+    """
+    _normalized, skeleton = normalize_sql(sql)
+    if skeleton.startswith(_READ_ONLY_STATEMENTS):
+        return False
+    if skeleton.startswith("with"):
+        return bool(_WRITE_TABLES.search(skeleton))  # A CTE in front of INSERT / UPDATE / DELETE
+    return True
+
+def _table_names(pattern, skeleton):
+    """Bare, lowercased table names (schema prefix, alias and quoting dropped)."""
+    return {item.split()[0].split('.')[-1].strip('`"[]').lower()
+            for match in pattern.findall(skeleton) for item in match.split(',')}
+
+class QueryCache:
+    """LRU cache of encoded query responses, bounded in bytes and age.
+
+    Entries are keyed on normalized SQL plus parameters and remember the
+    tables they read, so a write through this tool drops exactly the
+    results it could have changed. Writes it cannot attribute to tables
+    (DDL, procedures) clear everything; writes made by other programs are
+    only bounded by the TTL.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, max_entry_bytes=CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self.max_entry_bytes = min(int(max_entry_bytes), self.max_bytes)
+        self.entries = OrderedDict()  # key -> (line, rows, tables, expires)
+        self.tables = {}  # table -> keys of entries that read it
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def key(self, sql, params, variant):
+        """Returns (key, tables read), or None if the statement must not be cached."""
+        normalized, skeleton = normalize_sql(sql)
+        if (not skeleton.startswith(("select", "with")) or _WRITE_KEYWORDS.search(skeleton)
+                or _VOLATILE.search(skeleton)):
+            return None
+        tables = _table_names(_READ_TABLES, skeleton)
+        return (normalized, json.dumps(params, sort_keys=True, default=str), variant), tables
+
+    def get(self, key, max_rows):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] > max_rows:
+            self.misses += 1
+            return None
+        if entry[3] < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, tables, line, rows):
+        if len(line) > self.max_entry_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (line, rows, tables, time.monotonic() + self.ttl)
+        self.bytes += len(line)
+        for table in tables:
+            self.tables.setdefault(table, set()).add(key)
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, sql):
+        """Drops cached results a write statement may have changed."""
+        _normalized, skeleton = normalize_sql(sql)
+        written = _table_names(_WRITE_TABLES, skeleton)
+        if not written or _SCHEMA_KEYWORDS.search(skeleton):
+            self.invalidations += len(self.entries)
+            self.clear()
+            return
+        for table in written:
+            for key in list(self.tables.get(table, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key):
+        line, _rows, tables, _expires = self.entries.pop(key)
+        self.bytes -= len(line)
+        for table in tables:
+            keys = self.tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tables[table]
+
+    def clear(self):
+        self.entries.clear()
+        self.tables.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions, "invalidations": self.invalidations}
+
+class Database:
+    """Pool, prepared-statement reuse, open cursors and result cache for one "connect".
+
+    With `readers_block_writers` (SQLite: an unfinished SELECT holds a read
+    lock, a table lock with a shared-cache :memory: database), open cursors
+    read their remaining rows ahead before a write runs, so the write never
+    waits on a cursor the host hasn't finished.
+    """
+
+    def __init__(self, connect, pool_size=POOL_SIZE, cache=None, readers_block_writers=False):
+        self.pool = ConnectionPool(connect, pool_size)
+        self.cache = cache
+        self.readers_block_writers = readers_block_writers
+        self.cursors = {}
+        self._ids = itertools.count(1)
+        # Fail fast on a bad connection string rather than on the first query
+        self.pool.release(self.pool.acquire())
+
+    def execute(self, sql, params=None, batch_size=BATCH_SIZE):
+        """Runs one statement; SELECTs return the first batch and keep a cursor for the rest."""
+        self.reap()
+        write = not isinstance(sql, str) or is_write(sql)
+        if write and self.readers_block_writers:
+            self._read_ahead_cursors()
+        pooled = self.pool.acquire()
+        cursor = pooled.cursor(sql)
+        try:
+            if params is None:
+                cursor.execute(sql)  # pyformat drivers would otherwise %-format a literal '%' in the SQL
+            else:
+                cursor.execute(sql, params)
+        except Exception:
+            # The cursor may be in any state; the connection itself is usually fine
+            try:
+                cursor.close()
+                pooled.conn.rollback()
+            except Exception:
+                self.pool.release(pooled, broken=True)
+                raise
+            self.pool.release(pooled)
+            raise
+
+        if write or cursor.description is None:
+            # Commit straight away so other pooled connections see it; RETURNING rows come back in full
+            try:
+                returned = cursor.fetchall() if cursor.description is not None else None
+                result = {"rowcount": cursor.rowcount, "lastrowid": getattr(cursor, "lastrowid", None)}
+                if returned is not None:
+                    result.update(columns=[d[0] for d in cursor.description], rows=[_row(row) for row in returned],
+                                  done=True)
+                pooled.conn.commit()
+            except Exception:
+                try:
+                    pooled.conn.rollback()
+                except Exception:
+                    self.pool.release(pooled, broken=True)
+                    raise
+                self.pool.release(pooled)
+                raise
+            pooled.release_cursor(sql, cursor)
+            self.pool.release(pooled)
+            return result
+
+        stream = StreamingCursor(f"cursor-{next(self._ids)}", self.pool, pooled, sql, cursor)
+        try:
+            rows = stream.fetch(batch_size)
+        except Exception:
+            stream.close(broken=True)
+            raise
+        result = {"columns": stream.columns, "rows": rows, "done": stream.done}
+        if not stream.done:
+            self.cursors[stream.id] = stream
+            result["cursor_id"] = stream.id
+        return result
+
+    def fetch(self, cursor_id, batch_size=BATCH_SIZE):
+        stream = self.cursors.get(cursor_id)
+        if stream is None:
+            raise KeyError(f"Unknown or finished cursor '{cursor_id}'.")
+        try:
+            rows = stream.fetch(batch_size)
+        except Exception:
+            self.cursors.pop(cursor_id, None)
+            stream.close(broken=True)
+            raise
+        if stream.done:
+            del self.cursors[cursor_id]
+        return {"cursor_id": cursor_id, "columns": stream.columns, "rows": rows, "done": stream.done}
+
+    def close_cursor(self, cursor_id):
+        stream = self.cursors.pop(cursor_id, None)
+        if stream:
+            stream.close()
+
+    def _read_ahead_cursors(self):
+        for cursor_id, stream in list(self.cursors.items()):
+            try:
+                stream.read_ahead()
+            except Exception:
+                self.cursors.pop(cursor_id, None)
+                stream.close(broken=True)
+
+    def reap(self):
+        """Closes cursors the host forgot about so their connections go back to the pool."""
+        now = time.monotonic()
+        for cursor_id, stream in list(self.cursors.items()):
+            if now - stream.last_used > CURSOR_IDLE_TIMEOUT:
+                self.close_cursor(cursor_id)
+
+    def stats(self):
+        stats = dict(self.pool.stats(), open_cursors=len(self.cursors))
+        if self.cache:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def close(self):
+        for cursor_id in list(self.cursors):
+            self.close_cursor(cursor_id)
+        self.pool.close()
+
+def encode(message):
+    return json.dumps(message, default=str) + '\n'
+
+def format_batch(result, objects=True):
+    """Turns a batch into a response: "data" as row objects, or "columns" + "rows" arrays."""
+    message = {"status": "success", "done": result["done"]}
+    if "cursor_id" in result:
+        message["cursor_id"] = result["cursor_id"]
+    if objects:
+        message["data"] = [dict(zip(result["columns"], row)) for row in result["rows"]]
+    else:
+        message["columns"] = result["columns"]
+        message["rows"] = result["rows"]
+    return message
+
+def run_query(database, data, send):
+    """Sends a query result; with "stream" every batch is pushed as its own message."""
+    sql, params = data.get("sql"), data.get("params")
+    batch_size = max(1, int(data.get("batch_size", BATCH_SIZE)))
+    objects = data.get("format", "objects") == "objects"
+
+    cache = database.cache if data.get("cache", True) else None
+    cached = cache.key(sql, params, objects) if cache and isinstance(sql, str) else None
+    if cached:
+        line = cache.get(cached[0], batch_size)
+        if line is not None:
+            send(line)  # Already encoded: a hit skips the database and serialization
+            return
+
+    result = database.execute(sql, params, batch_size)
+    if database.cache and (not isinstance(sql, str) or is_write(sql)):
+        database.cache.invalidate(sql)  # Also for writes that return rows (RETURNING)
+    if "columns" not in result:
+        send(dict(result, status="success"))
+        return
+    line = encode(format_batch(result, objects))
+    if cached and result["done"]:
+        # Only results that fit in one batch are cached, so a hit is always a single message
+        cache.put(cached[0], cached[1], line, len(result["rows"]))
+    send(line)
+    # Without "stream" the host pulls the remaining batches itself with "fetch"
+    while data.get("stream") and not result["done"]:
+        result = database.fetch(result["cursor_id"], batch_size)
+        send(format_batch(result, objects))
 
 def run_socket_mode(port):
-    connection = None
+    database = None
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect(('localhost', port))
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
-            
+
+            def send(response):
+                writer.write(response if isinstance(response, str) else encode(response))
+                writer.flush()
+
             while True:
                 line = reader.readline()
                 if not line: break
-                
+
                 try:
                     data = json.loads(line)
                     command = data.get("command")
                     if command == "connect":
-                        # connection = pyodbc.connect(data.get("connection_string"))
-                        print("Simulating DB Connection...", file=sys.stderr)
-                        response = {"status": "success", "message": "Connected to database."}
+                        if database:
+                            database.close()
+                            database = None
+                        cache = data.get("cache", True)
+                        if cache is True or cache is None:
+                            cache = {}  # Default limits
+                        cache = QueryCache(**cache) if cache is not False else None
+                        database = Database(connection_factory(data), data.get("pool_size", POOL_SIZE), cache,
+                                            readers_block_writers=driver_name(data) == "sqlite3")
+                        send({"status": "success", "message": "Connected to database."})
+                    elif database is None:
+                        raise ConnectionError("Not connected to a database.")
                     elif command == "query":
-                        if True: # Simulating 'if connection:'
-                            # cursor = connection.cursor()
-                            # cursor.execute(data.get("sql"))
-                            # rows = cursor.fetchall() ... convert to dict
-                            print(f"Simulating query: {data.get('sql')}", file=sys.stderr)
-                            response = {"status": "success", "data": [{"id": 1, "name": "test"}]}
-                        else:
-                            raise ConnectionError("Not connected to a database.")
+                        run_query(database, data, send)
+                    elif command == "fetch":
+                        result = database.fetch(data.get("cursor_id"), max(1, int(data.get("batch_size", BATCH_SIZE))))
+                        send(format_batch(result, data.get("format", "objects") == "objects"))
+                    elif command == "close_cursor":
+                        database.close_cursor(data.get("cursor_id"))
+                        send({"status": "success", "cursor_id": data.get("cursor_id")})
+                    elif command == "clear_cache":
+                        if database.cache:
+                            database.cache.clear()
+                        send({"status": "success", "message": "Cache cleared."})
+                    elif command == "stats":
+                        send({"status": "success", "stats": database.stats()})
+                    elif command == "disconnect":
+                        database.close()
+                        database = None
+                        send({"status": "success", "message": "Disconnected."})
+                    else:
+                        raise ValueError(f"Unknown command '{command}'.")
                 except Exception as e:
-                    response = {"status": "error", "message": str(e)}
-
-                writer.write(json.dumps(response) + '\n')
-                writer.flush()
+                    send({"status": "error", "message": str(e)})
+    except Exception as e:
+        sys.stderr.write(f"DB Query Tool Error: {e}\n")
     finally:
-        if connection:
-            # connection.close()
-            print("Simulating DB disconnection.", file=sys.stderr)
-# ... (main template)
\ No newline at end of file
+        if database:
+            database.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'socket':
+        run_socket_mode(int(sys.argv[2]))
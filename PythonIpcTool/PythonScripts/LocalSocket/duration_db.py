@@ -0,0 +1,131 @@
+# duration_db.py
+# Per-test timing history for pytest_runner.py: one row per test per run with
+# the setup / call / teardown durations, kept in SQLite next to the runner's
+# other per-project state.
+import time, sqlite3, statistics
+
+HISTORY_RUNS = 50  # Rows kept per test; older ones are pruned after each run
+PHASES = ("setup", "call", "teardown")
+
+class DurationStore:
+    """Durations of every test across runs, and the queries built on them."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY, started REAL, mode TEXT, workers INTEGER, elapsed REAL);
+            CREATE TABLE IF NOT EXISTS durations (
+                nodeid TEXT, run_id INTEGER, outcome TEXT, setup REAL, call REAL, teardown REAL,
+                PRIMARY KEY (nodeid, run_id)) WITHOUT ROWID;
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def record_run(self, results, mode=None, workers=None, elapsed=None):
+        """Stores one run; `results` maps nodeid -> {"status", "phases": {phase: seconds}}."""
+        with self.conn:
+            run_id = self.conn.execute("INSERT INTO runs (started, mode, workers, elapsed) VALUES (?, ?, ?, ?)",
+                                       (time.time(), mode, workers, elapsed)).lastrowid
+            self.conn.executemany(
+                "INSERT INTO durations (nodeid, run_id, outcome, setup, call, teardown) VALUES (?, ?, ?, ?, ?, ?)",
+                [(nodeid, run_id, result.get("status"), *(result.get("phases", {}).get(p) for p in PHASES))
+                 for nodeid, result in results.items()])
+            self.conn.execute("""
+                DELETE FROM durations WHERE (nodeid, run_id) IN (
+                    SELECT nodeid, run_id FROM (
+                        SELECT nodeid, run_id, ROW_NUMBER() OVER (PARTITION BY nodeid ORDER BY run_id DESC) AS age
+                        FROM durations) WHERE age > ?)""", (HISTORY_RUNS,))
+        return run_id
+
+    def _history(self, window):
+        """{nodeid: [(run_id, outcome, setup, call, teardown), ...]} newest first, up to `window` each."""
+        rows = self.conn.execute("""
+            SELECT nodeid, run_id, outcome, setup, call, teardown FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY nodeid ORDER BY run_id DESC) AS age FROM durations)
+            WHERE age <= ? ORDER BY nodeid, run_id DESC""", (int(window),))
+        history = {}
+        for nodeid, *row in rows:
+            history.setdefault(nodeid, []).append(tuple(row))
+        return history
+
+    @staticmethod
+    def _phase_value(row, phase):
+        setup, call, teardown = row[2:5]
+        if phase == "total":
+            present = [v for v in (setup, call, teardown) if v is not None]
+            return round(sum(present), 4) if present else None
+        return {"setup": setup, "call": call, "teardown": teardown}[phase]
+
+    def _medians(self, rows):
+        summary = {}
+        for phase in PHASES + ("total",):
+            values = [v for v in (self._phase_value(row, phase) for row in rows) if v is not None]
+            summary[phase] = round(statistics.median(values), 4) if values else None
+        return summary
+
+    def expected(self, window=10):
+        """Median total seconds per test over its recent runs; used to pack the longest work first."""
+        expected = {}
+        for nodeid, rows in self._history(window).items():
+            total = self._medians(rows)["total"]
+            if total is not None:
+                expected[nodeid] = total
+        return expected
+
+    def slowest(self, limit=20, phase="total", window=10, prefix=None):
+        """Tests ranked by median duration of `phase`, with every phase's median alongside."""
+        if phase not in PHASES + ("total",):
+            raise ValueError(f"Unknown phase '{phase}'.")
+        ranked = []
+        for nodeid, rows in self._history(window).items():
+            if prefix and not nodeid.startswith(prefix):
+                continue
+            medians = self._medians(rows)
+            if medians[phase] is not None:
+                ranked.append({"name": nodeid, "median": medians, "last": {
+                    p: self._phase_value(rows[0], p) for p in PHASES + ("total",)}, "runs": len(rows)})
+        ranked.sort(key=lambda entry: -entry["median"][phase])
+        return ranked[:int(limit)]
+
+    def regressions(self, window=10, threshold=1.5, min_seconds=0.05, phase="total"):
+        """Tests whose latest duration exceeds `threshold` times the median of the runs before it."""
+        found = []
+        for nodeid, rows in self._history(window + 1).items():
+            latest, previous = rows[0], rows[1:]
+            current = self._phase_value(latest, phase)
+            baseline = [v for v in (self._phase_value(row, phase) for row in previous) if v is not None]
+            if current is None or len(baseline) < 3:
+                continue  # Too little history to call anything a regression
+            median = statistics.median(baseline)
+            if current >= min_seconds and current > threshold * max(median, 1e-6):
+                found.append({"name": nodeid, "latest": round(current, 4), "median": round(median, 4),
+                              "ratio": round(current / max(median, 1e-6), 2), "run_id": latest[0],
+                              "outcome": latest[1], "baseline_runs": len(baseline)})
+        found.sort(key=lambda entry: -(entry["latest"] - entry["median"]))
+        return found
+
+    def phase_totals(self, window=10):
+        """Median seconds the suite spends in each phase, summed over tests, plus the worst offenders."""
+        totals = {phase: 0.0 for phase in PHASES}
+        heaviest = {phase: (0.0, None) for phase in PHASES}
+        for nodeid, rows in self._history(window).items():
+            medians = self._medians(rows)
+            for phase in PHASES:
+                value = medians[phase] or 0.0
+                totals[phase] += value
+                if value > heaviest[phase][0]:
+                    heaviest[phase] = (value, nodeid)
+        return {phase: {"seconds": round(totals[phase], 4), "slowest": heaviest[phase][1],
+                        "slowest_seconds": round(heaviest[phase][0], 4)} for phase in PHASES}
+
+    def history(self, nodeid, limit=HISTORY_RUNS):
+        rows = self.conn.execute("""
+            SELECT d.run_id, r.started, d.outcome, d.setup, d.call, d.teardown FROM durations d
+            JOIN runs r ON r.id = d.run_id WHERE d.nodeid = ? ORDER BY d.run_id DESC LIMIT ?""",
+                                 (nodeid, int(limit)))
+        return [{"run_id": run_id, "started": started, "outcome": outcome,
+                 "setup": setup, "call": call, "teardown": teardown}
+                for run_id, started, outcome, setup, call, teardown in rows]
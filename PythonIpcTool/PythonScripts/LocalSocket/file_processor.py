@@ -1,29 +1,114 @@
 ﻿# file_processor.py
-import sys, json, socket, time
+import sys, json, socket, time, os, mmap
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from job_control import JobManager, JobCancelled, locked_sender
 
-def process_large_file(writer, file_path):
+SHARD_SIZE = 8 * 1024 * 1024  # Bytes per shard handed to one worker process
+PROGRESS_INTERVAL = 0.25  # Never send progress more often than this (seconds)
+MIN_PROGRESS_INTERVAL = 0.05  # Floor for the "progress_interval" option; it is also the wait timeout
+# Maps bytes.split()'s whitespace to b' ' and everything else to b'x', so words can be counted in C
+WORD_TABLE = bytes(ord(' ') if i in b' \t\n\r\x0b\x0c' else ord('x') for i in range(256))
+
+def split_shards(path, shard_size=SHARD_SIZE):
+    """Returns (start, end) byte ranges that each begin and end on a line boundary."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    shards = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            newline = mm.find(b'\n', min(start + shard_size, size) - 1)
+            end = size if newline == -1 else newline + 1
+            shards.append((start, end))
+            start = end
+    return shards
+
+def count_words(block):
+    """len(block.split()) without building a list of every word: counts word starts instead."""
+    mask = block.translate(WORD_TABLE)
+    return mask.count(b' x') + mask.startswith(b'x')
+
+def process_shard(path, start, end, pattern):
+    """Runs in a worker process: scans one byte range of the memory-mapped file."""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        block = mm[start:end]
+    lines = block.count(b'\n')
+    if block and not block.endswith(b'\n'):
+        lines += 1  # Last line of the file without a trailing newline
+    summary = {
+        "lines_processed": lines,
+        "words": count_words(block),
+        "bytes": end - start,
+    }
+    if pattern:
+        summary["matches"] = block.count(pattern.encode('utf-8'))
+    return summary
+
+def _merge(total, part):
+    for key, value in part.items():
+        total[key] = total.get(key, 0) + value
+
+def process_large_file(job, file_path, options):
     try:
-        # In a real app, you would open the file_path.
-        # Here we simulate a large file with 100 lines.
-        total_lines = 100
-        for i in range(total_lines):
-            time.sleep(0.1) # Simulate work on each line
-            
-            # Send progress update every 10 lines
-            if (i + 1) % 10 == 0:
-                percent = ((i + 1) / total_lines) * 100
-                progress_update = {"type": "progress", "percent": round(percent, 2)}
-                writer.write(json.dumps(progress_update) + '\n')
-                writer.flush()
-        
-        final_result = {"type": "result", "summary": {"lines_processed": total_lines}}
-        writer.write(json.dumps(final_result) + '\n')
-        writer.flush()
+        if not file_path:
+            raise ValueError("Missing 'path' in command.")
+        shards = split_shards(file_path, int(options.get("shard_size", SHARD_SIZE)))
+        total_bytes = sum(end - start for start, end in shards)
+        workers = int(options.get("workers", os.cpu_count() or 1))
+        pattern = options.get("pattern")
+        interval = max(float(options.get("progress_interval", PROGRESS_INTERVAL)), MIN_PROGRESS_INTERVAL)
+
+        summary = {"lines_processed": 0, "words": 0, "bytes": 0}
+        started = time.monotonic()
+        last_report = 0.0
+        pending = iter(shards)
+        running = set()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Keep a bounded number of shards queued so cancelling stops work quickly
+            while True:
+                while not job.cancelled and len(running) < workers * 2:
+                    job.checkpoint()  # Blocks here while paused, so no new shards start
+                    shard = next(pending, None)
+                    if shard is None:
+                        break
+                    running.add(pool.submit(process_shard, file_path, shard[0], shard[1], pattern))
+                if not running:
+                    break
 
+                if job.cancelled:
+                    for future in running:
+                        future.cancel()  # Drop queued shards; ones already running just finish
+                finished, running = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if not future.cancelled():
+                        _merge(summary, future.result())
+
+                now = time.monotonic()
+                if now - last_report >= interval and not job.cancelled:
+                    elapsed = max(now - started, 1e-9)
+                    rate = summary["bytes"] / elapsed
+                    remaining = total_bytes - summary["bytes"]
+                    progress = {
+                        "percent": round(100.0 * summary["bytes"] / total_bytes, 2) if total_bytes else 100.0,
+                        "bytes_processed": summary["bytes"],
+                        "bytes_per_sec": round(rate),
+                        "eta_seconds": round(remaining / rate, 1) if rate else None
+                    }
+                    job.update(**progress)
+                    job.send(dict(progress, type="progress"))
+                    last_report = now
+
+        summary["elapsed"] = round(time.monotonic() - started, 3)
+        if job.cancelled:
+            job.send({"type": "cancelled", "summary": summary})
+        else:
+            job.send({"type": "result", "summary": summary})
+
+    except JobCancelled:
+        raise
     except Exception as e:
-        error_result = {"type": "error", "message": str(e)}
-        writer.write(json.dumps(error_result) + '\n')
-        writer.flush()
+        job.send({"type": "error", "message": str(e)})
 
 def run_socket_mode(port):
     try:
@@ -31,18 +116,33 @@ def run_socket_mode(port):
             s.connect(('localhost', port))
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
-            
-            line = reader.readline()
-            if not line: return
-
-            data = json.loads(line)
-            if data.get("command") == "process_file":
-                process_large_file(writer, data.get("path"))
-                
+            send = locked_sender(writer)
+            jobs = JobManager(send)
+
+            # Processing runs as a job so cancel/pause/resume/status can arrive mid-file
+            try:
+                while True:
+                    line = reader.readline()
+                    if not line: break
+
+                    try:
+                        data = json.loads(line)
+                        if not isinstance(data, dict):
+                            raise ValueError("Expected a JSON object.")
+                        if jobs.handle(data):
+                            continue
+                        if data.get("command") == "process_file":
+                            jobs.start("process_file", process_large_file, data.get("path"), data,
+                                       job_id=data.get("job_id"))
+                    except Exception as e:  # One bad line must not end the jobs already running
+                        send({"type": "error", "message": str(e)})
+            finally:
+                jobs.shutdown()
+
     except Exception as e:
         sys.stderr.write(f"File Processor Error: {e}\n")
         sys.stderr.flush()
 
 if __name__ == "__main__":
     if len(sys.argv) == 3 and sys.argv[1] == 'socket':
-        run_socket_mode(int(sys.argv[2]))
\ No newline at end of file
+        run_socket_mode(int(sys.argv[2]))
@@ -1,5 +1,111 @@
-﻿# File: PythonScripts/game_ai.py
+﻿# File: PythonScripts/game_ai_2.py
 import sys, json, socket
+import numpy as np
+from state_stream import encoder_from_settings, frame_message
+
+_CELL_OFFSET = 1 << 20  # Cell coordinates are clipped to +/- this before packing into one int64 key
+_MAX_RING = 4  # Rings of cells searched before falling back to brute force
+_BRUTE_FORCE_BLOCK = 1 << 22  # Max agent*target distances evaluated at once in the fallback
+
+class TargetGrid:
+    """Uniform-grid spatial index over target positions for exact nearest-target queries.
+
+    Queries scan cells in growing rings around each agent, so most agents only
+    touch a handful of cells. Agents still unresolved after a few rings (e.g.
+    far outside the targets' extent) fall back to a blocked brute-force search,
+    so results are always exact.
+    """
+
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(self.points) == 0:
+            raise ValueError("At least one target position is required.")
+        self.origin = self.points.min(axis=0)
+        if not cell_size:
+            # Aim for roughly one target per occupied cell
+            extent = float(np.ptp(self.points, axis=0).max())
+            cell_size = extent / max(1.0, np.sqrt(len(self.points)))
+        self.cell_size = max(float(cell_size), 1e-6)
+
+        keys = self._keys(self._cells(self.points))
+        self.order = np.argsort(keys, kind='stable')
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(
+            keys[self.order], return_index=True, return_counts=True)
+
+    def _cells(self, positions):
+        cells = np.floor((positions - self.origin) / self.cell_size)
+        return np.clip(cells, -_CELL_OFFSET, _CELL_OFFSET - 2).astype(np.int64)
+
+    @staticmethod
+    def _keys(cells):
+        return (cells[:, 0] + _CELL_OFFSET) * (2 * _CELL_OFFSET) + (cells[:, 1] + _CELL_OFFSET)
+
+    def nearest(self, agents):
+        """Returns (target_indices, distances) for each row of `agents`."""
+        agents = np.asarray(agents, dtype=np.float64).reshape(-1, 2)
+        best_d2 = np.full(len(agents), np.inf)
+        best_index = np.full(len(agents), -1, dtype=np.int64)
+        agent_cells = self._cells(agents)
+
+        # Search outward ring by ring. Once every cell within Chebyshev radius r
+        # has been scanned, any hit closer than r cells is the true nearest.
+        pending = np.arange(len(agents))
+        for radius in range(_MAX_RING + 1):
+            for dx, dy in _ring_offsets(radius):
+                self._scan(agents, agent_cells, pending, dx, dy, best_d2, best_index)
+            pending = pending[best_d2[pending] > (radius * self.cell_size) ** 2]
+            if not pending.size:
+                break
+
+        if pending.size:
+            block = max(1, _BRUTE_FORCE_BLOCK // len(self.points))
+            for start in range(0, pending.size, block):
+                rows = pending[start:start + block]
+                d2 = ((agents[rows, None, :] - self.points[None, :, :]) ** 2).sum(axis=2)
+                best_index[rows] = d2.argmin(axis=1)
+                best_d2[rows] = d2[np.arange(len(rows)), best_index[rows]]
+
+        return best_index, np.sqrt(best_d2)
+
+    def _scan(self, agents, agent_cells, pending, dx, dy, best_d2, best_index):
+        keys = self._keys(agent_cells[pending] + (dx, dy))
+        slots = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        hit = self.cell_keys[slots] == keys
+        if not hit.any():
+            return
+
+        # Expand every (agent, occupied cell) pair into (agent, target) candidates
+        agent_ids = pending[hit]
+        starts = self.cell_starts[slots[hit]]
+        counts = self.cell_counts[slots[hit]]
+        owner = np.repeat(agent_ids, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = self.order[np.repeat(starts, counts) + offsets]
+        d2 = ((self.points[candidates] - agents[owner]) ** 2).sum(axis=1)
+
+        # Keep the closest candidate per agent from this cell
+        ranked = np.lexsort((d2, owner))
+        owners, first = np.unique(owner[ranked], return_index=True)
+        cell_best = ranked[first]
+        better = d2[cell_best] < best_d2[owners]
+        best_d2[owners[better]] = d2[cell_best[better]]
+        best_index[owners[better]] = candidates[cell_best[better]]
+
+def _ring_offsets(radius):
+    if radius == 0:
+        return [(0, 0)]
+    return [(dx, dy) for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)
+            if max(abs(dx), abs(dy)) == radius]
+
+def decide_batch(agents, targets, cell_size=None):
+    """Moves every agent one unit step towards its nearest target, all at once."""
+    agents = np.asarray(agents, dtype=np.float64).reshape(-1, 2)
+    grid = TargetGrid(targets, cell_size)
+    target_index, distance = grid.nearest(agents)
+    delta = grid.points[target_index] - agents
+    # Same normalization as the single-agent tick: never scale up short moves
+    delta /= np.maximum(1.0, distance)[:, None]
+    return target_index, delta
 
 def run_socket_mode(port):
     try:
@@ -7,6 +113,8 @@ def run_socket_mode(port):
             s.connect(('localhost', port))
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
+            encoder = None # Set by "set_stream" to send binary action frames instead of JSON
+            tick = 0
             
             while True:
                 line = reader.readline()
@@ -26,9 +134,32 @@ def run_socket_mode(port):
                         # Normalize direction (simplified)
                         length = max(1, (dx**2 + dy**2)**0.5)
                         
-                        action = {"action": "move_by", "delta": [dx/length, dy/length]}
-                        writer.write(json.dumps(action) + '\n')
+                        if encoder:
+                            frame = encoder.encode(data.get("tick", tick), [[dx/length, dy/length]])
+                            writer.write(frame_message(frame, "actions_frame"))
+                        else:
+                            action = {"action": "move_by", "delta": [dx/length, dy/length]}
+                            writer.write(json.dumps(action) + '\n')
+                        writer.flush()
+                        tick += 1
+                    elif data.get("event") == "game_tick_batch":
+                        target_index, delta = decide_batch(
+                            data.get("agents", []), data.get("targets", []), data.get("cell_size"))
+                        if encoder:
+                            frame = encoder.encode(data.get("tick", tick), delta)
+                            writer.write(frame_message(frame, "actions_frame"))
+                        else:
+                            action = {
+                                "action": "move_batch",
+                                "tick": data.get("tick", tick),
+                                "deltas": np.round(delta, 4).tolist(),
+                                "targets": target_index.tolist()
+                            }
+                            writer.write(json.dumps(action) + '\n')
                         writer.flush()
+                        tick += 1
+                    elif data.get("command") == "set_stream":
+                        encoder = encoder_from_settings(data)
                 except Exception as e:
                     # In a game, we might just log to stderr and continue
                     sys.stderr.write(f"AI Tick Error: {e}\n")
@@ -36,4 +167,6 @@ def run_socket_mode(port):
     except Exception as e:
         sys.stderr.write(f"Game AI Connection Error: {e}\n")
 
-# ... (main template)
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'socket':
+        run_socket_mode(int(sys.argv[2]))
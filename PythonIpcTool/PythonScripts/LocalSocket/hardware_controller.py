@@ -1,26 +1,24 @@
 ﻿# hardware_controller.py
-import sys, json, socket, time, random
+import sys, json, socket, random
+from line_writer import LineWriter
+from sensor_sampler import SensorSampler
+from sensor_history import SensorHistory
 
-def run_controller(reader, writer):
-    # --- Simulate Sensor Reading Thread ---
-    # In a real app, this would be in a separate thread.
-    import threading
-    
-    stop_event = threading.Event()
+FLUSH_BYTES = 64 * 1024
+FLUSH_INTERVAL = 0.05  # Seconds
 
-    def sensor_loop():
-        while not stop_event.is_set():
-            try:
-                temp = 25 + random.uniform(-1, 1)
-                sensor_data = {"type": "sensor_update", "temperature": round(temp, 2)}
-                writer.write(json.dumps(sensor_data) + '\n')
-                writer.flush()
-                time.sleep(2)
-            except:
-                break
-    
-    sensor_thread = threading.Thread(target=sensor_loop)
-    sensor_thread.start()
+def read_temperature():
+    temp = 25 + random.uniform(-1, 1)
+    return {"temperature": round(temp, 2)}
+
+def run_controller(reader, writer):
+    # Sensor readings and command replies share the connection; one writer
+    # thread serializes them and coalesces flushes
+    output = LineWriter(writer, flush_bytes=FLUSH_BYTES, flush_interval=FLUSH_INTERVAL)
+    history = SensorHistory(("temperature",), rate_hz=lambda: sampler.rate_hz)
+    sampler = SensorSampler(read_temperature, output.send, "sensor_update", "sensor_batch", rate_hz=0.5,
+                            observe=history.record)
+    sampler.start()
 
     # --- Main Command Loop ---
     try:
@@ -30,6 +28,8 @@ def run_controller(reader, writer):
                 break
             
             data = json.loads(line)
+            if history.handle(data, output.send):
+                continue
             command = data.get("command")
             
             if command == "set_led":
@@ -37,12 +37,18 @@ def run_controller(reader, writer):
                 # In a real app: GPIO.output(LED_PIN, state == "on")
                 print(f"[Hardware Sim] LED is now {state}", file=sys.stderr)
                 response = {"status": "success", "led_state": state}
-                writer.write(json.dumps(response) + '\n')
-                writer.flush()
+                output.send(response)
+            elif command == "set_sampling":
+                try:
+                    sampler.configure(rate_hz=data.get("hz"), batch=data.get("batch"),
+                                      max_latency=data.get("max_latency"))
+                    output.send(dict(sampler.describe(), status="success"))
+                except (TypeError, ValueError) as e:
+                    output.send({"status": "error", "message": str(e)})
     
     finally:
-        stop_event.set()
-        sensor_thread.join()
+        sampler.stop()
+        output.close()
 
 def run_socket_server(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
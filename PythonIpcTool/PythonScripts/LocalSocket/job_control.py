@@ -0,0 +1,171 @@
+﻿# job_control.py
+# Shared job control for long-running socket scripts: every job gets an id and
+# can be cancelled, paused, resumed or queried while it runs, without killing
+# (and later re-warming) the Python worker process.
+import sys, json, time, threading, itertools
+
+MAX_FINISHED_JOBS = 100  # Finished jobs kept around so "status" can still report them
+
+class JobCancelled(Exception):
+    """Raised inside a job at its next checkpoint after a cancel request."""
+
+def locked_sender(writer):
+    """Returns a thread-safe send(message) that writes one JSON line and flushes."""
+    lock = threading.Lock()
+    def send(message):
+        with lock:
+            writer.write(json.dumps(message) + '\n')
+            writer.flush()
+    return send
+
+class Job:
+    """Handle passed to a job's target function.
+
+    Targets call `checkpoint()` (or `sleep()`) between units of work; that is
+    where pause blocks and cancel raises JobCancelled, so a job only ever stops
+    at a point where its own cleanup (`with`/`finally`) still runs.
+    """
+
+    def __init__(self, job_id, name, send):
+        self.id = job_id
+        self.name = name
+        self.state = "running"
+        self.progress = {}
+        self.started = time.monotonic()
+        self.finished = None
+        self._send = send
+        self._cancel = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self.thread = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def checkpoint(self):
+        while not self._running.wait(0.1):
+            if self._cancel.is_set():
+                break
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def sleep(self, seconds):
+        """Waits like time.sleep, but wakes up immediately on cancel."""
+        self.checkpoint()
+        if self._cancel.wait(seconds):
+            raise JobCancelled()
+        self.checkpoint()
+
+    def send(self, message):
+        self._send(dict(message, job_id=self.id))
+
+    def update(self, **progress):
+        """Records the latest progress so "status" can answer without asking the job."""
+        self.progress.update(progress)
+
+    def cancel(self):
+        self._cancel.set()
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+        if self.finished is None:
+            self.state = "paused"
+
+    def resume(self):
+        self._running.set()
+        if self.finished is None:
+            self.state = "running"
+
+    def describe(self):
+        end = self.finished or time.monotonic()
+        return {"job_id": self.id, "name": self.name, "state": self.state,
+                "elapsed": round(end - self.started, 3), "progress": self.progress}
+
+class JobManager:
+    """Starts jobs on threads and answers cancel/pause/resume/status commands."""
+
+    def __init__(self, send):
+        self.send = send
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def start(self, name, target, *args, job_id=None):
+        """Runs target(job, *args) on a new thread and returns the Job (None if the id is taken)."""
+        with self._lock:
+            job_id = str(job_id or f"{name}-{next(self._ids)}")
+            existing = self.jobs.get(job_id)
+            if existing and existing.finished is None:
+                self.send({"type": "error", "job_id": job_id, "message": f"Job '{job_id}' is already running."})
+                return None
+            job = Job(job_id, name, self.send)
+            self.jobs[job_id] = job
+            self._trim()
+        job.thread = threading.Thread(target=self._run, args=(job, target, args), daemon=True)
+        job.send({"type": "job_started", "name": name})
+        job.thread.start()
+        return job
+
+    def _run(self, job, target, args):
+        try:
+            target(job, *args)
+            job.state = "cancelled" if job.cancelled else "completed"
+        except JobCancelled:
+            job.state = "cancelled"
+            job.send({"type": "cancelled", "message": f"Job '{job.id}' was cancelled."})
+        except (BrokenPipeError, ConnectionResetError):
+            job.state = "failed"
+        except Exception as e:
+            job.state = "failed"
+            sys.stderr.write(f"Job {job.id} Error: {e}\n")
+            try:
+                job.send({"type": "error", "message": str(e)})
+            except OSError:
+                pass
+        finally:
+            job.finished = time.monotonic()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _select(self, data):
+        job_id = data.get("job_id")
+        if job_id is not None:
+            job = self.jobs.get(str(job_id))
+            if job is None:
+                raise KeyError(f"Unknown job '{job_id}'.")
+            return [job]
+        # Without an id, status covers every known job and the others every unfinished one
+        if data.get("command") == "status":
+            return list(self.jobs.values())
+        return [job for job in self.jobs.values() if job.finished is None]
+
+    def handle(self, data):
+        """Handles a job-control command; returns False if `data` isn't one."""
+        command = data.get("command")
+        if command not in ("cancel", "pause", "resume", "status"):
+            return False
+        try:
+            jobs = self._select(data)
+            if command == "status":
+                self.send({"type": "status", "jobs": [job.describe() for job in jobs]})
+                return True
+            for job in jobs:
+                getattr(job, command)()
+            self.send({"type": "ack", "command": command, "job_ids": [job.id for job in jobs]})
+        except KeyError as e:
+            self.send({"type": "error", "message": str(e.args[0])})
+        return True
+
+    def shutdown(self, timeout=5.0):
+        """Cancels every job and waits for their threads to release resources."""
+        jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel()
+        for job in jobs:
+            if job.thread and job.thread.is_alive():
+                job.thread.join(timeout)
@@ -0,0 +1,71 @@
+﻿# line_writer.py
+# Single-writer output for scripts where several threads produce messages.
+import sys, json, time, queue, threading
+
+_CLOSE = object()
+
+class LineWriter:
+    """Serializes JSON-line messages from any thread through one writer thread.
+
+    Producers only append to a queue, so they never contend for the socket or
+    interleave partial lines. The writer thread drains everything that is
+    queued, writes it, and flushes once the queue runs dry. Under sustained
+    load the queue may never run dry, so `flush_bytes` / `flush_interval`
+    additionally force a flush once that much output (or time) has built up.
+    """
+
+    def __init__(self, writer, flush_bytes=None, flush_interval=None):
+        self.writer = writer
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.closed = False
+        self.messages = 0
+        self.flushes = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, message):
+        if not self.closed:
+            self._queue.put(message)
+
+    def close(self):
+        """Writes everything already queued, then stops the writer thread."""
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def stats(self):
+        return {"messages": self.messages, "flushes": self.flushes}
+
+    def _flush(self):
+        self.writer.flush()
+        self.flushes += 1
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                pending = 0
+                since = time.monotonic()
+                while item is not _CLOSE:
+                    line = json.dumps(item) + '\n'
+                    self.writer.write(line)
+                    self.messages += 1
+                    pending += len(line)  # ensure_ascii output, so characters == bytes
+                    if ((self.flush_bytes and pending >= self.flush_bytes) or
+                            (self.flush_interval and time.monotonic() - since >= self.flush_interval)):
+                        self._flush()
+                        pending = 0
+                        since = time.monotonic()
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if pending:
+                    self._flush()
+                if item is _CLOSE:
+                    break
+        except (BrokenPipeError, ConnectionResetError, OSError) as e:
+            print(f"Writer stopped: {e}", file=sys.stderr)
+        finally:
+            self.closed = True
@@ -0,0 +1,293 @@
+﻿# metric_store.py
+# Append-only, columnar on-disk store for training metrics.
+#
+# Layout, one directory per run:
+#   meta.json                 {"metrics": [...], "fanout": F, "levels": L}
+#   step.i8, time.f8          raw columns, one fixed-width value per row
+#   <metric>.f4               raw metric column
+#   <metric>.L<k>.min.f4      level-k summaries: one entry per F**k raw rows
+#   <metric>.L<k>.max.f4
+#   <metric>.L<k>.sum.f8
+#
+# Queries binary-search the step column, then read whole output buckets from
+# the coarsest summary level that still resolves them, touching raw rows only
+# for the partial buckets at the two edges of the range. Reading ~1000 points
+# out of tens of millions of rows therefore costs a few thousand values read.
+import os, json, time, uuid, threading
+import numpy as np
+
+DEFAULT_ROOT = os.environ.get(
+    "PYTHON_IPC_METRIC_STORE", os.path.join(os.path.expanduser("~"), ".python_ipc_tool", "metrics"))
+FANOUT = 16
+LEVELS = 6  # Coarsest level summarises 16**6 (~16.7M) rows per entry
+FLUSH_ROWS = 4096
+FLUSH_INTERVAL = 1.0  # Seconds; bounds how stale a concurrent query can be
+
+def _safe_name(name):
+    name = str(name)
+    if not name or name in (".", "..") or any(c in name for c in '/\\:*?"<>|'):
+        raise ValueError(f"Invalid run or metric name '{name}'.")
+    return name
+
+def _read_column(path, dtype, count=None):
+    """Memory-maps a column file (read-only); empty files give an empty array."""
+    itemsize = np.dtype(dtype).itemsize
+    available = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+    count = available if count is None else min(count, available)
+    if count <= 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+def _summarize(mins, maxs, sums, size):
+    """Folds runs of `size` consecutive (min, max, sum) entries into one entry each."""
+    return (np.fmin.reduce(mins.reshape(-1, size), axis=1),
+            np.fmax.reduce(maxs.reshape(-1, size), axis=1),
+            sums.reshape(-1, size).sum(axis=1))
+
+class RunWriter:
+    """Appends rows for one run and keeps its summary levels up to date."""
+
+    def __init__(self, directory, metrics):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        else:
+            meta = {"metrics": [_safe_name(m) for m in metrics], "fanout": FANOUT, "levels": LEVELS}
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        self.metrics = meta["metrics"]
+        self.fanout = meta["fanout"]
+        self.levels = meta["levels"]
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._recover()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _recover(self):
+        """Makes the files consistent after a crash and reloads partial-bucket state."""
+        columns = [("step.i8", 8), ("time.f8", 8)] + [(f"{m}.f4", 4) for m in self.metrics]
+        sizes = [os.path.getsize(self._path(name)) // width if os.path.exists(self._path(name)) else 0
+                 for name, width in columns]
+        self.rows = min(sizes)
+        for (name, width), size in zip(columns, sizes):
+            if size != self.rows:
+                with open(self._path(name), 'r+b') as f:
+                    f.truncate(self.rows * width)
+        steps = _read_column(self._path("step.i8"), np.int64, self.rows)
+        self.last_step = int(steps[-1]) if self.rows else None
+
+        # pending[m][k] holds level-k (min, max, sum) entries not yet folded into level k+1;
+        # only those tails are read back, so reopening a long run stays cheap
+        self._pending = {}
+        for metric in self.metrics:
+            pending = []
+            for level in range(1, self.levels + 1):
+                lower = self._level(metric, level - 1)
+                expected = self.rows // self.fanout ** level
+                if any(len(c) != expected for c in self._level(metric, level)):
+                    # Summaries are derived data: rebuild this level from the one below
+                    complete = expected * self.fanout
+                    rebuilt = _summarize(*(np.asarray(a[:complete], dtype=np.float64) for a in lower), self.fanout)
+                    for part, values, dtype in zip(("min.f4", "max.f4", "sum.f8"), rebuilt,
+                                                   (np.float32, np.float32, np.float64)):
+                        values.astype(dtype).tofile(self._path(f"{metric}.L{level}.{part}"))
+                pending.append(tuple(np.asarray(a[expected * self.fanout:], dtype=np.float64) for a in lower))
+            self._pending[metric] = pending
+
+    def _level(self, metric, level):
+        """Returns (min, max, sum) views of one summary level; level 0 is the raw column."""
+        if level == 0:
+            raw = _read_column(self._path(f"{metric}.f4"), np.float32, self.rows)
+            return raw, raw, raw
+        return tuple(_read_column(self._path(f"{metric}.L{level}.{part}"), dtype)
+                     for part, dtype in (("min.f4", np.float32), ("max.f4", np.float32), ("sum.f8", np.float64)))
+
+    def append(self, step, metrics, timestamp=None):
+        """Buffers one row. Steps must increase; missing metrics are stored as NaN."""
+        step = int(step)
+        if self.last_step is not None and step <= self.last_step:
+            raise ValueError(f"Step {step} is not after the last stored step {self.last_step}.")
+        self.last_step = step
+        row = [step, time.time() if timestamp is None else timestamp]
+        row.extend(metrics.get(m, np.nan) for m in self.metrics)
+        self._buffer.append(row)
+        if len(self._buffer) >= FLUSH_ROWS or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            block = np.array(self._buffer, dtype=np.float64)
+            self._buffer = []
+            # Raw columns first; the summaries only ever describe rows already on disk
+            self._append_file("step.i8", block[:, 0].astype(np.int64))
+            self._append_file("time.f8", block[:, 1])
+            for i, metric in enumerate(self.metrics):
+                self._append_file(f"{metric}.f4", block[:, 2 + i].astype(np.float32))
+            self.rows += len(block)
+            for i, metric in enumerate(self.metrics):
+                values = block[:, 2 + i]
+                self._fold(metric, (values, values, values))
+
+    def _fold(self, metric, new_entries):
+        pending = self._pending[metric]
+        for level in range(1, self.levels + 1):
+            merged = tuple(np.concatenate([p, n]) for p, n in zip(pending[level - 1], new_entries))
+            complete = len(merged[0]) // self.fanout * self.fanout
+            pending[level - 1] = tuple(a[complete:] for a in merged)
+            if not complete:
+                return
+            new_entries = _summarize(*(a[:complete] for a in merged), self.fanout)
+            self._append_file(f"{metric}.L{level}.min.f4", new_entries[0].astype(np.float32))
+            self._append_file(f"{metric}.L{level}.max.f4", new_entries[1].astype(np.float32))
+            self._append_file(f"{metric}.L{level}.sum.f8", new_entries[2])
+
+    def _append_file(self, name, values):
+        with open(self._path(name), 'ab') as f:
+            values.tofile(f)
+
+    def close(self):
+        self.flush()
+
+class MetricStore:
+    """Directory of runs; hands out writers and answers range queries."""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def _run_dir(self, run_id):
+        return os.path.join(self.root, _safe_name(run_id))
+
+    def writer(self, run_id, metrics):
+        with self._lock:
+            run_id = str(run_id)
+            if run_id not in self._writers:
+                self._writers[run_id] = RunWriter(self._run_dir(run_id), metrics)
+            return self._writers[run_id]
+
+    def new_run_id(self, prefix="run"):
+        """A run id no stored run has, e.g. "training-20240101-120000-3f2a9c"; sorts by start time."""
+        return f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    def close_writer(self, run_id):
+        with self._lock:
+            writer = self._writers.pop(str(run_id), None)
+        if writer:
+            writer.close()
+
+    def runs(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(os.path.join(self.root, name, "meta.json")))
+
+    def _meta(self, directory):
+        with open(os.path.join(directory, "meta.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def info(self, run_id):
+        directory = self._run_dir(run_id)
+        meta = self._meta(directory)
+        steps = _read_column(os.path.join(directory, "step.i8"), np.int64)
+        return {"run_id": str(run_id), "metrics": meta["metrics"], "rows": len(steps),
+                "first_step": int(steps[0]) if len(steps) else None,
+                "last_step": int(steps[-1]) if len(steps) else None}
+
+    def query(self, run_id, metric, step_from=None, step_to=None, points=1000):
+        """Returns ~`points` buckets (first step, min, max, mean) covering [step_from, step_to]."""
+        directory = self._run_dir(run_id)
+        meta = self._meta(directory)
+        metric = _safe_name(metric)
+        if metric not in meta["metrics"]:
+            raise KeyError(f"Run '{run_id}' has no metric '{metric}'.")
+        fanout, levels = meta["fanout"], meta["levels"]
+
+        values = _read_column(os.path.join(directory, f"{metric}.f4"), np.float32)
+        steps = _read_column(os.path.join(directory, "step.i8"), np.int64, len(values))
+        r0 = 0 if step_from is None else int(np.searchsorted(steps, int(step_from), 'left'))
+        r1 = len(steps) if step_to is None else int(np.searchsorted(steps, int(step_to), 'right'))
+        result = {"run_id": str(run_id), "metric": metric, "step": [], "min": [], "max": [], "mean": []}
+        if r1 <= r0:
+            return result
+
+        group = -(-(r1 - r0) // max(1, int(points)))
+        level = 0
+        while level < levels and fanout ** (level + 1) <= group:
+            level += 1
+        unit = fanout ** level
+        size = unit * -(-group // unit)  # Output bucket size: a whole number of level entries
+
+        # Output buckets are aligned to multiples of `size`; the aligned middle
+        # comes from level summaries, the ragged edges from raw rows.
+        m0 = min(-(-r0 // size) * size, r1)
+        m1 = max(r1 // size * size, m0)
+        if level:
+            level_count = min(len(_read_column(os.path.join(directory, f"{metric}.L{level}.{part}"), dtype))
+                              for part, dtype in (("min.f4", np.float32), ("max.f4", np.float32),
+                                                  ("sum.f8", np.float64)))
+            m1 = max(m0, min(m1, level_count * unit // size * size))
+
+        parts = [self._raw_buckets(values, r0, m0, size)]
+        if m1 > m0:
+            if level:
+                lo, hi = m0 // unit, m1 // unit
+                mins, maxs, sums = (np.asarray(_read_column(os.path.join(directory, f"{metric}.L{level}.{part}"), dtype)[lo:hi],
+                                               dtype=np.float64)
+                                    for part, dtype in (("min.f4", np.float32), ("max.f4", np.float32),
+                                                        ("sum.f8", np.float64)))
+                mins, maxs, sums = _summarize(mins, maxs, sums, size // unit)
+                parts.append((np.arange(m0, m1, size), mins, maxs, sums / size))
+            else:
+                parts.append(self._raw_buckets(values, m0, m1, size))
+        parts.append(self._raw_buckets(values, m1, r1, size))
+
+        starts = np.concatenate([p[0] for p in parts]).astype(np.int64)
+        result["step"] = steps[starts].tolist()
+        for key, index in (("min", 1), ("max", 2), ("mean", 3)):
+            column = np.concatenate([p[index] for p in parts])
+            result[key] = [None if np.isnan(v) else round(float(v), 6) for v in column]
+        return result
+
+    def handle(self, data, send):
+        """Answers metric-store commands; returns False if `data` isn't one."""
+        command = data.get("command")
+        if command not in ("query_metrics", "run_info", "list_runs"):
+            return False
+        try:
+            if command == "list_runs":
+                send({"type": "runs", "runs": self.runs()})
+            elif command == "run_info":
+                send(dict(self.info(data.get("run_id")), type="run_info"))
+            else:
+                started = time.perf_counter()
+                result = self.query(data.get("run_id"), data.get("metric", "loss"), data.get("step_from"),
+                                    data.get("step_to"), data.get("points", 1000))
+                result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                send(dict(result, type="metrics"))
+        except (OSError, KeyError, ValueError) as e:
+            message = e.args[0] if isinstance(e, KeyError) else str(e)
+            if isinstance(e, FileNotFoundError):
+                message = f"Unknown run '{data.get('run_id')}'."
+            send({"type": "error", "command": command, "message": message})
+        return True
+
+    @staticmethod
+    def _raw_buckets(values, a, b, size):
+        if b <= a:
+            empty = np.empty(0)
+            return np.empty(0, dtype=np.int64), empty, empty, empty
+        chunk = np.asarray(values[a:b], dtype=np.float64)
+        offsets = np.arange(0, b - a, size)
+        counts = np.diff(np.append(offsets, b - a))
+        return (a + offsets, np.fmin.reduceat(chunk, offsets), np.fmax.reduceat(chunk, offsets),
+                np.add.reduceat(chunk, offsets) / counts)
@@ -1,31 +1,641 @@
 ﻿# File: PythonScripts/pytest_runner.py
-import sys, json, socket, pytest
+# Runs a test suite on a pool of worker processes (this same script in
+# "worker" mode), one test file at a time, longest files first. Incremental
+# runs consult a per-project dependency map (built from coverage data when
+# the coverage package is installed) and only rerun tests touched by changes.
+import os, ast, sys, json, time, socket, fnmatch, hashlib, selectors, subprocess
+from collections import deque
+import pytest
+from duration_db import DurationStore
+
+STATE_ROOT = os.environ.get(
+    "PYTHON_IPC_PYTEST_STATE", os.path.join(os.path.expanduser("~"), ".python_ipc_tool", "pytest"))
+TEST_FILE_PATTERNS = ("test_*.py", "*_test.py")  # pytest's default python_files
+# Files that mark a project's root, in the order pytest looks for its rootdir (plus the repository)
+ROOT_MARKERS = ("pytest.ini", ".pytest.ini", "pyproject.toml", "tox.ini", "setup.cfg", "setup.py", ".git")
+SKIP_DIRS = {".git", ".hg", ".svn", ".tox", ".nox", ".venv", "venv", "env", "node_modules",
+             "__pycache__", ".pytest_cache", "build", "dist", "site-packages"}
+DEFAULT_FILE_COST = 1.0  # Seconds assumed for a test file with no recorded durations
+MAX_RESTARTS = 4
 
 class JsonTestReporter:
     def __init__(self, writer):
         self.writer = writer
+        self._reports = {}  # nodeid -> {phase: report} until its teardown is logged
+
+    def _emit(self, message):
+        self.writer.write(json.dumps(message) + '\n')
+        self.writer.flush()
 
     def pytest_runtest_logreport(self, report):
-        if report.when == 'call': # Only report on the main test execution phase
-            test_result = {
-                "event": "test_finished",
-                "name": report.nodeid,
-                "status": report.outcome, # 'passed', 'failed', 'skipped'
-                "duration": round(report.duration, 4)
-            }
-            if report.failed:
-                test_result["error"] = str(report.longrepr)
-            
-            self.writer.write(json.dumps(test_result) + '\n')
-            self.writer.flush()
-            
+        # Reported once teardown is done, so all three phases can be timed
+        phases = self._reports.setdefault(report.nodeid, {})
+        phases[report.when] = report
+        if report.when != 'teardown':
+            return
+        del self._reports[report.nodeid]
+        call = phases.get('call')
+        test_result = {
+            "event": "test_finished",
+            "name": report.nodeid,
+            "status": call.outcome if call else phases['setup'].outcome, # 'passed', 'failed', 'skipped'
+            "duration": round(call.duration, 4) if call else 0.0, # Call phase, as before
+            "phases": {when: round(r.duration, 4) for when, r in phases.items()}
+        }
+        # Setup/teardown errors are errors, not test failures
+        failed = next((r for r in phases.values() if r.failed), None)
+        if failed is not None:
+            if failed.when != 'call':
+                test_result["status"] = "error"
+                test_result["phase"] = failed.when
+            test_result["error"] = str(failed.longrepr)
+
+        self._emit(test_result)
+
+    def pytest_collectreport(self, report):
+        if report.failed:  # e.g. an import error in a test module
+            self._emit({"event": "test_finished", "name": report.nodeid, "status": "error",
+                        "phase": "collect", "duration": 0.0, "error": str(report.longrepr)})
+
     def pytest_sessionfinish(self, session):
         finish_msg = {"event": "session_finished", "exitstatus": int(session.exitstatus)}
-        self.writer.write(json.dumps(finish_msg) + '\n')
+        self._emit(finish_msg)
+
+class DependencyRecorder:
+    """Records which project files each test executes, using coverage contexts.
+
+    Lines run while a test is the current context belong to that test. Lines
+    run outside any test (module imports during collection) are recorded
+    separately as the batch's import dependencies.
+    """
+
+    def __init__(self, root):
+        import coverage  # Optional dependency; callers check coverage_available() first
+        self.root = root
+        self.cov = coverage.Coverage(data_file=None, branch=False, include=[os.path.join(root, "*")],
+                                     omit=["*/site-packages/*"])
+        self.tests = []
+        self.cov.start()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        self.cov.switch_context(item.nodeid)
+        self.tests.append(item.nodeid)
+        yield
+        self.cov.switch_context("")
+
+    def finish(self):
+        self.cov.stop()
+        data = self.cov.get_data()
+        deps = {nodeid: set() for nodeid in self.tests}
+        shared = set()
+        for path in data.measured_files():
+            rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+            if rel.startswith("../"):
+                continue
+            for contexts in data.contexts_by_lineno(path).values():
+                for context in contexts:
+                    if context in deps:
+                        deps[context].add(rel)
+                    elif not context:
+                        shared.add(rel)
+        return {"tests": {nodeid: sorted(files) for nodeid, files in deps.items()}, "imports": sorted(shared)}
+
+def module_skeleton(source):
+    """Hash of a module with every function body removed, or None if it doesn't parse.
+
+    Edits that leave it unchanged only altered code inside functions, which
+    affects just the tests that called those functions; anything else (a new
+    constant, a changed signature or decorator) can affect every importer.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            node.body = [ast.Pass()]
+    return hashlib.sha1(ast.dump(tree).encode("utf-8")).hexdigest()
+
+def coverage_available():
+    try:
+        import coverage  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def is_test_file(path):
+    return any(fnmatch.fnmatch(os.path.basename(path), pattern) for pattern in TEST_FILE_PATTERNS)
+
+def find_test_files(root, target):
+    """Test files under `target` as paths relative to `root` (pytest's default naming)."""
+    if os.path.isfile(target):
+        return [os.path.relpath(target, root).replace(os.sep, "/")]
+    found = []
+    for directory, dirs, files in os.walk(target):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(files):
+            if is_test_file(name):
+                found.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/"))
+    return found
+
+class ProjectState:
+    """What the runner remembers about one project between runs.
+
+    `fingerprints` maps every .py file to (mtime_ns, size, sha1, skeleton) as
+    of the last completed run; `tests` maps test node ids to the files they
+    executed and `imports` maps test files to the files their collection
+    imported; `failed` lists tests that did not pass last time. Timing
+    history lives in `durations` (see duration_db.py).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.directory = os.path.join(STATE_ROOT, hashlib.sha1(root.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+        state = self._load("deps.json", {})
+        self.fingerprints = state.get("files", {})
+        self.tests = {nodeid: set(files) for nodeid, files in state.get("tests", {}).items()}
+        self.imports = {path: set(files) for path, files in state.get("imports", {}).items()}
+        self.failed = set(state.get("failed", []))
+        self.durations = DurationStore(os.path.join(self.directory, "durations.sqlite3"))
+
+    def _load(self, name, default):
+        try:
+            with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def _dump(self, name, value):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(path + ".tmp", path)
+
+    def snapshot(self):
+        """Fingerprints every .py file in the project; unchanged files cost one stat()."""
+        current = {}
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+            for name in files:
+                if not name.endswith(".py"):
+                    continue
+                path = os.path.join(directory, name)
+                rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                old = self.fingerprints.get(rel)
+                if old and old[0] == stat.st_mtime_ns and old[1] == stat.st_size:
+                    current[rel] = old
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        source = f.read()
+                except OSError:
+                    continue
+                digest = hashlib.sha1(source).hexdigest()
+                skeleton = old[3] if old and old[2] == digest else module_skeleton(source)
+                current[rel] = [stat.st_mtime_ns, stat.st_size, digest, skeleton]
+        return current
+
+    def changed(self, snapshot):
+        """Returns (files added, removed or edited, the subset edited outside function bodies)."""
+        changed, structural = set(), set()
+        for rel in set(snapshot) | set(self.fingerprints):
+            new, old = snapshot.get(rel), self.fingerprints.get(rel)
+            if new and old and new[2] == old[2]:
+                continue
+            changed.add(rel)
+            if not (new and old and new[3] is not None and new[3] == old[3]):
+                structural.add(rel)
+        return changed, structural
+
+    def select(self, test_files, changed, structural):
+        """Works out what an incremental run must execute.
+
+        A test reruns if it failed last time, executed a changed file, or its
+        test file imported a file whose module-level code changed. Returns
+        ({test file: None for the whole file, or [node ids]}, reason).
+        """
+        if not self.fingerprints:
+            return {path: None for path in test_files}, "no previous run"
+        test_set = set(test_files)
+        # New or edited test files run whole: they may contain tests the map has never seen
+        selected = {path: None for path in test_files if path in changed}
+        other_changes = changed - test_set
+        if other_changes and not self.tests:
+            return {path: None for path in test_files}, "source changed and no dependency map"
+        for path in test_files:
+            if path not in selected and self.imports.get(path, set()) & structural:
+                selected[path] = None
+        for nodeid, files in self.tests.items():
+            path = nodeid.split("::", 1)[0]
+            if path not in test_set or (path in selected and selected[path] is None):
+                continue
+            if nodeid in self.failed or files & other_changes:
+                selected.setdefault(path, []).append(nodeid)
+        for nodeid in self.failed:
+            path = nodeid.split("::", 1)[0]
+            if path in test_set and path not in selected:
+                selected[path] = None  # Failed without reaching the map (e.g. a collection error)
+        return selected, "incremental"
+
+    def file_costs(self, batches):
+        """Expected seconds per batch from each test's median duration over recent runs."""
+        expected = self.durations.expected()
+        totals = {}
+        for nodeid, seconds in expected.items():
+            path = nodeid.split("::", 1)[0]
+            if path in batches and (batches[path] is None or nodeid in batches[path]):
+                totals[path] = totals.get(path, 0.0) + seconds
+        test_files = list(batches)
+        known = [totals[path] for path in test_files if path in totals]
+        fallback = max(known) if known else DEFAULT_FILE_COST  # Unknown files start early
+        return {path: totals.get(path, fallback) for path in test_files}
+
+    def dependents(self, rel, snapshot):
+        """Test files that a change to `rel` can affect, as far as the maps know."""
+        if not self.tests:  # No dependency map: any test may use any file
+            return {path for path in snapshot if is_test_file(path)} | ({rel} if is_test_file(rel) else set())
+        found = {nodeid.split("::", 1)[0] for nodeid, files in self.tests.items() if rel in files}
+        found.update(path for path, files in self.imports.items() if rel in files)
+        if is_test_file(rel):
+            found.add(rel)
+        return found
+
+    def advance(self, snapshot, scope):
+        """Fingerprints to store after a run over the test files in `scope`.
+
+        A changed file only takes its new fingerprint once every test file
+        that depends on it was within reach of the run; otherwise it keeps the
+        old one (or stays unknown), so tests outside a narrower target still
+        see the change next time.
+        """
+        scope = set(scope)
+        fingerprints = dict(snapshot)
+        for rel in self.changed(snapshot)[0]:
+            if self.dependents(rel, snapshot) <= scope:
+                continue
+            if rel in self.fingerprints:
+                fingerprints[rel] = self.fingerprints[rel]
+            else:
+                fingerprints.pop(rel, None)
+        return fingerprints
+
+    def record(self, snapshot, scope, results, deps, imports, whole_files, **run_info):
+        """Stores the outcome of a completed run over the test files in `scope`."""
+        for nodeid in [n for n in self.tests if n.split("::", 1)[0] in whole_files and n not in results]:
+            del self.tests[nodeid]  # Tests that disappeared from a file that ran in full
+        for nodeid in [n for n in self.tests if n.split("::", 1)[0] not in snapshot]:
+            del self.tests[nodeid]  # The whole test file is gone
+        for path in [p for p in self.imports if p not in snapshot]:
+            del self.imports[path]
+        for nodeid, files in deps.items():
+            self.tests[nodeid] = set(files)
+        for path, files in imports.items():
+            self.imports[path] = set(files)
+        for nodeid, result in results.items():
+            if result["status"] in ("passed", "skipped"):
+                self.failed.discard(nodeid)
+            else:
+                self.failed.add(nodeid)
+        self.durations.record_run(results, **run_info)
+        self.fingerprints = self.advance(snapshot, scope)
+        self._dump("deps.json", {"files": self.fingerprints, "failed": sorted(self.failed),
+                                 "tests": {nodeid: sorted(files) for nodeid, files in self.tests.items()},
+                                 "imports": {path: sorted(files) for path, files in self.imports.items()}})
+
+class WorkerHandle:
+    """One spawned `pytest_runner.py worker` process and, once it connects, its socket."""
+
+    def __init__(self, slot, port, root):
+        self.slot = slot
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', str(port)],
+                                        cwd=root, stdout=subprocess.DEVNULL)
+        self.sock = None
+        self.buffer = b''
+        self.batch = None
+        self.lost = False
+
+    def send(self, message):
+        self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+    def stop(self):
+        if self.sock:
+            try:
+                self.send({"command": "shutdown"})
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+class TestRun:
+    """Distributes test files over worker processes and relays their results.
+
+    Files are queued longest-expected-first and handed out one at a time to
+    whichever worker is idle, so a few slow files start early and the short
+    ones fill in around them. A worker that dies fails its current file and
+    is replaced.
+    """
+
+    def __init__(self, root, batches, costs, worker_count, writer, record_deps, pytest_args):
+        self.root = root
+        self.writer = writer
+        self.record_deps = record_deps
+        self.pytest_args = list(pytest_args)
+        self.queue = deque(sorted(batches.items(), key=lambda item: -costs.get(item[0], DEFAULT_FILE_COST)))
+        self.worker_count = max(1, min(worker_count, len(self.queue)))
+        self.results = {}  # nodeid -> {"status", "phases"}
+        self.deps = {}
+        self.imports = {}
+        self.exitstatuses = []
+        self.restarts = 0
+
+    def _emit(self, message):
+        self.writer.write(json.dumps(message) + '\n')
         self.writer.flush()
 
-def run_tests(writer, target):
-    reporter = JsonTestReporter(writer)
-    pytest.main([target], plugins=[reporter])
+    def _dispatch(self, worker):
+        if worker.sock is None or worker.batch is not None or not self.queue:
+            return
+        path, nodeids = worker.batch = self.queue.popleft()
+        try:
+            worker.send({"command": "run", "args": self.pytest_args + (nodeids or [path]),
+                         "root": self.root, "record_deps": self.record_deps})
+        except OSError:
+            self._on_worker_lost(worker)
+
+    def _on_message(self, worker, message):
+        event = message.get("event")
+        if event == "test_finished":
+            self.results[message["name"]] = {"status": message.get("status"), "phases": message.get("phases", {})}
+            self._emit(dict(message, worker=worker.slot))
+        elif event == "session_finished":
+            self.exitstatuses.append(message.get("exitstatus"))
+        elif event == "dependencies":
+            self.deps.update(message.get("tests", {}))
+            self.imports[worker.batch[0]] = message.get("imports", [])
+        elif event == "batch_done":
+            worker.batch = None
+            self._dispatch(worker)
+
+    def _on_worker_lost(self, worker):
+        worker.lost = True
+        if worker.sock:
+            self.selector.unregister(worker.sock)
+            worker.sock.close()
+            worker.sock = None
+        if worker.batch is not None:
+            path, nodeids = worker.batch
+            worker.batch = None
+            for nodeid in nodeids or [path]:
+                self.results[nodeid] = {"status": "error", "phases": {}}
+                self._emit({"event": "test_finished", "name": nodeid, "status": "error", "duration": 0.0,
+                            "error": "Test worker process exited unexpectedly.", "worker": worker.slot})
+            self.exitstatuses.append(int(pytest.ExitCode.INTERNAL_ERROR))
+        if worker.process.poll() is None:
+            worker.process.kill()
+        if self.restarts >= MAX_RESTARTS:
+            if all(w.lost for w in self.workers):
+                raise RuntimeError("All test workers died and the restart budget is exhausted.")
+            return
+        self.restarts += 1
+        self.workers[worker.slot] = WorkerHandle(worker.slot, self.port, self.root)
+
+    def _read(self, worker):
+        try:
+            data = worker.sock.recv(65536)
+        except ConnectionError:
+            data = b''
+        if not data:
+            self._on_worker_lost(worker)
+            return
+        worker.buffer += data
+        *lines, worker.buffer = worker.buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                self._on_message(worker, json.loads(line))
+
+    def _accept(self, server):
+        conn, _ = server.accept()
+        conn.setblocking(True)
+        # The first line identifies which spawned process this connection belongs to
+        hello = b''
+        while not hello.endswith(b'\n'):
+            part = conn.recv(1024)
+            if not part:
+                conn.close()
+                return
+            hello += part
+        pid = json.loads(hello).get("pid")
+        for worker in self.workers:
+            if worker.process.pid == pid and worker.sock is None:
+                worker.sock = conn
+                self.selector.register(conn, selectors.EVENT_READ, worker)
+                self._dispatch(worker)
+                return
+        conn.close()
+
+    def _busy(self):
+        return self.queue or any(w.batch is not None for w in self.workers if not w.lost)
+
+    def run(self):
+        if not self.queue:
+            return
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind(('localhost', 0))
+            server.listen()
+            self.port = server.getsockname()[1]
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(server, selectors.EVENT_READ, None)
+            self.workers = [WorkerHandle(slot, self.port, self.root) for slot in range(self.worker_count)]
+            try:
+                while self._busy():
+                    for key, _ in self.selector.select(timeout=0.1):
+                        if key.data is None:
+                            self._accept(server)
+                        elif key.data.sock is not None:
+                            self._read(key.data)
+                    # Catch workers that died before (or without) connecting
+                    for worker in list(self.workers):
+                        if not worker.lost and worker.sock is None and worker.process.poll() is not None:
+                            self._on_worker_lost(worker)
+            finally:
+                for worker in self.workers:
+                    worker.stop()
+                self.selector.close()
+
+    def exitstatus(self):
+        codes = [code for code in self.exitstatuses if code != pytest.ExitCode.NO_TESTS_COLLECTED]
+        if not codes:
+            return int(pytest.ExitCode.NO_TESTS_COLLECTED) if self.exitstatuses else int(pytest.ExitCode.OK)
+        return max(codes)
+
+def find_project_root(directory):
+    """The nearest folder at or above `directory` holding a ROOT_MARKERS file, else `directory`.
+
+    Like pytest's rootdir: running `tests/` alone still fingerprints and
+    traces the code under test next to it, not just the test folder.
+    """
+    current = directory
+    while True:
+        if any(os.path.exists(os.path.join(current, marker)) for marker in ROOT_MARKERS):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return directory
+        current = parent
+
+def project_root(target, rootdir=None):
+    """Resolves (target, project root); state is kept per root."""
+    target = os.path.realpath(target or ".")
+    if rootdir:
+        return target, os.path.realpath(rootdir)
+    return target, find_project_root(target if os.path.isdir(target) else os.path.dirname(target))
+
+def run_tests(writer, target, options=None):
+    """Runs the tests under `target`; every message goes to `writer` as one JSON line."""
+    options = options or {}
+    started = time.monotonic()
+    target, root = project_root(target, options.get("rootdir"))
+    state = ProjectState(root)
+    snapshot = state.snapshot()
+    test_files = find_test_files(root, target)
+
+    record_deps = bool(options.get("record_deps", True)) and coverage_available()
+    if options.get("incremental"):
+        batches, reason = state.select(test_files, *state.changed(snapshot))
+    else:
+        batches, reason = {path: None for path in test_files}, "full run"
+    whole_files = {path for path, nodeids in batches.items() if nodeids is None}
+
+    selection = {"event": "selection", "mode": reason, "files": len(batches),
+                 "test_files": len(test_files), "dependency_tracking": record_deps}
+    if options.get("incremental"):
+        selection["tests"] = sum(len(nodeids) for nodeids in batches.values() if nodeids)
+    writer.write(json.dumps(selection) + '\n')
+    writer.flush()
+
+    workers = int(options.get("workers") or os.cpu_count() or 1)
+    run = TestRun(root, batches, state.file_costs(batches), workers, writer, record_deps,
+                  options.get("pytest_args", []))
+    run.run()
+    elapsed = round(time.monotonic() - started, 3)
+    state.record(snapshot, test_files, run.results, run.deps, run.imports, whole_files,
+                 mode=reason, workers=run.worker_count, elapsed=elapsed)
+    state.durations.close()
+
+    counts = {}
+    for result in run.results.values():
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    finish_msg = {"event": "session_finished", "exitstatus": run.exitstatus(), "counts": counts,
+                  "files": len(batches), "workers": run.worker_count if batches else 0,
+                  "elapsed": elapsed}
+    writer.write(json.dumps(finish_msg) + '\n')
+    writer.flush()
+
+def query_durations(data):
+    """Answers the duration history commands for the project `data["target"]` belongs to."""
+    _target, root = project_root(data.get("target", "."), data.get("rootdir"))
+    store = ProjectState(root).durations
+    try:
+        command = data.get("command")
+        window = int(data.get("window", 10))
+        phase = data.get("phase", "total")
+        if command == "slowest_tests":
+            return {"event": "slowest_tests", "phase": phase, "window": window,
+                    "tests": store.slowest(data.get("limit", 20), phase, window, data.get("prefix"))}
+        if command == "duration_regressions":
+            return {"event": "duration_regressions", "phase": phase, "window": window,
+                    "tests": store.regressions(window, float(data.get("threshold", 1.5)),
+                                               float(data.get("min_seconds", 0.05)), phase)}
+        if command == "phase_summary":
+            return {"event": "phase_summary", "window": window, "phases": store.phase_totals(window)}
+        if not data.get("name"):
+            raise ValueError("Missing 'name' (a test node id).")
+        return {"event": "test_history", "name": data["name"], "runs": store.history(data["name"])}
+    finally:
+        store.close()
+
+def forget_project_modules(root):
+    """Drops modules loaded from the project, so the next batch imports them itself.
+
+    A worker runs many batches in one interpreter; without this, a module
+    shared by several test files would only be imported (and so recorded as
+    an import dependency) by the first of them.
+    """
+    prefix = os.path.join(root, "")
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if name != "__main__" and path and os.path.realpath(path).startswith(prefix) \
+                and "site-packages" not in path:
+            del sys.modules[name]
+
+def run_worker(port):
+    """Worker mode: runs the test files the coordinator sends, one pytest session each."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.connect(('localhost', port))
+        reader = s.makefile('r', encoding='utf-8')
+        writer = s.makefile('w', encoding='utf-8')
+        reporter = JsonTestReporter(writer)
+        # Let the coordinator match this connection to the process it spawned
+        reporter._emit({"event": "ready", "pid": os.getpid()})
+        for line in reader:
+            data = json.loads(line)
+            if data.get("command") != "run":
+                break
+            forget_project_modules(data["root"])
+            plugins = [reporter]
+            recorder = DependencyRecorder(data["root"]) if data.get("record_deps") else None
+            if recorder:
+                plugins.append(recorder)
+            try:
+                pytest.main(["-p", "no:cacheprovider", f"--rootdir={data['root']}"] + data["args"],
+                            plugins=plugins)
+            finally:
+                if recorder:
+                    reporter._emit(dict(recorder.finish(), event="dependencies"))
+            reporter._emit({"event": "batch_done"})
+
+def run_socket_mode(port):
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.connect(('localhost', port))
+            reader = s.makefile('r', encoding='utf-8')
+            writer = s.makefile('w', encoding='utf-8')
+            while True:
+                line = reader.readline()
+                if not line:
+                    break
+
+                try:
+                    data = json.loads(line)
+                    command = data.get("command")
+                    if command == "run_tests":
+                        run_tests(writer, data.get("target", "."), data)
+                        continue
+                    elif command in ("slowest_tests", "duration_regressions", "phase_summary", "test_history"):
+                        response = query_durations(data)
+                    else:
+                        raise ValueError("Unknown command")
+                except Exception as e:
+                    response = {"event": "error", "message": str(e)}
+
+                writer.write(json.dumps(response) + '\n')
+                writer.flush()
+    except Exception as e:
+        sys.stderr.write(f"Pytest Runner Error: {e}\n")
+        sys.stderr.flush()
 
-# ... (main template, on "run_tests" command call run_tests)
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'socket':
+        run_socket_mode(int(sys.argv[2]))
+    elif len(sys.argv) == 3 and sys.argv[1] == 'worker':
+        run_worker(int(sys.argv[2]))
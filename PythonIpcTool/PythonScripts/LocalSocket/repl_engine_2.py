@@ -1,46 +1,489 @@
 ﻿# File: PythonScripts/repl_engine.py
+import os
 import sys
 import json
+import time
 import socket
-from io import StringIO
+import itertools
+import threading
+import subprocess
+from collections import deque
+from line_writer import LineWriter
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "repl_worker.py")
+PRELOAD = ("math", "json", "re", "random", "datetime", "collections", "itertools", "functools",
+           "numpy", "pandas")
+WARM_WORKERS = 2           # Idle interpreters kept ready, so opening a session takes milliseconds
+WORKER_START_TIMEOUT = 60.0
+INTERRUPT_GRACE = 2.0      # Seconds a cell gets to honour an interrupt before its process is killed
+DEFAULT_SESSION = "default"
+
+class Worker:
+    """A repl_worker.py process and, once it has warmed up and connected, its socket."""
+
+    def __init__(self, port, preload):
+        self.process = subprocess.Popen([sys.executable, WORKER_SCRIPT, 'socket', str(port), ",".join(preload)],
+                                        stdout=subprocess.DEVNULL)
+        self.sock = None
+        self.reader = None
+        self.preloaded = []
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+    def stop(self):
+        if self.sock:
+            try:
+                self.send({"command": "shutdown"})
+            except OSError:
+                pass
+            self.sock.close()
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+class WorkerPool:
+    """Keeps `size` warm workers waiting; acquire() hands one out and starts a replacement."""
+
+    def __init__(self, size=WARM_WORKERS, preload=PRELOAD):
+        self.size = size
+        self.preload = preload
+        self.listener = socket.create_server(('localhost', 0))
+        self.port = self.listener.getsockname()[1]
+        self._starting = {}  # pid -> Worker that hasn't connected yet
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        self.fill()
+
+    def fill(self):
+        with self._cond:
+            while not self._closed and len(self._idle) + len(self._starting) < self.size:
+                worker = Worker(self.port, self.preload)
+                self._starting[worker.process.pid] = worker
+
+    def acquire(self):
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        with self._cond:
+            while True:
+                while self._idle:
+                    worker = self._idle.popleft()
+                    if worker.process.poll() is None:
+                        threading.Thread(target=self.fill, daemon=True).start()
+                        return worker
+                # Cold path: nothing warm yet. Replace workers that died while starting.
+                for pid, worker in list(self._starting.items()):
+                    if worker.process.poll() is not None:
+                        del self._starting[pid]
+                if not self._starting:
+                    worker = Worker(self.port, self.preload)
+                    self._starting[worker.process.pid] = worker
+                if self._closed or time.monotonic() > deadline:
+                    raise RuntimeError("Timed out starting a REPL worker process.")
+                self._cond.wait(0.5)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return  # Listener closed
+            reader = conn.makefile('r', encoding='utf-8')
+            try:
+                hello = json.loads(reader.readline())
+            except ValueError:
+                conn.close()
+                continue
+            with self._cond:
+                worker = self._starting.pop(hello.get("pid"), None)
+                if worker is None or self._closed:
+                    conn.close()
+                    continue
+                worker.sock, worker.reader = conn, reader
+                worker.preloaded = hello.get("preloaded", [])
+                self._idle.append(worker)
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            workers = list(self._idle) + list(self._starting.values())
+            self._idle.clear()
+            self._starting.clear()
+            self._cond.notify_all()
+        self.listener.close()
+        for worker in workers:
+            worker.stop()
+
+class Session:
+    """A named namespace living in its own worker process.
+
+    Cells run one at a time in submission order. Every cell that succeeded
+    is kept in `history`, so when the process dies (a crash, or being killed
+    after ignoring an interrupt) a fresh worker can replay them and bring
+    the namespace back.
+    """
+
+    def __init__(self, name, memory_mb=None):
+        self.name = name
+        self.memory_mb = memory_mb
+        self.worker = None
+        self.state = "starting"
+        self.history = []
+        self.pending = deque()
+        self.current = None
+        self.timer = None
+        self.kill_reason = None
+        self.replay_failures = 0
+        self.restores = 0
+        self.executed = 0
+
+    def describe(self):
+        state = "busy" if self.state == "ready" and self.current is not None else self.state
+        return {"session": self.name, "state": state, "cells": len(self.history),
+                "executed": self.executed, "queued": len(self.pending) + (self.current is not None),
+                "restores": self.restores, "pid": self.worker.process.pid if self.worker else None}
+
+class SessionManager:
+    """Routes execute/interrupt/restore commands to per-session worker processes."""
+
+    def __init__(self, send, pool):
+        self.send = send
+        self.pool = pool
+        self.sessions = {}
+        self._lock = threading.RLock()
+        self._cell_ids = itertools.count(1)
+
+    # --- Commands ---
+
+    def open(self, name, memory_mb=None, reply=True):
+        with self._lock:
+            session = self.sessions.get(name)
+            if session is not None:
+                if reply:
+                    self.send(dict(session.describe(), status="success", type="session_opened", elapsed_ms=0.0))
+                return session
+            session = self.sessions[name] = Session(name, memory_mb)
+        threading.Thread(target=self._start, args=(session, False, reply), daemon=True).start()
+        return session
+
+    def execute(self, name, code, request_id=None, timeout=None, stream=False, max_output=None):
+        """Queues a cell. With `stream`, its output is sent as "output" messages while it runs."""
+        with self._lock:
+            session = self.sessions.get(name) or self.open(name, reply=False)
+            if session.state == "dead":
+                raise ValueError(f"Session '{name}' could not be restored; use restore_session.")
+            session.pending.append({"cell_id": next(self._cell_ids), "id": request_id, "code": code,
+                                    "timeout": float(timeout) if timeout else None, "replay": False,
+                                    "stream": bool(stream), "max_output": max_output})
+            self._dispatch(session)
+
+    def interrupt(self, name):
+        with self._lock:
+            session = self._get(name)
+            cell = session.current
+            if cell is None:
+                return False
+            self._interrupt(session, cell, "was interrupted")
+            return True
+
+    def restore(self, name):
+        """Replays the session's history into a fresh process (the old one is discarded)."""
+        with self._lock:
+            session = self._get(name)
+            worker, session.worker = session.worker, None
+            self._cancel_timer(session)
+            cell, session.current = session.current, None
+            session.pending = deque(c for c in session.pending if not c["replay"])
+        if worker:
+            worker.kill()
+        if cell is not None and not cell["replay"]:
+            self._reply(session, cell, {"status": "error", "message": "Session was restored while this cell ran."})
+        self._restart(session)
+
+    def close(self, name):
+        with self._lock:
+            session = self.sessions.pop(name, None)
+            if session is None:
+                raise KeyError(f"Unknown session '{name}'.")
+            session.state = "closed"
+            self._cancel_timer(session)
+            worker, session.worker = session.worker, None
+            dropped = list(session.pending) + ([session.current] if session.current else [])
+            session.pending.clear()
+            session.current = None
+        for cell in dropped:
+            if not cell["replay"]:
+                self._reply(session, cell, {"status": "error", "message": "Session was closed."})
+        if worker:
+            threading.Thread(target=worker.stop, daemon=True).start()
+
+    def describe(self):
+        with self._lock:
+            return [session.describe() for session in self.sessions.values()]
+
+    def shutdown(self):
+        with self._lock:
+            workers = [s.worker for s in self.sessions.values() if s.worker]
+            for session in self.sessions.values():
+                session.state = "closed"
+                self._cancel_timer(session)
+            self.sessions.clear()
+        for worker in workers:
+            worker.stop()
+        self.pool.close()
+
+    # --- Worker lifecycle ---
+
+    def _get(self, name):
+        session = self.sessions.get(name)
+        if session is None:
+            raise KeyError(f"Unknown session '{name}'.")
+        return session
+
+    def _start(self, session, replay, reply=True):
+        started = time.monotonic()
+        try:
+            worker = self.pool.acquire()
+        except RuntimeError as e:
+            with self._lock:
+                session.state = "dead"
+                failed = list(session.pending)
+                session.pending.clear()
+            for cell in failed:
+                self._reply(session, cell, {"status": "error", "message": str(e)})
+            self.send({"status": "error", "type": "session_error", "session": session.name, "message": str(e)})
+            return
+        if session.memory_mb:
+            worker.send({"command": "configure", "memory_mb": session.memory_mb})
+        with self._lock:
+            if session.state == "closed":
+                threading.Thread(target=worker.stop, daemon=True).start()
+                return
+            session.worker = worker
+            session.kill_reason = None
+            session.replay_failures = 0
+            session.state = "restoring" if replay and session.history else "ready"
+            nothing_to_replay = replay and session.state == "ready"
+            if session.state == "restoring":
+                session.pending.extendleft(reversed(
+                    [{"cell_id": next(self._cell_ids), "id": None, "code": code, "timeout": None, "replay": True,
+                      "stream": False, "max_output": 0} for code in session.history]))
+            self._dispatch(session)
+        threading.Thread(target=self._read_results, args=(session, worker), daemon=True).start()
+        if nothing_to_replay:
+            self._restored(session)
+        elif not replay and reply:
+            self.send(dict(session.describe(), status="success", type="session_opened",
+                           elapsed_ms=round((time.monotonic() - started) * 1000, 1),
+                           preloaded=worker.preloaded))
+
+    def _restart(self, session):
+        with self._lock:
+            if session.state == "closed":
+                return
+            session.state = "starting"
+            session.restores += 1
+        threading.Thread(target=self._start, args=(session, True), daemon=True).start()
+
+    def _restored(self, session):
+        self.send(dict(session.describe(), status="success", type="session_restored",
+                       replay_failures=session.replay_failures))
+
+    def _read_results(self, session, worker):
+        try:
+            for line in worker.reader:
+                message = json.loads(line)
+                if message.get("event") == "output":
+                    self._on_output(session, worker, message)
+                elif message.get("event") == "result":
+                    self._on_result(session, worker, message)
+        except (OSError, ValueError):
+            pass
+        self._on_worker_exit(session, worker)
+
+    def _on_output(self, session, worker, message):
+        with self._lock:
+            cell = session.current
+            if session.worker is not worker or cell is None or cell["cell_id"] != message.get("cell_id"):
+                return
+        self._reply(session, cell, {"type": "output", "stream": message.get("stream"), "text": message.get("text")})
+
+    def _on_result(self, session, worker, message):
+        with self._lock:
+            cell = session.current
+            if session.worker is not worker or cell is None or cell["cell_id"] != message.get("cell_id"):
+                return
+            session.current = None
+            self._cancel_timer(session)
+            if cell["replay"]:
+                session.replay_failures += message["status"] != "success"
+                finished_replay = not any(c["replay"] for c in session.pending)
+                if finished_replay:
+                    session.state = "ready"
+            else:
+                session.executed += 1
+                if message["status"] == "success":
+                    session.history.append(cell["code"])
+            self._dispatch(session)
+        if cell["replay"]:
+            if finished_replay:
+                self._restored(session)
+            return
+        result = {k: v for k, v in message.items() if k not in ("event", "cell_id")}
+        if cell.get("timed_out"):
+            result.update(timed_out=True, message=f"Execution timed out after {cell['timeout']:g}s.")
+        self._reply(session, cell, result)
+
+    def _on_worker_exit(self, session, worker):
+        worker.kill()
+        worker.process.wait()
+        with self._lock:
+            if session.worker is not worker or session.state == "closed":
+                return  # Closed, or already replaced by restore_session
+            cell = session.current
+            session.current = None
+            session.worker = None
+            self._cancel_timer(session)
+            reason = session.kill_reason or f"Session process exited (code {worker.process.returncode})"
+            replaying = session.state == "restoring"
+        if cell is not None and not cell["replay"]:
+            self._reply(session, cell, {"status": "error", "message": f"{reason}; its variables are being restored.",
+                                        "session_restarted": True, "timed_out": bool(cell.get("timed_out"))})
+        if replaying:
+            # The history itself kills the process; replaying it again would loop forever
+            with self._lock:
+                session.state = "dead"
+                failed = list(session.pending)
+                session.pending.clear()
+            for pending in failed:
+                if not pending["replay"]:
+                    self._reply(session, pending, {"status": "error", "message": "Session could not be restored."})
+            self.send({"status": "error", "type": "session_error", "session": session.name,
+                       "message": f"{reason} while restoring; use restore_session after fixing the cause."})
+            return
+        self._restart(session)
+
+    # --- Cells ---
+
+    def _dispatch(self, session):
+        """Sends the next queued cell if the session's worker is free. Caller holds the lock."""
+        if session.current is not None or session.worker is None or not session.pending:
+            return
+        if session.state not in ("ready", "restoring"):
+            return
+        cell = session.current = session.pending.popleft()
+        if cell["timeout"]:
+            session.timer = threading.Timer(cell["timeout"], self._on_timeout, (session, cell))
+            session.timer.daemon = True
+            session.timer.start()
+        try:
+            message = {"command": "execute", "cell_id": cell["cell_id"], "code": cell["code"], "stream": cell["stream"]}
+            if cell["max_output"] is not None:
+                message["max_output"] = int(cell["max_output"])
+            session.worker.send(message)
+        except OSError:
+            pass  # The result reader sees the process exit and restores the session
+
+    def _on_timeout(self, session, cell):
+        with self._lock:
+            if session.current is cell:
+                cell["timed_out"] = True
+                self._interrupt(session, cell, f"timed out after {cell['timeout']:g}s")
+
+    def _interrupt(self, session, cell, reason):
+        """Asks the running cell to stop; kills the process if it hasn't within INTERRUPT_GRACE."""
+        try:
+            session.worker.send({"command": "interrupt", "cell_id": cell["cell_id"]})
+        except (OSError, AttributeError):
+            pass
+        self._cancel_timer(session)
+        session.timer = threading.Timer(INTERRUPT_GRACE, self._on_unresponsive, (session, cell, reason))
+        session.timer.daemon = True
+        session.timer.start()
+
+    def _on_unresponsive(self, session, cell, reason):
+        with self._lock:
+            if session.current is not cell or session.worker is None:
+                return
+            session.kill_reason = f"Cell {reason} and ignored the interrupt, so its process was restarted"
+            worker = session.worker
+        worker.kill()
+
+    def _cancel_timer(self, session):
+        if session.timer is not None:
+            session.timer.cancel()
+            session.timer = None
+
+    def _reply(self, session, cell, result):
+        result = dict(result, session=session.name)
+        if cell.get("id") is not None:
+            result["id"] = cell["id"]
+        self.send(result)
 
 def run_socket_mode(port):
-    local_namespace = {}  # Persistent namespace to store variables
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect(('localhost', port))
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
-            
+
+            # Results come back from per-session reader threads; one writer serializes them
+            output = LineWriter(writer)
+            sessions = SessionManager(output.send, WorkerPool())
+            sessions.open(DEFAULT_SESSION, reply=False)
+
             # Send a ready signal
-            writer.write(json.dumps({"status": "ready"}) + '\n')
-            writer.flush()
-            
-            while True:
-                line = reader.readline()
-                if not line:
-                    break  # Connection closed
-
-                try:
-                    data = json.loads(line)
-                    if data.get("command") == "execute":
-                        code_to_run = data.get("code", "")
-                        
-                        # Capture stdout (e.g., from print statements)
-                        old_stdout = sys.stdout
-                        redirected_output = sys.stdout = StringIO()
-                        
-                        exec(code_to_run, globals(), local_namespace)
-                        
-                        sys.stdout = old_stdout  # Restore stdout
-                        output_str = redirected_output.getvalue()
-                        
-                        response = {"status": "success", "output": output_str}
-                except Exception as e:
-                    response = {"status": "error", "message": f"{type(e).__name__}: {e}"}
-                
-                writer.write(json.dumps(response) + '\n')
-                writer.flush()
+            output.send({"status": "ready"})
+
+            try:
+                while True:
+                    line = reader.readline()
+                    if not line:
+                        break  # Connection closed
+
+                    try:
+                        data = json.loads(line)
+                        command = data.get("command")
+                        name = str(data.get("session", DEFAULT_SESSION))
+                        if command == "execute":
+                            # Runs in the session's process; the result is sent when it finishes
+                            sessions.execute(name, data.get("code", ""), data.get("id"), data.get("timeout"),
+                                             data.get("stream", False), data.get("max_output"))
+                            continue
+                        elif command == "open_session":
+                            sessions.open(name, data.get("memory_mb"))
+                            continue
+                        elif command == "close_session":
+                            sessions.close(name)
+                            response = {"status": "success", "type": "session_closed", "session": name}
+                        elif command == "interrupt":
+                            response = {"status": "success", "type": "interrupt", "session": name,
+                                        "interrupted": sessions.interrupt(name)}
+                        elif command == "restore_session":
+                            sessions.restore(name)
+                            continue
+                        elif command == "list_sessions":
+                            response = {"status": "success", "type": "sessions", "sessions": sessions.describe()}
+                        else:
+                            raise ValueError("Unknown command")
+                    except KeyError as e:
+                        response = {"status": "error", "message": str(e.args[0])}
+                    except Exception as e:
+                        response = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+
+                    output.send(response)
+            finally:
+                sessions.shutdown()
+                output.close()
     except Exception as e:
         sys.stderr.write(f"REPL Engine Fatal Error: {e}\n")
         sys.stderr.flush()
@@ -49,4 +492,4 @@ if __name__ == "__main__":
     if len(sys.argv) == 3 and sys.argv[1] == 'socket':
         run_socket_mode(int(sys.argv[2]))
     else:
-        sys.stderr.write("This script must be run in socket mode.\n")
\ No newline at end of file
+        sys.stderr.write("This script must be run in socket mode.\n")
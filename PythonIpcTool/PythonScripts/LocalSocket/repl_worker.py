@@ -0,0 +1,244 @@
+﻿# repl_worker.py
+# One REPL session's interpreter. repl_engine_2.py starts these ahead of time
+# (with common modules already imported) and hands one to each new session.
+import io, sys, json, socket, os, time, queue, hashlib, builtins, importlib, threading, _thread
+from collections import OrderedDict
+from job_control import locked_sender
+
+OUTPUT_INTERVAL = 0.1      # Seconds between streamed output messages for a cell
+OUTPUT_CHUNK = 16 * 1024   # Characters; this much pending output is sent without waiting
+MAX_OUTPUT = 1024 * 1024   # Characters of output per cell; anything beyond is counted, not kept
+CODE_CACHE_SIZE = 256      # Compiled cells kept, keyed by a hash of their source
+
+def preload(names):
+    """Imports what it can of `names`, so cells that import them start instantly."""
+    loaded = []
+    for name in names:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception:
+            pass  # Optional packages (numpy, pandas, ...) may not be installed
+    return loaded
+
+def limit_memory(megabytes):
+    """Caps the address space of this process; returns False where that's unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return False  # Windows: the session still runs, just without a cap
+    limit = int(megabytes) * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        return False
+    return True
+
+class CellOutput:
+    """One cell's stdout/stderr, either streamed in chunks or kept for the result.
+
+    Streaming sends whatever has accumulated once OUTPUT_CHUNK characters are
+    pending or OUTPUT_INTERVAL has passed, so a loop printing every iteration
+    costs a handful of messages per second rather than one per print. Past
+    `limit` characters output is dropped and only counted.
+    """
+
+    def __init__(self, send, cell_id, stream, limit):
+        self.send = send
+        self.cell_id = cell_id
+        self.stream = stream
+        self.limit = limit
+        self.total = 0
+        self.dropped = 0
+        self._parts = []  # (stream name, text), in write order
+        self._pending = 0
+        self._last_sent = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, name, text):
+        with self._lock:
+            room = self.limit - self.total
+            if len(text) > room:
+                self.dropped += len(text) - max(room, 0)
+                text = text[:max(room, 0)]
+            if not text:
+                return
+            self.total += len(text)
+            self._parts.append((name, text))
+            self._pending += len(text)
+            # Time-based sends wait for a line end (print writes the "\n" separately)
+            due = self.stream and (self._pending >= OUTPUT_CHUNK or (
+                text.endswith("\n") and time.monotonic() - self._last_sent >= OUTPUT_INTERVAL))
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Sends pending output (streaming only); also called by the worker's ticker thread."""
+        with self._lock:
+            if not self.stream or not self._parts:
+                return
+            parts, self._parts, self._pending = self._parts, [], 0
+            self._last_sent = time.monotonic()
+            # Still under the lock, so chunks from the cell and the ticker can't swap order
+            for name, text in _merge(parts):
+                self.send({"event": "output", "cell_id": self.cell_id, "stream": name, "text": text})
+
+    def result(self):
+        if self.stream:
+            self.flush()
+            result = {"output_chars": self.total}
+        else:
+            merged = dict(_merge(sorted(self._parts, key=lambda part: part[0] != "stdout")))
+            result = {"output": merged.get("stdout", "")}
+            if merged.get("stderr"):
+                result["stderr"] = merged["stderr"]
+        if self.dropped:
+            result["truncated"] = self.dropped
+        return result
+
+def _merge(parts):
+    """Joins consecutive writes to the same stream."""
+    merged = []
+    for name, text in parts:
+        if merged and merged[-1][0] == name:
+            merged[-1][1].append(text)
+        else:
+            merged.append((name, [text]))
+    return [(name, "".join(texts)) for name, texts in merged]
+
+class _StreamWriter(io.TextIOBase):
+    """Stands in for sys.stdout / sys.stderr while a cell runs."""
+
+    def __init__(self, output, name):
+        self._output = output
+        self._name = name
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._output.write(self._name, str(text))
+        return len(text)
+
+class Interpreter:
+    """A persistent namespace that runs one cell at a time on the main thread.
+
+    The main thread is the one `_thread.interrupt_main()` targets, so an
+    interrupt raises KeyboardInterrupt inside the running cell. `busy` is
+    only changed under `lock`, which keeps an interrupt from landing after
+    the cell has already finished.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.namespace = {"__name__": "__main__", "__builtins__": builtins}
+        self.lock = threading.Lock()
+        self.busy = None  # cell_id of the running cell
+        self.output = None  # Its CellOutput
+        self._code_cache = OrderedDict()
+        threading.Thread(target=self._tick, daemon=True).start()
+
+    def _tick(self):
+        # Output written just before a long computation shouldn't wait for the next print
+        while True:
+            time.sleep(OUTPUT_INTERVAL)
+            output = self.output
+            if output is not None:
+                output.flush()
+
+    def compile(self, code):
+        """Compiles a cell, reusing the code object when the same source ran before."""
+        key = hashlib.sha1(code.encode("utf-8")).hexdigest()
+        compiled = self._code_cache.get(key)
+        if compiled is None:
+            compiled = compile(code, f"<cell-{key[:12]}>", "exec")
+            self._code_cache[key] = compiled
+            if len(self._code_cache) > CODE_CACHE_SIZE:
+                self._code_cache.popitem(last=False)
+        else:
+            self._code_cache.move_to_end(key)
+        return compiled
+
+    def interrupt(self, cell_id):
+        with self.lock:
+            if self.busy is not None and self.busy == cell_id:
+                _thread.interrupt_main()
+
+    def run(self, cell_id, code, stream=False, max_output=MAX_OUTPUT):
+        output = CellOutput(self.send, cell_id, stream, max_output)
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = _StreamWriter(output, "stdout"), _StreamWriter(output, "stderr")
+        self.output = output
+        try:
+            try:
+                with self.lock:
+                    self.busy = cell_id
+                exec(self.compile(code), self.namespace)
+            finally:
+                # Streams first, on their own: a late interrupt landing in here must not leave them redirected
+                try:
+                    sys.stdout, sys.stderr = old_stdout, old_stderr
+                    self.output = None
+                finally:
+                    with self.lock:
+                        self.busy = None
+            result = {"status": "success"}
+        except KeyboardInterrupt:
+            result = {"status": "error", "message": "KeyboardInterrupt: execution interrupted", "interrupted": True}
+        except BaseException as e:  # SystemExit included: a cell must not end the session
+            result = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+        result.update(output.result())
+        return result
+
+def read_commands(reader, cells, interpreter):
+    try:
+        for line in reader:
+            data = json.loads(line)
+            command = data.get("command")
+            if command == "execute":
+                cells.put(data)
+            elif command == "interrupt":
+                interpreter.interrupt(data.get("cell_id"))
+            elif command == "configure":
+                if data.get("memory_mb"):
+                    limit_memory(data["memory_mb"])
+            elif command == "shutdown":
+                break
+    except (OSError, ValueError):
+        pass
+    cells.put(None)
+
+def run_socket_mode(port, modules):
+    preloaded = preload(modules)  # Before connecting: the engine only hands out warm workers
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.connect(('localhost', port))
+        reader = s.makefile('r', encoding='utf-8')
+        send = locked_sender(s.makefile('w', encoding='utf-8'))
+        send({"event": "ready", "pid": os.getpid(), "preloaded": preloaded})
+
+        cells = queue.SimpleQueue()
+        interpreter = Interpreter(send)
+        threading.Thread(target=read_commands, args=(reader, cells, interpreter), daemon=True).start()
+        while True:
+            try:
+                cell = cells.get()
+            except KeyboardInterrupt:
+                continue  # An interrupt that raced with the end of the previous cell
+            if cell is None:
+                break
+            result = interpreter.run(cell.get("cell_id"), cell.get("code", ""), bool(cell.get("stream")),
+                                     int(cell.get("max_output", MAX_OUTPUT)))
+            result.update(event="result", cell_id=cell.get("cell_id"))
+            send(result)
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == 'socket':
+        modules = sys.argv[3].split(",") if len(sys.argv) > 3 and sys.argv[3] else []
+        try:
+            run_socket_mode(int(sys.argv[2]), modules)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Engine went away
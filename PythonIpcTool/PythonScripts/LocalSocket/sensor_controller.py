@@ -1,5 +1,12 @@
 ﻿# File: PythonScripts/sensor_controller.py
-import sys, json, socket, time, random, threading
+import sys, json, socket, random, selectors, threading
+from collections import deque
+from sensor_sampler import SensorSampler
+from sensor_history import SensorHistory
+
+MAX_CLIENT_BUFFER = 1024 * 1024  # Bytes queued for one client before the slow-consumer policy kicks in
+MAX_SEND = 64 * 1024  # Queued messages are joined into sends of up to this many bytes
+POLICIES = ("drop_oldest", "disconnect")
 
 # Mock GPIO
 # class GPIO:
@@ -7,44 +14,243 @@ import sys, json, socket, time, random, threading
 #     def setup(pin, mode): print(f"GPIO: Pin {pin} set to mode {mode}")
 #     def output(pin, state): print(f"GPIO: Pin {pin} set to state {state}")
 
-def sensor_reader(writer, stop_event):
-    while not stop_event.is_set():
+def read_sensors():
+    temp = 30 + random.uniform(-0.5, 0.5)
+    pressure = 1013 + random.uniform(-2, 2)
+    return {"temperature": round(temp, 1), "pressure": round(pressure)}
+
+class Client:
+    """One connection: a line buffer for commands and a queue of outgoing lines."""
+
+    def __init__(self, sock, addr, max_buffer, policy):
+        self.sock = sock
+        self.addr = addr
+        self.max_buffer = max_buffer
+        self.policy = policy
+        self.inbuf = b''
+        self.outbuf = deque()  # (bytes, droppable); the head may be partly sent
+        self.head_sent = 0
+        self.buffered = 0
+        self.dropped = 0
+
+    def describe(self):
+        return {"address": f"{self.addr[0]}:{self.addr[1]}", "policy": self.policy,
+                "buffered": self.buffered, "dropped": self.dropped}
+
+class SensorServer:
+    """Serves any number of clients from one selector loop.
+
+    Sensor readings are serialized once and fanned out to every client's own
+    buffer; command replies go only to the client that asked. The loop is the
+    only thing that writes to sockets, so lines can never interleave. A client
+    that stops reading either loses its oldest queued readings ("drop_oldest")
+    or is disconnected ("disconnect") once `max_buffer` bytes are queued for it.
+    """
+
+    def __init__(self, listener, max_buffer=MAX_CLIENT_BUFFER, policy="drop_oldest"):
+        self.listener = listener
+        self.max_buffer = max_buffer
+        self.policy = policy
+        self.clients = {}
+        self.selector = selectors.DefaultSelector()
+        # History keeps filling between connections, so a new client can ask for it straight away
+        self.history = SensorHistory(("temperature", "pressure"), rate_hz=lambda: self.sampler.rate_hz)
+        self.sampler = SensorSampler(read_sensors, self.publish, "sensor_data", "sensor_batch",
+                                     observe=self.history.record)
+        # Other threads hand broadcasts over through this list and poke the loop via a socketpair
+        self._published = []
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._woken = False
+
+    def publish(self, message):
+        """Queues a message for every client; safe to call from any thread."""
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self._lock:
+            self._published.append(data)
+            wake, self._woken = not self._woken, True
+        if wake:
+            self._wake_w.send(b'\0')
+
+    def serve_forever(self):
+        self.listener.setblocking(False)
+        self._wake_r.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, self._accept)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, self._drain_published)
+        self.sampler.start()
+        try:
+            while True:
+                for key, events in self.selector.select():
+                    if key.data in (self._accept, self._drain_published):
+                        key.data()
+                        continue
+                    client = key.data
+                    if events & selectors.EVENT_READ:
+                        self._read(client)
+                    if events & selectors.EVENT_WRITE and client.sock.fileno() != -1:
+                        self._write(client)
+        finally:
+            self.sampler.stop()
+            for client in list(self.clients.values()):
+                self._close(client)
+            self.selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _accept(self):
+        try:
+            sock, addr = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = Client(sock, addr, self.max_buffer, self.policy)
+        self.clients[sock] = client
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        print(f"Controller connected by {addr}", file=sys.stderr)
+
+    def _close(self, client):
+        if self.clients.pop(client.sock, None) is None:
+            return
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        print(f"Controller disconnected: {client.addr}", file=sys.stderr)
+
+    def _drain_published(self):
         try:
-            temp = 30 + random.uniform(-0.5, 0.5)
-            pressure = 1013 + random.uniform(-2, 2)
-            sensor_data = {"type": "sensor_data", "temperature": round(temp, 1), "pressure": round(pressure)}
-            writer.write(json.dumps(sensor_data) + '\n')
-            writer.flush()
-            time.sleep(1)
-        except:
-            break
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            published, self._published = self._published, []
+            self._woken = False
+        for data in published:
+            for client in list(self.clients.values()):
+                self._enqueue(client, data, droppable=True)
+
+    def _enqueue(self, client, data, droppable=False):
+        if client.sock not in self.clients:
+            return  # Already disconnected (e.g. earlier in the same batch)
+        if not client.outbuf:
+            self.selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+        client.outbuf.append((data, droppable))
+        client.buffered += len(data)
+        if client.buffered <= client.max_buffer:
+            return
+        if client.policy == "disconnect":
+            print(f"Disconnecting slow client {client.addr}", file=sys.stderr)
+            self._close(client)
+            return
+        # drop_oldest: discard queued readings (never replies, never the partly sent head)
+        kept = deque()
+        if client.head_sent:
+            kept.append(client.outbuf.popleft())
+        while client.outbuf and client.buffered > client.max_buffer:
+            item = client.outbuf.popleft()
+            if item[1]:
+                client.buffered -= len(item[0])
+                client.dropped += 1
+            else:
+                kept.append(item)
+        kept.extend(client.outbuf)
+        client.outbuf = kept
+
+    def _read(self, client):
+        try:
+            chunk = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except (ConnectionResetError, OSError):
+            chunk = b''
+        if not chunk:
+            self._close(client)
+            return
+        client.inbuf += chunk
+        *lines, client.inbuf = client.inbuf.split(b'\n')
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                self._handle_command(client, line)
+            except Exception as e:
+                # A bad command is that client's problem; the server keeps serving everyone
+                self._reply(client, {"type": "error", "message": f"{type(e).__name__}: {e}"})
+
+    def _write(self, client):
+        parts = []
+        size = 0
+        for data, _droppable in client.outbuf:
+            parts.append(data[client.head_sent:] if not parts else data)
+            size += len(parts[-1])
+            if size >= MAX_SEND:
+                break
+        try:
+            sent = client.sock.send(b''.join(parts))
+        except BlockingIOError:
+            return
+        except (ConnectionResetError, BrokenPipeError, OSError):
+            self._close(client)
+            return
+        client.buffered -= sent
+        sent += client.head_sent
+        while client.outbuf and sent >= len(client.outbuf[0][0]):
+            sent -= len(client.outbuf.popleft()[0])
+        client.head_sent = sent
+        if not client.outbuf:
+            self.selector.modify(client.sock, selectors.EVENT_READ, client)
+
+    def _reply(self, client, message):
+        self._enqueue(client, (json.dumps(message) + '\n').encode('utf-8'))
+
+    def _handle_command(self, client, line):
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            self._reply(client, {"type": "error", "message": f"Invalid JSON: {e}"})
+            return
+        if not isinstance(data, dict):
+            self._reply(client, {"type": "error", "message": "Expected a JSON object."})
+            return
+        if self.history.handle(data, lambda message: self._reply(client, message)):
+            return
+        command = data.get("command")
+        if command == "set_valve":
+            print(f"Received command: {data}", file=sys.stderr)
+            # GPIO.output(...)
+        elif command == "set_sampling":
+            # Sampling is shared hardware: every client sees the new rate
+            try:
+                self.sampler.configure(rate_hz=data.get("hz"), batch=data.get("batch"),
+                                       max_latency=data.get("max_latency"))
+                self.publish(dict(self.sampler.describe(), type="sampling"))
+            except (TypeError, ValueError) as e:
+                self._reply(client, {"type": "error", "message": str(e)})
+        elif command == "set_client":
+            policy = data.get("policy", client.policy)
+            if policy not in POLICIES:
+                self._reply(client, {"type": "error", "message": f"Unknown policy '{policy}'."})
+                return
+            try:
+                max_buffer = int(data.get("max_buffer", client.max_buffer))
+            except (TypeError, ValueError):
+                self._reply(client, {"type": "error", "message": "'max_buffer' must be an integer."})
+                return
+            client.policy = policy
+            client.max_buffer = max_buffer
+            self._reply(client, dict(client.describe(), type="client"))
+        elif command == "stats":
+            self._reply(client, {"type": "stats", "sampling": self.sampler.describe(),
+                                 "clients": [c.describe() for c in self.clients.values()]})
 
 def run_server(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.bind(('0.0.0.0', port)) # Listen on all network interfaces
         s.listen()
         print(f"Sensor controller listening on port {port}...", file=sys.stderr)
-        conn, addr = s.accept()
-        with conn:
-            print(f"Controller connected by {addr}", file=sys.stderr)
-            reader = conn.makefile('r', encoding='utf-8')
-            writer = conn.makefile('w', encoding='utf-8')
-            stop_event = threading.Event()
-            
-            sensor_thread = threading.Thread(target=sensor_reader, args=(writer, stop_event))
-            sensor_thread.start()
-            
-            try:
-                while True:
-                    line = reader.readline()
-                    if not line: break
-                    data = json.loads(line)
-                    if data.get("command") == "set_valve":
-                        print(f"Received command: {data}", file=sys.stderr)
-                        # GPIO.output(...)
-            finally:
-                stop_event.set()
-                sensor_thread.join()
+        try:
+            SensorServer(s).serve_forever()
+        except KeyboardInterrupt:
+            pass
 
 if __name__ == "__main__":
     if len(sys.argv) == 2:
@@ -0,0 +1,178 @@
+﻿# sensor_history.py
+# Fixed-memory history of recent sensor readings, so a client that connects
+# (or reconnects) can get statistics and a plot-ready series immediately.
+import time, threading
+import numpy as np
+
+DEFAULT_CAPACITY = 1_000_000  # Samples per channel (8 bytes each, plus 8 for the timestamp)
+MAX_CAPACITY = 50_000_000
+DEFAULT_PERCENTILES = (50, 95, 99)
+MAX_POINTS = 10000
+
+class SensorHistory:
+    """Ring buffers holding the last `capacity` samples of every channel.
+
+    Samples arrive in time order, so both halves of the ring are sorted and a
+    time window is found with two binary searches; queries only ever copy
+    the window they cover.
+    """
+
+    def __init__(self, channels, capacity=DEFAULT_CAPACITY, rate_hz=None):
+        self.channels = list(channels)
+        self.rate_hz = rate_hz  # Optional callable; lets set_history size the ring in seconds
+        self._lock = threading.Lock()
+        self._times = None
+        self.resize(capacity)
+
+    def resize(self, capacity):
+        """Changes the capacity, keeping as many of the newest samples as fit."""
+        capacity = int(capacity)
+        if not 0 < capacity <= MAX_CAPACITY:
+            raise ValueError(f"History capacity must be in (0, {MAX_CAPACITY}] samples.")
+        with self._lock:
+            kept = self._ordered() if self._times is not None else None
+            self.capacity = capacity
+            self._times = np.zeros(capacity)
+            self._values = {channel: np.zeros(capacity) for channel in self.channels}
+            self._head = 0  # Next slot to write
+            self._count = 0
+            if kept is not None:
+                times, values = kept
+                self._write(times[-capacity:], {c: v[-capacity:] for c, v in values.items()})
+
+    def record(self, readings, t0, interval):
+        """Stores a batch of reading dicts sampled every `interval` seconds from `t0`."""
+        times = t0 + interval * np.arange(len(readings))
+        values = {channel: np.fromiter((r.get(channel, np.nan) for r in readings), float, len(readings))
+                  for channel in self.channels}
+        with self._lock:
+            self._write(times, values)
+
+    def _write(self, times, values):
+        n = len(times)
+        if n >= self.capacity:
+            times = times[-self.capacity:]
+            values = {c: v[-self.capacity:] for c, v in values.items()}
+            n = self.capacity
+        first = min(n, self.capacity - self._head)
+        for target, source in [(self._times, times)] + [(self._values[c], values[c]) for c in self.channels]:
+            target[self._head:self._head + first] = source[:first]
+            target[:n - first] = source[first:]
+        self._head = (self._head + n) % self.capacity
+        self._count = min(self.capacity, self._count + n)
+
+    def _segments(self):
+        """Physical slices of the ring in time order (oldest first)."""
+        if self._count < self.capacity:
+            return [slice(0, self._count)]
+        return [slice(self._head, self.capacity), slice(0, self._head)]
+
+    def _ordered(self):
+        """Copies everything held as (times, {channel: values}), oldest first."""
+        segments = self._segments()
+        return (np.concatenate([self._times[s] for s in segments]),
+                {c: np.concatenate([self._values[c][s] for s in segments]) for c in self.channels})
+
+    def window(self, start=None, end=None, channels=None):
+        """Copies the samples with start <= time <= end (None means unbounded)."""
+        channels = self._check(channels)
+        with self._lock:
+            times, values = [], {c: [] for c in channels}
+            for segment in self._segments():
+                seg_times = self._times[segment]
+                lo = 0 if start is None else np.searchsorted(seg_times, start, 'left')
+                hi = len(seg_times) if end is None else np.searchsorted(seg_times, end, 'right')
+                times.append(seg_times[lo:hi].copy())
+                for c in channels:
+                    values[c].append(self._values[c][segment][lo:hi].copy())
+        return (np.concatenate(times) if times else np.empty(0),
+                {c: np.concatenate(v) if v else np.empty(0) for c, v in values.items()})
+
+    def _check(self, channels):
+        if channels is None:
+            return self.channels
+        if isinstance(channels, str):
+            channels = [channels]
+        unknown = [c for c in channels if c not in self.channels]
+        if unknown:
+            raise KeyError(f"Unknown channel(s): {', '.join(map(str, unknown))}.")
+        return list(channels)
+
+    def stats(self, start=None, end=None, channels=None, percentiles=DEFAULT_PERCENTILES):
+        times, values = self.window(start, end, channels)
+        result = {"count": len(times), "start": float(times[0]) if len(times) else None,
+                  "end": float(times[-1]) if len(times) else None, "channels": {}}
+        for channel, column in values.items():
+            column = column[~np.isnan(column)]
+            if not len(column):
+                result["channels"][channel] = None
+                continue
+            summary = {"min": float(column.min()), "max": float(column.max()), "mean": float(column.mean())}
+            for p, value in zip(percentiles, np.percentile(column, percentiles)):
+                summary[f"p{p:g}"] = float(value)
+            result["channels"][channel] = summary
+        return result
+
+    def series(self, start=None, end=None, channels=None, points=1000):
+        """Downsamples the window into <= `points` equal time buckets of min/max/mean."""
+        points = max(1, min(int(points), MAX_POINTS))
+        times, values = self.window(start, end, channels)
+        result = {"t": [], "channels": {c: {"min": [], "max": [], "mean": []} for c in values}}
+        if not len(times):
+            return result
+        if len(times) <= points:
+            starts = np.arange(len(times))
+        else:
+            edges = np.linspace(times[0], times[-1], points + 1)[:-1]
+            starts = np.unique(np.searchsorted(times, edges, 'left'))
+        counts = np.diff(np.append(starts, len(times)))
+        result["t"] = np.round(times[starts], 6).tolist()
+        for channel, column in values.items():
+            # fmin/fmax skip NaN gaps; the mean treats them as missing, not zero
+            present = ~np.isnan(column)
+            sums = np.add.reduceat(np.where(present, column, 0.0), starts)
+            seen = np.add.reduceat(present.astype(np.int64), starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = sums / seen
+            result["channels"][channel] = {
+                "min": _jsonable(np.fmin.reduceat(column, starts)),
+                "max": _jsonable(np.fmax.reduceat(column, starts)),
+                "mean": _jsonable(means)}
+        result["counts"] = counts.tolist()
+        return result
+
+    def _range(self, data):
+        """Resolves start/end from a command: absolute unix times, or `last` seconds."""
+        start, end = data.get("start"), data.get("end")
+        if data.get("last") is not None:
+            end = time.time() if end is None else end
+            start = end - float(data["last"])
+        return start, end
+
+    def handle(self, data, reply):
+        """Answers history commands; returns False if `data` isn't one."""
+        command = data.get("command")
+        if command not in ("history_stats", "history_series", "set_history"):
+            return False
+        try:
+            if command == "set_history":
+                capacity = data.get("capacity", self.capacity)
+                if data.get("seconds") is not None and self.rate_hz:
+                    capacity = float(data["seconds"]) * self.rate_hz()
+                self.resize(min(capacity, MAX_CAPACITY))
+                reply({"type": "history", "capacity": self.capacity, "channels": self.channels})
+                return True
+            start, end = self._range(data)
+            if command == "history_stats":
+                result = self.stats(start, end, data.get("channels"),
+                                    data.get("percentiles", DEFAULT_PERCENTILES))
+            else:
+                result = self.series(start, end, data.get("channels"), data.get("points", 1000))
+            reply(dict(result, type=command))
+        except (KeyError, TypeError, ValueError) as e:
+            reply({"type": "error", "command": command,
+                   "message": e.args[0] if isinstance(e, KeyError) else str(e)})
+        return True
+
+def _jsonable(column):
+    return [None if np.isnan(v) else round(float(v), 6) for v in column]
@@ -0,0 +1,110 @@
+﻿# sensor_sampler.py
+# Fixed-rate sensor sampling on a background thread, with readings batched
+# into one message per `batch` samples (or per `max_latency` seconds).
+import time, threading
+
+MAX_RATE_HZ = 20000
+MAX_BACKLOG = 0.5  # Seconds of missed samples caught up before the rest are dropped
+
+class SensorSampler:
+    """Calls `read()` at `rate_hz` and passes batches of readings to `send`.
+
+    Sampling is paced on a deadline rather than by sleeping once per sample,
+    so a kHz rate survives coarse OS timer resolution: each wakeup takes every
+    sample that has come due. With `batch == 1` every reading goes out as its
+    own `message_type` message, exactly like a plain polling loop; otherwise
+    a `batch_type` message carries one list per channel plus `t0`/`interval`.
+    """
+
+    def __init__(self, read, send, message_type, batch_type, rate_hz=1.0, batch=1, max_latency=0.1,
+                 observe=None):
+        self.read = read
+        self.send = send
+        self.observe = observe  # Optional observe(readings, t0, interval), called before each send
+        self.message_type = message_type
+        self.batch_type = batch_type
+        self.samples = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.configure(rate_hz=rate_hz, batch=batch, max_latency=max_latency)
+
+    def configure(self, rate_hz=None, batch=None, max_latency=None):
+        """Changes the rate/batching; the sampling thread picks it up immediately."""
+        if rate_hz is not None:
+            rate_hz = float(rate_hz)
+            if not 0 < rate_hz <= MAX_RATE_HZ:
+                raise ValueError(f"Sample rate must be in (0, {MAX_RATE_HZ}] Hz.")
+            self.rate_hz = rate_hz
+        if batch is not None:
+            self.batch = max(1, int(batch))
+        if max_latency is not None:
+            self.max_latency = max(0.0, float(max_latency))
+        self._wake.set()  # Don't sit out the rest of a long interval at the old rate
+
+    def describe(self):
+        return {"hz": self.rate_hz, "batch": self.batch, "max_latency": self.max_latency,
+                "samples": self.samples, "dropped": self.dropped}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def _emit(self, readings, t0, interval):
+        if self.observe:
+            self.observe(readings, t0, interval)
+        if len(readings) == 1 and self.batch == 1:
+            self.send(dict(readings[0], type=self.message_type))
+            return
+        message = {"type": self.batch_type, "t0": round(t0, 6), "interval": interval, "count": len(readings)}
+        for channel in readings[0]:
+            message[channel] = [reading[channel] for reading in readings]
+        self.send(message)
+
+    def _run(self):
+        readings = []
+        t0 = None
+        next_sample = time.monotonic()
+        # Wall-clock time of a monotonic instant, for the t0 reported to the host
+        wall_offset = time.time() - time.monotonic()
+        try:
+            while not self._stop.is_set():
+                interval = 1.0 / self.rate_hz
+                now = time.monotonic()
+                if self._wake.is_set():
+                    self._wake.clear()
+                    next_sample = min(next_sample, now)
+                if now - next_sample > MAX_BACKLOG:
+                    # Stalled (slow read() or the process was descheduled); skip rather than burst
+                    missed = int((now - next_sample) / interval)
+                    self.dropped += missed
+                    next_sample += missed * interval
+
+                while next_sample <= now and len(readings) < self.batch:
+                    if not readings:
+                        t0 = next_sample + wall_offset
+                    readings.append(self.read())
+                    self.samples += 1
+                    next_sample += interval
+
+                if readings and (len(readings) >= self.batch or
+                                 time.monotonic() + wall_offset - t0 >= self.max_latency):
+                    self._emit(readings, t0, interval)
+                    readings = []
+                    continue  # More samples may already be due
+
+                wake = next_sample
+                if readings:
+                    wake = min(wake, t0 - wall_offset + self.max_latency)
+                self._wake.wait(max(0.0, wake - time.monotonic()))
+            if readings:
+                self._emit(readings, t0, 1.0 / self.rate_hz)
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
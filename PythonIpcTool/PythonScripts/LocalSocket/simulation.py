@@ -1,67 +1,189 @@
 ﻿# simulation.py
-import sys, json, socket, time
-
-def run_simulation(reader, writer):
-    # Simulation parameters with defaults
-    params = {"damping": 0.1, "gravity": 9.8}
-    position = 100.0
-    velocity = 0.0
-    
-    # --- Main Simulation Loop ---
-    last_time = time.time()
-    while True:
+import sys, json, socket, time, selectors, math
+import numpy as np
+from state_stream import encoder_from_settings, frame_message
+
+# Physics and publishing run at independent, fixed rates. The physics rate is
+# what keeps the integration stable; the publish rate is what the UI can draw.
+DEFAULT_PARAMS = {
+    "damping": 0.1,
+    "gravity": 9.8,
+    "restitution": 0.8,
+    "physics_hz": 120.0,
+    "publish_hz": 60.0,
+}
+RATE_PARAMS = ("physics_hz", "publish_hz")  # Used as 1 / value every frame
+MAX_STEPS_PER_FRAME = 8  # Cap catch-up work so a stall can't snowball
+
+class ParticleSystem:
+    """N bodies stored as (N, 2) float32 arrays and advanced in one vectorized step."""
+
+    def __init__(self, count=1, seed=None):
+        self.reset(count, seed)
+
+    def reset(self, count, seed=None):
+        count = max(1, int(count))
+        rng = np.random.default_rng(seed)
+        self.position = np.empty((count, 2), dtype=np.float32)
+        self.velocity = np.zeros((count, 2), dtype=np.float32)
+        # Body 0 keeps the original single-body start so existing hosts see the same curve
+        self.position[0] = (0.0, 100.0)
+        if count > 1:
+            self.position[1:, 0] = rng.uniform(-50.0, 50.0, count - 1)
+            self.position[1:, 1] = rng.uniform(10.0, 200.0, count - 1)
+            self.velocity[1:, 0] = rng.uniform(-5.0, 5.0, count - 1)
+
+    @property
+    def count(self):
+        return len(self.position)
+
+    def step(self, dt, params):
+        vel = self.velocity
+        pos = self.position
+        vel[:, 1] -= params["gravity"] * dt
+        vel *= 1.0 - params["damping"] * dt
+        pos += vel * dt
+
+        # Bounce everything that went through the floor in one masked update
+        below = pos[:, 1] < 0.0
+        if below.any():
+            pos[below, 1] = 0.0
+            vel[below, 1] *= -params["restitution"]
+
+    def snapshot(self):
+        heights = self.position[:, 1]
+        return {
+            "count": self.count,
+            "position": round(float(self.position[0, 1]), 2),
+            "velocity": round(float(self.velocity[0, 1]), 2),
+            "mean_height": round(float(heights.mean()), 2),
+            "max_height": round(float(heights.max()), 2),
+        }
+
+class StatePublisher:
+    """Writes either the JSON summary or binary position frames for each publish."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.encoder = None
+
+    def configure(self, settings):
+        self.encoder = encoder_from_settings(settings)
+
+    def publish(self, tick, system):
+        if self.encoder:
+            self.writer.write(frame_message(self.encoder.encode(tick, system.position)))
+        else:
+            state_update = {"type": "sim_state", "tick": tick}
+            state_update.update(system.snapshot())
+            self.writer.write(json.dumps(state_update) + '\n')
+        self.writer.flush()
+
+    def reply(self, message):
+        self.writer.write(json.dumps(message) + '\n')
+        self.writer.flush()
+
+def handle_command(update_data, params, system, publisher):
+    command = update_data.get("command")
+    if command == "set_param":
+        key, value = update_data.get("key"), update_data.get("value")
+        if key in params:
+            value = float(value)
+            if key in RATE_PARAMS and not (math.isfinite(value) and value > 0):
+                raise ValueError(f"'{key}' must be a positive number, got {value}.")
+            params[key] = value
+            print(f"Updated {key} to {value}", file=sys.stderr)
+    elif command == "reset":
+        system.reset(update_data.get("count", system.count), update_data.get("seed"))
+        print(f"Reset simulation with {system.count} bodies", file=sys.stderr)
+    elif command == "set_stream":
+        publisher.configure(update_data)
+        print(f"State stream format: {update_data.get('format', 'json')}", file=sys.stderr)
+
+def drain_commands(sock, buffer, params, system, publisher):
+    """Reads whatever is available on the socket and applies complete lines.
+
+    Returns the leftover partial line, or None once the peer has disconnected.
+    """
+    chunk = sock.recv(65536)
+    if not chunk:
+        return None
+    buffer += chunk
+    *lines, buffer = buffer.split(b'\n')
+    for line in lines:
+        if not line.strip():
+            continue
         try:
-            # --- Non-blocking read for parameter updates ---
-            # Set a timeout so we don't block forever waiting for C#
-            reader_socket = reader.fileno()
-            s = socket.fromfd(reader_socket, socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(0.01) # 10ms timeout
-            try:
-                line = reader.readline()
-                if not line: break
-                
-                update_data = json.loads(line)
-                if update_data.get("command") == "set_param":
-                    key, value = update_data.get("key"), update_data.get("value")
-                    if key in params:
-                        params[key] = float(value)
-                        print(f"Updated {key} to {value}", file=sys.stderr)
-            except (socket.timeout, json.JSONDecodeError):
-                pass # No new data, just continue simulation
-
-            # --- Physics calculation ---
-            current_time = time.time()
-            dt = current_time - last_time
-            last_time = current_time
-            
-            force = -params["gravity"] - (velocity * params["damping"])
-            velocity += force * dt
-            position += velocity * dt
-            
-            if position < 0:
-                position = 0
-                velocity *= -0.8 # Bounce
-
-            # --- Push state to C# ---
-            state_update = {"type": "sim_state", "position": round(position, 2), "velocity": round(velocity, 2)}
-            writer.write(json.dumps(state_update) + '\n')
-            writer.flush()
-            
-            time.sleep(1/60) # 60 FPS
-            
-        except (BrokenPipeError, ConnectionResetError):
-            break
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object.")
+            handle_command(data, params, system, publisher)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            print(f"Ignoring bad command: {e}", file=sys.stderr)
+            publisher.reply({"type": "error", "message": str(e)})
+    return buffer
+
+def run_simulation(sock, writer, params=None, system=None):
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    system = system or ParticleSystem()
+    publisher = StatePublisher(writer)
+
+    # Register the socket once; select() then doubles as our frame sleep and
+    # wakes us up immediately when the host sends a parameter update.
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    buffer = b''
+
+    tick = 0
+    accumulator = 0.0
+    last_time = time.perf_counter()
+    next_publish = last_time
+    try:
+        while True:
+            physics_dt = 1.0 / params["physics_hz"]
+            publish_interval = 1.0 / params["publish_hz"]
+
+            now = time.perf_counter()
+            timeout = max(0.0, min(next_publish - now, physics_dt - accumulator))
+            for _key, _events in selector.select(timeout):
+                buffer = drain_commands(sock, buffer, params, system, publisher)
+                if buffer is None:
+                    return
+
+            # --- Fixed-timestep physics driven by an accumulator ---
+            now = time.perf_counter()
+            accumulator += now - last_time
+            last_time = now
+            steps = 0
+            while accumulator >= physics_dt and steps < MAX_STEPS_PER_FRAME:
+                system.step(physics_dt, params)
+                accumulator -= physics_dt
+                tick += 1
+                steps += 1
+            if steps == MAX_STEPS_PER_FRAME:
+                accumulator = 0.0  # Drop the backlog rather than spiral further behind
+
+            # --- Push state to C# at the publish rate ---
+            if now >= next_publish:
+                publisher.publish(tick, system)
+                next_publish += publish_interval
+                if next_publish < now:
+                    next_publish = now + publish_interval
+
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        selector.close()
 
 def run_socket_mode(port):
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect(('localhost', port))
-            reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
-            run_simulation(reader, writer)
+            run_simulation(s, writer)
     except Exception as e:
         sys.stderr.write(f"Simulation Error: {e}\n")
 
 if __name__ == "__main__":
     if len(sys.argv) == 3 and sys.argv[1] == 'socket':
-        run_socket_mode(int(sys.argv[2]))
\ No newline at end of file
+        run_socket_mode(int(sys.argv[2]))
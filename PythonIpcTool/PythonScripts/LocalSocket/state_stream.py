@@ -0,0 +1,153 @@
+﻿# state_stream.py
+# Compact binary state frames for per-tick streaming from simulation/game scripts.
+#
+# Every frame is a fixed little-endian header followed by packed arrays:
+#
+#   magic   2s   b'SS'
+#   version B    FORMAT_VERSION
+#   kind    B    KIND_KEYFRAME or KIND_DELTA
+#   flags   B    FLAG_QUANTIZED when values are integer multiples of `step`
+#   comps   H    values per entity (e.g. 2 for x/y)
+#   tick    I    simulation tick the frame describes
+#   count   I    total number of entities
+#   changed I    entities carried in this frame (== count for keyframes)
+#   step    f    quantization step (0.0 when not quantized)
+#
+# Keyframe payload:  values[count * comps]  (float32, or int32 when quantized)
+# Delta payload:     indices[changed] uint32, then
+#                    values[changed * comps] (float32 absolute values, or int16
+#                    differences from the previous frame when quantized)
+#
+# The host line protocol is text, so frames travel base64-encoded inside a
+# one-line JSON envelope (see frame_message).
+import base64, json, struct
+import numpy as np
+
+MAGIC = b'SS'
+FORMAT_VERSION = 1
+KIND_KEYFRAME = 0
+KIND_DELTA = 1
+FLAG_QUANTIZED = 0x01
+HEADER = struct.Struct('<2sBBBHIIIf')
+
+_INT16_MAX = np.iinfo(np.int16).max
+
+class StateStreamEncoder:
+    """Turns successive (count, comps) arrays into keyframe/delta frames.
+
+    The encoder keeps the state exactly as a decoder will have rebuilt it, so
+    deltas never accumulate drift; a keyframe is still sent every
+    `keyframe_interval` frames so a late-joining or lossy host resyncs.
+    """
+
+    def __init__(self, keyframe_interval=60, quantize_step=None, epsilon=0.0):
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.quantize_step = float(quantize_step) if quantize_step else None
+        self.epsilon = float(epsilon)
+        self._reference = None
+        self._frames_since_key = 0
+
+    def force_keyframe(self):
+        self._reference = None
+
+    def encode(self, tick, values):
+        values = np.asarray(values, dtype=np.float32)
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+
+        if self.quantize_step:
+            current = np.rint(values / self.quantize_step).astype(np.int32)
+        else:
+            current = values
+
+        needs_key = (
+            self._reference is None
+            or self._reference.shape != current.shape
+            or self._frames_since_key >= self.keyframe_interval
+        )
+        frame = None if needs_key else self._encode_delta(tick, current)
+        if frame is None:
+            frame = self._encode_keyframe(tick, current)
+        return frame
+
+    def _header(self, kind, tick, current, changed):
+        flags = FLAG_QUANTIZED if self.quantize_step else 0
+        count, comps = current.shape
+        return HEADER.pack(MAGIC, FORMAT_VERSION, kind, flags, comps,
+                           tick & 0xFFFFFFFF, count, changed, self.quantize_step or 0.0)
+
+    def _encode_keyframe(self, tick, current):
+        self._reference = current.copy()
+        self._frames_since_key = 1
+        return self._header(KIND_KEYFRAME, tick, current, len(current)) + current.tobytes()
+
+    def _encode_delta(self, tick, current):
+        if self.quantize_step:
+            diff = current - self._reference
+            changed = np.flatnonzero((diff != 0).any(axis=1))
+            payload = diff[changed]
+            if payload.size and np.abs(payload).max() > _INT16_MAX:
+                return None  # Too large a jump for int16 deltas
+            payload = payload.astype(np.int16)
+        else:
+            moved = np.abs(current - self._reference) > self.epsilon
+            changed = np.flatnonzero(moved.any(axis=1))
+            payload = current[changed]
+
+        # Past a certain fraction of changed entities the index list costs
+        # more than it saves; a keyframe is then both smaller and simpler.
+        delta_size = changed.size * 4 + payload.nbytes
+        if delta_size >= current.nbytes:
+            return None
+
+        self._reference[changed] = current[changed]
+        self._frames_since_key += 1
+        return (self._header(KIND_DELTA, tick, current, changed.size)
+                + changed.astype(np.uint32).tobytes() + payload.tobytes())
+
+class StateStreamDecoder:
+    """Reference decoder: applies frames and returns the current float32 state."""
+
+    def __init__(self):
+        self._state = None
+        self.tick = None
+
+    def apply(self, frame):
+        magic, version, kind, flags, comps, tick, count, changed, step = HEADER.unpack_from(frame)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a state stream frame.")
+        quantized = bool(flags & FLAG_QUANTIZED)
+        body = memoryview(frame)[HEADER.size:]
+
+        if kind == KIND_KEYFRAME:
+            dtype = np.int32 if quantized else np.float32
+            self._state = np.frombuffer(body, dtype=dtype, count=count * comps).reshape(count, comps).copy()
+        elif kind == KIND_DELTA:
+            if self._state is None or self._state.shape != (count, comps):
+                raise ValueError("Delta frame received before a matching keyframe.")
+            indices = np.frombuffer(body, dtype=np.uint32, count=changed)
+            body = body[changed * 4:]
+            if quantized:
+                self._state[indices] += np.frombuffer(body, dtype=np.int16, count=changed * comps).reshape(changed, comps)
+            else:
+                self._state[indices] = np.frombuffer(body, dtype=np.float32, count=changed * comps).reshape(changed, comps)
+        else:
+            raise ValueError(f"Unknown frame kind {kind}.")
+
+        self.tick = tick
+        if quantized:
+            return self._state.astype(np.float32) * np.float32(step)
+        return self._state
+
+def encoder_from_settings(settings):
+    """Builds an encoder from a host "set_stream" command, or None for plain JSON."""
+    if settings.get("format", "json") != "binary":
+        return None
+    return StateStreamEncoder(
+        keyframe_interval=settings.get("keyframe_interval", 60),
+        quantize_step=settings.get("quantize"),
+        epsilon=settings.get("epsilon", 0.0))
+
+def frame_message(frame, message_type="state_frame"):
+    """Wraps a binary frame in the newline-delimited JSON envelope the host reads."""
+    return json.dumps({"type": message_type, "data": base64.b64encode(frame).decode('ascii')}) + '\n'
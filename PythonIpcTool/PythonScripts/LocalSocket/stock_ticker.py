@@ -1,34 +1,316 @@
 ﻿# stock_ticker.py
-import sys, json, socket, time, random
+import sys, json, socket, time, threading
+from collections import deque
+import numpy as np
+from job_control import JobManager
 
-def stream_stock_data(writer, symbol):
-    # In a real scenario, you'd use a library like websocket-client here.
-    # We will simulate receiving data every second.
-    price = 150.0
-    while True:
+DEFAULT_TICK_HZ = 1.0
+MAX_TICK_HZ = 5000.0
+
+class IndicatorEngine:
+    """O(1)-per-tick RSI, EMA, SMA/Bollinger and VWAP for many symbols at once.
+
+    State is one row per symbol: running Wilder averages for RSI, the EMA
+    value, a ring buffer with running sum/sum-of-squares for the SMA window,
+    and cumulative price*volume for VWAP. `update` advances any subset of
+    symbols with a handful of array operations, independent of window sizes.
+    """
+
+    _COLUMNS = ("seen", "last", "avg_gain", "avg_loss", "ema",
+                "ring_sum", "ring_sumsq", "cum_pv", "cum_volume")
+
+    def __init__(self, rsi_period=14, ema_span=20, sma_window=20, bollinger_k=2.0):
+        self.rsi_period = max(1, int(rsi_period))
+        self.ema_alpha = 2.0 / (max(1, int(ema_span)) + 1)
+        self.sma_window = max(1, int(sma_window))
+        self.bollinger_k = float(bollinger_k)
+        self.seen = np.zeros(0, dtype=np.int64)
+        self.last = np.zeros(0)
+        self.avg_gain = np.zeros(0)
+        self.avg_loss = np.zeros(0)
+        self.ema = np.zeros(0)
+        self.ring = np.zeros((0, self.sma_window))
+        self.ring_sum = np.zeros(0)
+        self.ring_sumsq = np.zeros(0)
+        self.cum_pv = np.zeros(0)
+        self.cum_volume = np.zeros(0)
+
+    def resize(self, count):
+        extra = count - len(self.seen)
+        if extra <= 0:
+            return
+        for name in self._COLUMNS:
+            current = getattr(self, name)
+            setattr(self, name, np.concatenate([current, np.zeros(extra, dtype=current.dtype)]))
+        self.ring = np.vstack([self.ring, np.zeros((extra, self.sma_window))])
+
+    def reset(self, idx):
+        for name in self._COLUMNS:
+            getattr(self, name)[idx] = 0
+        self.ring[idx] = 0.0
+
+    def update(self, idx, price, volume):
+        idx = np.asarray(idx)
+        seen = self.seen[idx]
+        first = seen == 0
+
+        # RSI: cumulative mean of gains/losses until the period fills, Wilder smoothing after
+        delta = np.where(first, 0.0, price - self.last[idx])
+        divisor = np.clip(seen, 1, self.rsi_period)
+        gain = self.avg_gain[idx]
+        loss = self.avg_loss[idx]
+        self.avg_gain[idx] = np.where(first, 0.0, gain + (np.maximum(delta, 0.0) - gain) / divisor)
+        self.avg_loss[idx] = np.where(first, 0.0, loss + (np.maximum(-delta, 0.0) - loss) / divisor)
+
+        ema = self.ema[idx]
+        self.ema[idx] = np.where(first, price, ema + self.ema_alpha * (price - ema))
+
+        # SMA/Bollinger: swap the oldest ring slot for the new price
+        slot = seen % self.sma_window
+        old = self.ring[idx, slot]
+        self.ring[idx, slot] = price
+        self.ring_sum[idx] += price - old
+        self.ring_sumsq[idx] += price * price - old * old
+        # Once per lap re-sum the ring so floating-point drift can't build up
+        wrapped = idx[slot == self.sma_window - 1]
+        if wrapped.size:
+            self.ring_sum[wrapped] = self.ring[wrapped].sum(axis=1)
+            self.ring_sumsq[wrapped] = (self.ring[wrapped] ** 2).sum(axis=1)
+
+        self.cum_pv[idx] += price * volume
+        self.cum_volume[idx] += volume
+        self.last[idx] = price
+        self.seen[idx] = seen + 1
+
+    def backfill(self, i, prices, volumes=None):
+        """Rebuilds symbol row `i` from historical arrays in one vectorized pass.
+
+        Produces exactly the state that feeding the same prices through
+        `update` one by one would have produced.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        volumes = np.ones_like(prices) if volumes is None else np.asarray(volumes, dtype=np.float64)
+        n = len(prices)
+        self.reset(i)
+        if n == 0:
+            return
+
+        decay = (1.0 - self.ema_alpha) ** np.arange(n - 1, -1, -1)
+        self.ema[i] = decay[0] * prices[0] + (self.ema_alpha * decay[1:] * prices[1:]).sum()
+
+        delta = np.diff(prices)
+        p = self.rsi_period
+        for name, moves in (("avg_gain", np.maximum(delta, 0.0)), ("avg_loss", np.maximum(-delta, 0.0))):
+            if len(moves) <= p:
+                avg = moves.mean() if len(moves) else 0.0
+            else:
+                tail = moves[p:]
+                weights = (1.0 - 1.0 / p) ** np.arange(len(tail) - 1, -1, -1)
+                avg = weights[0] * (1.0 - 1.0 / p) * moves[:p].mean() + (weights * tail).sum() / p
+            getattr(self, name)[i] = avg
+
+        filled = min(n, self.sma_window)
+        slots = np.arange(n - filled, n) % self.sma_window
+        self.ring[i, slots] = prices[-filled:]
+        self.ring_sum[i] = prices[-filled:].sum()
+        self.ring_sumsq[i] = (prices[-filled:] ** 2).sum()
+
+        self.cum_pv[i] = (prices * volumes).sum()
+        self.cum_volume[i] = volumes.sum()
+        self.last[i] = prices[-1]
+        self.seen[i] = n
+
+    def snapshot(self, idx):
+        """Current indicator values for `idx`, as arrays keyed by name."""
+        filled = np.clip(self.seen[idx], 1, self.sma_window)
+        sma = self.ring_sum[idx] / filled
+        std = np.sqrt(np.maximum(self.ring_sumsq[idx] / filled - sma * sma, 0.0))
+        gain = self.avg_gain[idx]
+        loss = self.avg_loss[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(loss > 0, 100.0 - 100.0 / (1.0 + gain / loss), np.where(gain > 0, 100.0, 50.0))
+            vwap = np.where(self.cum_volume[idx] > 0, self.cum_pv[idx] / self.cum_volume[idx], self.last[idx])
+        return {
+            "rsi": rsi,
+            "ema": self.ema[idx],
+            "sma": sma,
+            "bb_upper": sma + self.bollinger_k * std,
+            "bb_lower": sma - self.bollinger_k * std,
+            "vwap": vwap,
+        }
+
+class TickerBook:
+    """Latest market state for every subscribed symbol, kept as parallel arrays.
+
+    The producer overwrites prices in place and marks them dirty; the writer
+    collects whatever is dirty when it gets around to it. A symbol that ticks
+    several times while the writer is busy is therefore sent once, with its
+    latest value, and the producer never waits on the socket.
+    """
+
+    def __init__(self, seed=None):
+        self.lock = threading.Lock()
+        self.symbols = []
+        self.index = {}
+        self.price = np.empty(0)
+        self.indicators = IndicatorEngine()
+        self.active = np.zeros(0, dtype=bool)
+        self.dirty = np.zeros(0, dtype=bool)
+        self.ticks = 0
+        self.conflated = 0
+        self._rng = np.random.default_rng(seed)
+
+    def subscribe(self, symbols):
+        with self.lock:
+            self._add_symbols(symbols)
+            for sym in symbols:
+                self.active[self.index[sym]] = True
+
+    def _add_symbols(self, symbols):
+        new = [sym for sym in symbols if sym not in self.index]
+        for sym in new:
+            self.index[sym] = len(self.symbols)
+            self.symbols.append(sym)
+        if new:
+            self.price = np.concatenate([self.price, np.full(len(new), 150.0)])
+            self.indicators.resize(len(self.symbols))
+            self.active = np.concatenate([self.active, np.zeros(len(new), dtype=bool)])
+            self.dirty = np.concatenate([self.dirty, np.zeros(len(new), dtype=bool)])
+
+    def unsubscribe(self, symbols):
+        with self.lock:
+            for sym in symbols:
+                if sym in self.index:
+                    self.active[self.index[sym]] = False
+                    self.dirty[self.index[sym]] = False
+
+    def step(self):
+        """Advances every active symbol by one tick (the simulated market feed)."""
+        with self.lock:
+            live = np.flatnonzero(self.active)
+            if not live.size:
+                return
+            self.price[live] += self._rng.uniform(-0.5, 0.5, live.size)
+            volume = self._rng.integers(100, 1000, live.size).astype(np.float64)
+            self.indicators.update(live, self.price[live], volume)
+            self.conflated += int(np.count_nonzero(self.dirty[live]))
+            self.dirty[live] = True
+            self.ticks += live.size
+
+    def configure_indicators(self, settings):
+        with self.lock:
+            engine = IndicatorEngine(
+                rsi_period=settings.get("rsi_period", 14),
+                ema_span=settings.get("ema_span", 20),
+                sma_window=settings.get("sma_window", 20),
+                bollinger_k=settings.get("bollinger_k", 2.0))
+            engine.resize(len(self.symbols))
+            self.indicators = engine
+
+    def backfill(self, symbol, prices, volumes=None):
+        # Checked before the symbol's row is touched, so a bad request leaves it as it was
+        prices = np.asarray(prices, dtype=np.float64)
+        if prices.ndim != 1:
+            raise ValueError("'prices' must be a list of numbers.")
+        if volumes is not None:
+            volumes = np.asarray(volumes, dtype=np.float64)
+            if volumes.shape != prices.shape:
+                raise ValueError(f"'volumes' has {volumes.size} values for {prices.size} prices.")
+        with self.lock:
+            self._add_symbols([symbol])
+            i = self.index[symbol]
+            self.indicators.backfill(i, prices, volumes)
+            if len(prices):
+                self.price[i] = prices[-1]
+            return self._rows(np.array([i]))[0]
+
+    def drain(self):
+        """Returns the latest price and indicators for every dirty symbol and clears them."""
+        with self.lock:
+            changed = np.flatnonzero(self.dirty)
+            if not changed.size:
+                return []
+            self.dirty[changed] = False
+            return self._rows(changed)
+
+    def _rows(self, idx):
+        columns = {"price": self.price[idx]}
+        columns.update(self.indicators.snapshot(idx))
+        columns = {name: np.round(values, 2).tolist() for name, values in columns.items()}
+        symbols = [self.symbols[i] for i in idx.tolist()]
+        return [dict(zip(columns, values), symbol=sym)
+                for sym, values in zip(symbols, zip(*columns.values()))]
+
+class TickPublisher:
+    """Owns the socket writer: one thread sends batches and control replies."""
+
+    def __init__(self, writer, book):
+        self.writer = writer
+        self.book = book
+        self.batches_sent = 0
+        self._replies = deque()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def reply(self, message):
+        self._replies.append(message)
+        self._wakeup.set()
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self):
         try:
-            time.sleep(1)
-            # Simulate price fluctuation
-            price += random.uniform(-0.5, 0.5)
-            # Simulate RSI calculation
-            rsi = 50 + random.uniform(-10, 10)
-            
-            tick_data = {
-                "type": "tick",
-                "symbol": symbol,
-                "price": round(price, 2),
-                "rsi": round(rsi, 2)
-            }
-            writer.write(json.dumps(tick_data) + '\n')
-            writer.flush()
-        except (BrokenPipeError, ConnectionResetError):
+            while not self._stopped.is_set():
+                self._wakeup.wait()
+                self._wakeup.clear()
+                while self._replies:
+                    self.writer.write(json.dumps(self._replies.popleft()) + '\n')
+
+                ticks = self.book.drain()
+                if len(ticks) == 1:
+                    tick_data = dict(ticks[0], type="tick")
+                    self.writer.write(json.dumps(tick_data) + '\n')
+                elif ticks:
+                    self.writer.write(json.dumps({"type": "ticks", "ticks": ticks}) + '\n')
+                self.writer.flush()
+                if ticks:
+                    self.batches_sent += 1
+        except (BrokenPipeError, ConnectionResetError, OSError):
             # C# client has disconnected, so we exit gracefully
             print("Client disconnected. Exiting.", file=sys.stderr)
-            break
-        except Exception as e:
-            sys.stderr.write(f"Streaming Error: {e}\n")
-            sys.stderr.flush()
-            break
+            self._stopped.set()
+
+    @property
+    def closed(self):
+        return self._stopped.is_set()
+
+def produce_ticks(job, book, publisher, rate):
+    # Deadline-based pacing: sleeping a fixed period would drift at kHz rates
+    next_tick = time.perf_counter()
+    while not publisher.closed:
+        job.checkpoint()  # Pause holds the feed here; cancel ends the stream
+        book.step()
+        publisher.notify()
+        next_tick += 1.0 / rate["hz"]
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            job.sleep(delay)
+        else:
+            next_tick = time.perf_counter()  # Fell behind; don't try to catch up in a burst
+
+def _symbols(data):
+    symbols = data.get("symbols")
+    if symbols is None:
+        symbols = [data.get("symbol", "SIM_STOCK")]
+    return [str(sym) for sym in symbols]
 
 def run_socket_mode(port):
     try:
@@ -36,19 +318,62 @@ def run_socket_mode(port):
             s.connect(('localhost', port))
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
-            
-            line = reader.readline()
-            if not line:
-                return
 
-            data = json.loads(line)
-            if data.get("command") == "subscribe":
-                stream_stock_data(writer, data.get("symbol", "SIM_STOCK"))
-                
+            book = TickerBook()
+            publisher = TickPublisher(writer, book)
+            rate = {"hz": DEFAULT_TICK_HZ}
+            # Control replies go through the publisher so its thread stays the only writer
+            jobs = JobManager(publisher.reply)
+            producer = None
+
+            try:
+                while True:
+                    line = reader.readline()
+                    if not line:
+                        break
+
+                    data = None
+                    try:
+                        data = json.loads(line)
+                        command = data.get("command")
+                        if jobs.handle(data):
+                            continue
+                        if command == "subscribe":
+                            if "hz" in data:
+                                rate["hz"] = min(MAX_TICK_HZ, max(0.1, float(data["hz"])))
+                            book.subscribe(_symbols(data))
+                            if producer is None or producer.finished is not None:
+                                producer = jobs.start("stream", produce_ticks, book, publisher, rate, job_id=data.get("job_id"))
+                        elif command == "unsubscribe":
+                            book.unsubscribe(_symbols(data))
+                        elif command == "set_rate":
+                            rate["hz"] = min(MAX_TICK_HZ, max(0.1, float(data.get("hz", DEFAULT_TICK_HZ))))
+                        elif command == "configure_indicators":
+                            book.configure_indicators(data)
+                        elif command == "backfill":
+                            row = book.backfill(str(data.get("symbol", "SIM_STOCK")), data.get("prices", []), data.get("volumes"))
+                            publisher.reply(dict(row, type="backfill"))
+                        elif command == "stats":
+                            publisher.reply({
+                                "type": "stats",
+                                "symbols": int(np.count_nonzero(book.active)),
+                                "tick_hz": rate["hz"],
+                                "ticks": book.ticks,
+                                "conflated": book.conflated,
+                                "batches_sent": publisher.batches_sent
+                            })
+                    except Exception as e:
+                        # One bad command gets an error reply; the stream keeps running
+                        publisher.reply({"type": "error", "command": data.get("command") if isinstance(data, dict) else None,
+                                         "message": f"{type(e).__name__}: {e}"})
+            finally:
+                jobs.shutdown()
+                publisher.close()
+
     except Exception as e:
         sys.stderr.write(f"Stock Ticker Error: {e}\n")
         sys.stderr.flush()
 
 if __name__ == "__main__":
     if len(sys.argv) == 3 and sys.argv[1] == 'socket':
-        run_socket_mode(int(sys.argv[2]))
\ No newline at end of file
+        run_socket_mode(int(sys.argv[2]))
@@ -0,0 +1,295 @@
+﻿# task_coordinator.py
+# Splits a job into chunks and runs them on a pool of task_worker.py processes.
+import sys, json, socket, os, time, selectors, subprocess
+from collections import deque
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_worker.py")
+PROGRESS_INTERVAL = 0.25  # Seconds between progress messages to the host
+
+def _reduce_min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def _reduce_max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+# (initial value, merge partials, finalize) for each operation task_worker.py supports
+REDUCERS = {
+    "sum": (0, lambda a, b: a + b, lambda r: r),
+    "sum_squares": (0, lambda a, b: a + b, lambda r: r),
+    "count": (0, lambda a, b: a + b, lambda r: r),
+    "min": (None, _reduce_min, lambda r: r),
+    "max": (None, _reduce_max, lambda r: r),
+    "mean": ([0, 0], lambda a, b: [a[0] + b[0], a[1] + b[1]], lambda r: r[0] / r[1] if r[1] else None),
+}
+
+def make_chunks(job):
+    """Cuts the job's input into chunk payloads (without the operation/command fields)."""
+    chunk_size = max(1, int(job.get("chunk_size", 10000)))
+    if "range" in job:
+        start, stop = job["range"]
+        return [{"range": [lo, min(lo + chunk_size, stop)]} for lo in range(start, stop, chunk_size)]
+    data = job.get("data", [])
+    return [{"data": data[lo:lo + chunk_size]} for lo in range(0, len(data), chunk_size)]
+
+class WorkerHandle:
+    """One spawned task_worker.py process and, once it connects, its socket."""
+
+    def __init__(self, slot, port):
+        self.slot = slot
+        self.process = subprocess.Popen([sys.executable, WORKER_SCRIPT, 'socket', str(port)])
+        self.sock = None
+        self.buffer = b''
+        self.in_flight = {}  # chunk_id -> time dispatched
+        self.lost = False
+
+    def send(self, message):
+        self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+    def stop(self):
+        if self.sock is None:
+            # Never connected (still starting up, typically): nothing to finish, so don't wait for it
+            self.process.kill()
+            self.process.wait()
+            return
+        try:
+            self.send({"command": "shutdown"})
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock = None
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+class ChunkScheduler:
+    """Dispatches chunks to workers with per-worker queues and work stealing.
+
+    Chunks are pre-split into one queue per worker so each worker streams
+    through a contiguous run of the input. A worker that drains its own queue
+    steals from the back of the longest remaining queue, and once nothing is
+    queued an idle worker may speculatively re-run the oldest straggling chunk;
+    whichever copy finishes first wins. Chunks held by a worker that dies are
+    requeued and the worker is respawned, up to `max_restarts` times.
+    """
+
+    def __init__(self, job, writer):
+        self.writer = writer
+        self.operation = job.get("operation", "sum")
+        if self.operation not in REDUCERS:
+            raise ValueError(f"Unknown operation '{self.operation}'.")
+        self.chunks = make_chunks(job)
+        self.worker_count = max(1, min(int(job.get("workers", os.cpu_count() or 1)), len(self.chunks) or 1))
+        self.prefetch = max(1, int(job.get("prefetch", 2)))
+        self.max_retries = int(job.get("max_retries", 3))
+        self.max_restarts = int(job.get("max_restarts", self.worker_count))
+        self.speculative = bool(job.get("speculative", True))
+
+        self.queues = [deque() for _ in range(self.worker_count)]
+        per_worker = -(-len(self.chunks) // self.worker_count)
+        for chunk_id in range(len(self.chunks)):
+            self.queues[chunk_id // per_worker].append(chunk_id)
+
+        initial, self.merge, self.finalize = REDUCERS[self.operation]
+        self.result = initial
+        self.done = set()
+        self.attempts = [0] * len(self.chunks)
+        self.stats = {"retries": 0, "steals": 0, "speculative": 0, "restarts": 0}
+
+    # --- Chunk selection ---
+    def _next_chunk(self, worker):
+        own = self.queues[worker.slot]
+        while own:
+            chunk_id = own.popleft()
+            if chunk_id not in self.done:
+                return chunk_id
+
+        victim = max(self.queues, key=len)
+        while victim:
+            chunk_id = victim.pop()  # Steal from the far end, away from the owner's next chunk
+            if chunk_id not in self.done:
+                self.stats["steals"] += 1
+                return chunk_id
+
+        if self.speculative and not worker.in_flight:
+            running = [(sent, chunk_id) for other in self.workers if other is not worker
+                       for chunk_id, sent in other.in_flight.items()
+                       if chunk_id not in self.done and chunk_id not in self._duplicated]
+            if running:
+                _, chunk_id = min(running)
+                self._duplicated.add(chunk_id)
+                self.stats["speculative"] += 1
+                return chunk_id
+        return None
+
+    def _dispatch(self, worker):
+        while worker.sock and len(worker.in_flight) < self.prefetch:
+            chunk_id = self._next_chunk(worker)
+            if chunk_id is None:
+                return
+            message = {"command": "calculate_chunk", "chunk_id": chunk_id, "operation": self.operation}
+            message.update(self.chunks[chunk_id])
+            worker.in_flight[chunk_id] = time.monotonic()
+            try:
+                worker.send(message)
+            except OSError:
+                self._on_worker_lost(worker)
+
+    # --- Worker events ---
+    def _on_message(self, worker, message):
+        event = message.get("event")
+        chunk_id = message.get("chunk_id")
+        if event == "ready":
+            return
+        worker.in_flight.pop(chunk_id, None)
+        if event == "chunk_done":
+            if chunk_id not in self.done:
+                self.done.add(chunk_id)
+                self.result = self.merge(self.result, message.get("result"))
+        elif event == "chunk_failed":
+            self._retry(chunk_id, worker.slot, message.get("message"))
+
+    def _retry(self, chunk_id, slot, reason):
+        if chunk_id in self.done:
+            return
+        self.attempts[chunk_id] += 1
+        if self.attempts[chunk_id] > self.max_retries:
+            raise RuntimeError(f"Chunk {chunk_id} failed after {self.max_retries} retries: {reason}")
+        self.stats["retries"] += 1
+        self.queues[slot].appendleft(chunk_id)
+
+    def _on_worker_lost(self, worker):
+        worker.lost = True
+        if worker.sock:
+            self.selector.unregister(worker.sock)
+            worker.sock.close()
+        for chunk_id in list(worker.in_flight):
+            self._retry(chunk_id, worker.slot, "worker exited")
+        worker.in_flight.clear()
+        worker.sock = None
+        if worker.process.poll() is None:
+            worker.process.kill()
+        if self.stats["restarts"] >= self.max_restarts:
+            if all(w.lost for w in self.workers):
+                raise RuntimeError("All workers died and the restart budget is exhausted.")
+            # Survivors pick up the dead worker's queue through stealing
+            return
+        self.stats["restarts"] += 1
+        print(f"Respawning worker {worker.slot}", file=sys.stderr)
+        self.workers[worker.slot] = WorkerHandle(worker.slot, self.port)
+
+    def _read(self, worker):
+        try:
+            data = worker.sock.recv(65536)
+        except ConnectionError:
+            data = b''
+        if not data:
+            self._on_worker_lost(worker)
+            return
+        worker.buffer += data
+        *lines, worker.buffer = worker.buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                self._on_message(worker, json.loads(line))
+
+    def _accept(self, server):
+        conn, _ = server.accept()
+        conn.setblocking(True)
+        # The first line identifies which spawned process this connection belongs to
+        hello = b''
+        while not hello.endswith(b'\n'):
+            part = conn.recv(1024)
+            if not part:
+                conn.close()
+                return
+            hello += part
+        pid = json.loads(hello).get("pid")
+        for worker in self.workers:
+            if worker.process.pid == pid and worker.sock is None:
+                worker.sock = conn
+                self.selector.register(conn, selectors.EVENT_READ, worker)
+                return
+        conn.close()
+
+    def _report_progress(self, start):
+        total = len(self.chunks)
+        progress = {"type": "progress", "completed": len(self.done), "total": total,
+                    "percent": round(100.0 * len(self.done) / total, 2) if total else 100.0,
+                    "elapsed": round(time.monotonic() - start, 3)}
+        self.writer.write(json.dumps(progress) + '\n')
+        self.writer.flush()
+
+    def run(self):
+        start = time.monotonic()
+        self._duplicated = set()
+        if not self.chunks:
+            return {"type": "result", "operation": self.operation, "result": self.finalize(self.result),
+                    "chunks": 0, "workers": 0, "elapsed": 0.0}
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind(('localhost', 0))
+            server.listen()
+            self.port = server.getsockname()[1]
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(server, selectors.EVENT_READ, None)
+            self.workers = [WorkerHandle(slot, self.port) for slot in range(self.worker_count)]
+            last_progress = 0.0
+            try:
+                while len(self.done) < len(self.chunks):
+                    for key, _ in self.selector.select(timeout=0.1):
+                        if key.data is None:
+                            self._accept(server)
+                        elif key.data.sock is not None:
+                            self._read(key.data)
+
+                    # Catch workers that died before (or without) connecting
+                    for worker in list(self.workers):
+                        if not worker.lost and worker.sock is None and worker.process.poll() is not None:
+                            self._on_worker_lost(worker)
+
+                    for worker in self.workers:
+                        self._dispatch(worker)
+
+                    now = time.monotonic()
+                    if now - last_progress >= PROGRESS_INTERVAL:
+                        self._report_progress(start)
+                        last_progress = now
+            finally:
+                for worker in self.workers:
+                    worker.stop()
+                self.selector.close()
+
+        result = {"type": "result", "operation": self.operation, "result": self.finalize(self.result),
+                  "chunks": len(self.chunks), "workers": self.worker_count,
+                  "elapsed": round(time.monotonic() - start, 3)}
+        result.update(self.stats)
+        return result
+
+def run_socket_mode(port):
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.connect(('localhost', port))
+            reader = s.makefile('r', encoding='utf-8')
+            writer = s.makefile('w', encoding='utf-8')
+            while True:
+                line = reader.readline()
+                if not line:
+                    break
+
+                try:
+                    data = json.loads(line)
+                    if data.get("command") == "run_job":
+                        response = ChunkScheduler(data.get("job", {}), writer).run()
+                    else:
+                        raise ValueError("Unknown command")
+                except Exception as e:
+                    response = {"type": "error", "message": str(e)}
+
+                writer.write(json.dumps(response) + '\n')
+                writer.flush()
+    except Exception as e:
+        sys.stderr.write(f"Task Coordinator Error: {e}\n")
+        sys.stderr.flush()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'socket':
+        run_socket_mode(int(sys.argv[2]))
@@ -1,27 +1,77 @@
 ﻿# task_worker.py
-import sys, json, socket, time, random
+import sys, json, socket, os
+
+# Partial results per operation. The coordinator (task_coordinator.py) merges
+# them, so each one must be combinable across chunks in any order.
+def _mean_partial(values):
+    values = list(values)
+    return [sum(values), len(values)]
+
+OPERATIONS = {
+    "sum": sum,
+    "sum_squares": lambda values: sum(v * v for v in values),
+    "count": lambda values: sum(1 for _ in values),
+    "min": lambda values: min(values, default=None),
+    "max": lambda values: max(values, default=None),
+    "mean": _mean_partial,
+}
+
+def calculate_chunk(data):
+    operation = data.get("operation", "sum")
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{operation}'.")
+    # Large numeric jobs ship a [start, stop) range instead of the values themselves
+    if "range" in data:
+        chunk_data = range(*data["range"])
+    else:
+        chunk_data = data.get("data", [])
+    return OPERATIONS[operation](chunk_data), len(chunk_data)
 
 def process_data_line(json_line, writer):
     try:
         data = json.loads(json_line)
-        if data.get("command") == "calculate_chunk":
-            chunk_data = data.get("data", [])
-            
-            # Simulate a CPU-intensive task
-            time.sleep(random.uniform(1, 3))
-            
-            result = sum(chunk_data)
-            response = {"result": result, "chunk_size": len(chunk_data)}
+        command = data.get("command")
+        if command == "calculate_chunk":
+            try:
+                result, chunk_size = calculate_chunk(data)
+                response = {"event": "chunk_done", "chunk_id": data.get("chunk_id"),
+                            "result": result, "chunk_size": chunk_size}
+            except Exception as e:
+                response = {"event": "chunk_failed", "chunk_id": data.get("chunk_id"), "message": str(e)}
+                sys.stderr.write(f"Worker Error: {e}\n")
             writer.write(json.dumps(response) + '\n')
             writer.flush()
+        elif command == "shutdown":
+            return False
+    except (BrokenPipeError, ConnectionResetError):
+        return False # Master went away, e.g. after a speculative duplicate finished
     except Exception as e:
         sys.stderr.write(f"Worker Error: {e}\n")
-        
-# --- Standard Socket/Stdio template ---
-# This script is a worker, so it connects to the C# master.
-# The C# app would need to be a socket SERVER in this case.
-# The template is the same as the chatbot's.
+    return True
+
+# This script is a worker, so it connects to a master that runs the socket
+# SERVER: either task_coordinator.py or the C# app itself.
 def run_socket_mode(port):
-    # ...
-    pass
-# ...
\ No newline at end of file
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.connect(('localhost', port))
+            reader = s.makefile('r', encoding='utf-8')
+            writer = s.makefile('w', encoding='utf-8')
+
+            # Let the master match this connection to the process it spawned
+            writer.write(json.dumps({"event": "ready", "pid": os.getpid()}) + '\n')
+            writer.flush()
+
+            while True:
+                line = reader.readline()
+                if not line:
+                    break
+                if not process_data_line(line, writer):
+                    break
+    except Exception as e:
+        sys.stderr.write(f"Socket Error: {e}\n")
+        sys.stderr.flush()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'socket':
+        run_socket_mode(int(sys.argv[2]))
@@ -1,32 +1,42 @@
 ﻿# training_monitor.py
 import sys, json, socket, time, random
+from job_control import JobManager, locked_sender
+from metric_store import MetricStore
 
-def start_training(writer, params):
+def start_training(job, params, store):
     epochs = params.get("epochs", 10)
     learning_rate = params.get("lr", 0.01)
+    history = store.writer(job.id, ("loss", "accuracy")) if params.get("store", True) else None
+    try:
+        first = history.last_step or 0 if history else 0  # Reusing a job id continues that run
     
-    # Simulate a training loop
-    for epoch in range(1, epochs + 1):
-        # Simulate some work
-        time.sleep(1.5) 
-        
-        # Simulate changing metrics
-        loss = 1.0 / (epoch + random.random())
-        accuracy = 1.0 - (1.0 / (epoch * 2 + random.random()))
+        # Simulate a training loop
+        for epoch in range(1, epochs + 1):
+            # Simulate some work (pause/cancel take effect here)
+            job.sleep(1.5)
         
-        progress_update = {
-            "type": "progress",
-            "epoch": epoch,
-            "total_epochs": epochs,
-            "loss": round(loss, 4),
-            "accuracy": round(accuracy, 4)
-        }
-        writer.write(json.dumps(progress_update) + '\n')
-        writer.flush()
+            # Simulate changing metrics
+            loss = 1.0 / (epoch + random.random())
+            accuracy = 1.0 - (1.0 / (epoch * 2 + random.random()))
         
+            progress_update = {
+                "type": "progress",
+                "epoch": epoch,
+                "total_epochs": epochs,
+                "loss": round(loss, 4),
+                "accuracy": round(accuracy, 4)
+            }
+            job.update(epoch=epoch, total_epochs=epochs)
+            job.send(progress_update)
+            if history:
+                history.append(first + epoch, {"loss": loss, "accuracy": accuracy})
+                history.flush()
+    finally:
+        if history:
+            store.close_writer(job.id)
+    
     final_result = {"type": "result", "message": "Training completed successfully."}
-    writer.write(json.dumps(final_result) + '\n')
-    writer.flush()
+    job.send(final_result)
 
 def run_socket_mode(port):
     try:
@@ -35,14 +45,31 @@ def run_socket_mode(port):
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
             
-            # Wait for the start command
-            line = reader.readline()
-            if not line:
-                return
+            send = locked_sender(writer)
+            jobs = JobManager(send)
+            store = MetricStore()
+
+            # Training runs as a job so cancel/pause/resume/status are served meanwhile
+            try:
+                while True:
+                    line = reader.readline()
+                    if not line:
+                        break
 
-            data = json.loads(line)
-            if data.get("command") == "start_training":
-                start_training(writer, data.get("params", {}))
+                    try:
+                        data = json.loads(line)
+                        if not isinstance(data, dict):
+                            raise ValueError("Expected a JSON object.")
+                        if jobs.handle(data) or store.handle(data, send):
+                            continue
+                        if data.get("command") == "start_training":
+                            # Only an explicit job id continues a stored run; job-manager ids restart with the process
+                            job_id = data.get("job_id") or store.new_run_id("training")
+                            jobs.start("training", start_training, data.get("params", {}), store, job_id=job_id)
+                    except Exception as e:  # One bad line must not end the runs already training
+                        send({"type": "error", "message": str(e)})
+            finally:
+                jobs.shutdown()
 
     except Exception as e:
         sys.stderr.write(f"Training Error: {e}\n")
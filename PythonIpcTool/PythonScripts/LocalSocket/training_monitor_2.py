@@ -4,27 +4,110 @@ import json
 import socket
 import time
 import random
-import threading
+from job_control import JobManager, JobCancelled
+from line_writer import LineWriter
+from metric_store import MetricStore
 
-def start_training(writer, params, stop_event):
+class MetricDownsampler:
+    """Thins a per-step metric stream before it reaches the host.
+
+    Modes:
+      "all"     - every step is sent (the original behaviour).
+      "every_n" - only every Nth step is sent, as-is.
+      "window"  - each block of N steps (or `max_interval` seconds, whichever
+                  comes first) is sent as min/max/mean per metric.
+    """
+
+    def __init__(self, mode="all", every=100, max_interval=0.5):
+        if mode not in ("all", "every_n", "window"):
+            raise ValueError(f"Unknown downsample mode '{mode}'.")
+        self.mode = mode
+        self.every = max(1, int(every))
+        self.max_interval = float(max_interval)
+        self._window = None
+
+    def add(self, step, metrics):
+        """Returns the message to send for this step, or None if it was absorbed."""
+        if self.mode == "all":
+            return dict(metrics, type="progress", step=step)
+        if self.mode == "every_n":
+            return dict(metrics, type="progress", step=step) if step % self.every == 0 else None
+
+        window = self._window
+        if window is None:
+            window = self._window = {"step_start": step, "count": 0, "opened": time.monotonic(),
+                                     "stats": {name: [value, value, 0.0] for name, value in metrics.items()}}
+        window["step_end"] = step
+        window["count"] += 1
+        for name, value in metrics.items():
+            stats = window["stats"][name]
+            stats[0] = min(stats[0], value)
+            stats[1] = max(stats[1], value)
+            stats[2] += value
+        if window["count"] >= self.every or time.monotonic() - window["opened"] >= self.max_interval:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Closes the current window early (e.g. at the end of an epoch or run)."""
+        window, self._window = self._window, None
+        if window is None:
+            return None
+        message = {"type": "progress_window", "step_start": window["step_start"],
+                   "step_end": window["step_end"], "count": window["count"]}
+        for name, (low, high, total) in window["stats"].items():
+            message[name] = {"min": round(low, 4), "max": round(high, 4),
+                             "mean": round(total / window["count"], 4)}
+        return message
+
+def start_training(job, params, store):
     epochs = params.get("epochs", 20)
-    for epoch in range(1, epochs + 1):
-        if stop_event.is_set():
-            writer.write(json.dumps({"type": "result", "message": "Training stopped by user."}) + '\n')
-            writer.flush()
-            return
-            
-        time.sleep(1.5)  # Simulate training work
-        loss = 1.0 / (epoch + random.random())
-        accuracy = 1.0 - (1.0 / (epoch * 2 + random.random()))
-        
-        progress = {"type": "progress", "epoch": epoch, "loss": round(loss, 4), "accuracy": round(accuracy, 4)}
-        writer.write(json.dumps(progress) + '\n')
-        writer.flush()
-        
-    final_result = {"type": "result", "message": "Training completed."}
-    writer.write(json.dumps(final_result) + '\n')
-    writer.flush()
+    steps_per_epoch = max(1, int(params.get("steps_per_epoch", 1)))
+    step_time = float(params.get("step_time", 1.5 / steps_per_epoch))
+    downsample = params.get("downsample", {})
+    sampler = MetricDownsampler(downsample.get("mode", "all"), downsample.get("every", 100),
+                                downsample.get("max_interval", 0.5))
+    # Every step is kept at full resolution on disk, whatever reaches the host live
+    history = store.writer(job.id, ("loss", "accuracy")) if params.get("store", True) else None
+
+    def send(message, **fields):
+        if message:
+            job.send(dict(message, run_id=job.id, **fields))
+
+    try:
+        step = history.last_step or 0 if history else 0  # Reusing a run id continues that run
+        next_step = time.monotonic()
+        for epoch in range(1, epochs + 1):
+            for _ in range(steps_per_epoch):
+                # Simulate training work; pace on a deadline so short steps don't drift
+                next_step += step_time
+                delay = next_step - time.monotonic()
+                if delay > 0.001:
+                    job.sleep(delay)
+                else:
+                    job.checkpoint()
+
+                step += 1
+                progress = epoch + (step - 1) % steps_per_epoch / steps_per_epoch
+                loss = 1.0 / (progress + random.random())
+                accuracy = 1.0 - (1.0 / (progress * 2 + random.random()))
+                metrics = {"loss": round(loss, 4), "accuracy": round(accuracy, 4)}
+                if history:
+                    history.append(step, metrics)
+                send(sampler.add(step, metrics), epoch=epoch)
+
+            # Windows never straddle epochs
+            send(sampler.flush(), epoch=epoch)
+            job.update(epoch=epoch, total_epochs=epochs, step=step)
+    except JobCancelled:
+        send(sampler.flush())
+        send({"type": "result", "message": "Training stopped by user."})
+        raise
+    finally:
+        if history:
+            store.close_writer(job.id)
+
+    send({"type": "result", "message": "Training completed."})
 
 def run_socket_mode(port):
     try:
@@ -32,25 +115,42 @@ def run_socket_mode(port):
             s.connect(('localhost', port))
             reader = s.makefile('r', encoding='utf-8')
             writer = s.makefile('w', encoding='utf-8')
-            
-            stop_event = threading.Event()
-            training_thread = None
-
-            while True:
-                line = reader.readline()
-                if not line:
-                    break
-
-                data = json.loads(line)
-                command = data.get("command")
-                if command == "start_training":
-                    training_thread = threading.Thread(target=start_training, args=(writer, data.get("params", {}), stop_event))
-                    training_thread.start()
-                elif command == "stop_training":
-                    stop_event.set()
+
+            # Many runs can train at once; all of their output funnels through one writer thread
+            output = LineWriter(writer)
+            jobs = JobManager(output.send)
+            store = MetricStore()
+
+            try:
+                while True:
+                    line = reader.readline()
+                    if not line:
+                        break
+
+                    try:
+                        data = json.loads(line)
+                        if not isinstance(data, dict):
+                            raise ValueError("Expected a JSON object.")
+                        command = data.get("command")
+                        run_id = data.get("run_id", data.get("job_id"))
+                        if run_id is not None:
+                            data["job_id"] = run_id  # Runs are jobs; accept either key
+                        if jobs.handle(data) or store.handle(data, output.send):
+                            continue
+                        if command == "start_training":
+                            # Only an explicit run id continues a stored run; job-manager ids restart with the process
+                            jobs.start("training", start_training, data.get("params", {}), store,
+                                       job_id=run_id or store.new_run_id("training"))
+                        elif command == "stop_training":
+                            jobs.handle({"command": "cancel", "job_id": run_id})
+                    except Exception as e:  # One bad line must not end the runs already training
+                        output.send({"type": "error", "message": str(e)})
+            finally:
+                jobs.shutdown()
+                output.close()
     except Exception as e:
         sys.stderr.write(f"Training Monitor Error: {e}\n")
 
 if __name__ == "__main__":
     if len(sys.argv) == 3 and sys.argv[1] == 'socket':
-        run_socket_mode(int(sys.argv[2]))
\ No newline at end of file
+        run_socket_mode(int(sys.argv[2]))
@@ -1,18 +1,324 @@
 ﻿# File: PythonScripts/exif_reader.py
+import os
 import sys
 import json
-from PIL import Image
+import time
+import struct
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image, ExifTags
 from PIL.ExifTags import TAGS
+from PIL.TiffImagePlugin import IFDRational
+
+DEFAULT_INDEX = os.environ.get(
+    "PYTHON_IPC_EXIF_INDEX", os.path.join(os.path.expanduser("~"), ".python_ipc_tool", "exif_index.sqlite3"))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.jpe', '.tif', '.tiff', '.png', '.webp', '.dng', '.nef', '.cr2', '.arw')
+DEFAULT_TAGS = ("Make", "Model", "LensModel", "DateTimeOriginal", "ExposureTime", "FNumber", "ISOSpeedRatings",
+                "FocalLength", "Orientation", "ExifImageWidth", "ExifImageHeight",
+                "GPSLatitude", "GPSLongitude", "GPSAltitude")
+DATE_TAGS = ("DateTime", "DateTimeOriginal", "DateTimeDigitized")
+SKIPPED_TAGS = ("MakerNote", "PrintImageMatching")  # Vendor blobs, often tens of KB
+MAX_BYTES_VALUE = 256  # Longer binary values are left out of the index
+DEFAULT_WORKERS = 8
+MAX_WORKERS = 64
+WRITE_BATCH = 500  # Index rows per transaction during a scan
+
+# --- Reading only the EXIF block ---
+
+def _jpeg_exif(f):
+    """Walks JPEG marker segments, seeking past each, until the APP1 "Exif" segment or the image data."""
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        byte = f.read(1)
+        if byte != b'\xff':
+            raise ValueError("Corrupt or truncated JPEG: expected a marker.")
+        while byte == b'\xff':  # Fill bytes before a marker
+            byte = f.read(1)
+        if not byte:
+            raise ValueError("Truncated JPEG.")
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue  # No length field
+        if marker in (0xD9, 0xDA):
+            return None  # End of image / start of scan: there is no EXIF block
+        header = f.read(2)
+        if len(header) < 2:
+            raise ValueError("Truncated JPEG.")
+        length = struct.unpack('>H', header)[0] - 2
+        if marker == 0xE1:
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError("Truncated JPEG.")
+            if payload.startswith(b'Exif\x00\x00'):
+                return payload
+        else:
+            f.seek(length, os.SEEK_CUR)
+
+def _png_exif(f):
+    if f.read(8) != b'\x89PNG\r\n\x1a\n':
+        return None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("Truncated PNG.")
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'eXIf':
+            return f.read(length)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return None
+        f.seek(length + 4, os.SEEK_CUR)  # Data and CRC
+
+def _webp_exif(f):
+    header = f.read(12)
+    if header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+        return None
+    while True:
+        chunk = f.read(8)
+        if not chunk:
+            return None  # Past the last chunk
+        if len(chunk) < 8:
+            raise ValueError("Truncated WebP.")
+        chunk_type, length = struct.unpack('<4sI', chunk)
+        if chunk_type == b'EXIF':
+            return f.read(length)
+        f.seek(length + (length & 1), os.SEEK_CUR)
+
+def read_exif(path):
+    """The file's EXIF tags as a Pillow Exif, without decoding any pixels.
+
+    JPEG, PNG and WebP are read segment by segment, up to the EXIF block.
+    Anything else (TIFF and TIFF-based raw files) goes through Image.open,
+    which reads only the header.
+    """
+    exif = Image.Exif()
+    with open(path, 'rb') as f:
+        signature = f.read(12)
+        f.seek(0)
+        if signature.startswith(b'\xff\xd8'):
+            data = _jpeg_exif(f)
+        elif signature.startswith(b'\x89PNG'):
+            data = _png_exif(f)
+        elif signature[:4] == b'RIFF' and signature[8:12] == b'WEBP':
+            data = _webp_exif(f)
+        else:
+            with Image.open(f) as img:
+                exif = img.getexif()
+                for ifd in (ExifTags.IFD.Exif, ExifTags.IFD.GPSInfo):
+                    exif.get_ifd(ifd)  # Sub-IFDs are read lazily, and the file is about to close
+                return exif
+    if data:
+        exif.load(data)
+    return exif
+
+# --- Typed values ---
+
+def _typed(value):
+    if isinstance(value, IFDRational):
+        return float(value) if value.denominator else None
+    if isinstance(value, (tuple, list)):
+        return [_typed(v) for v in value]
+    if isinstance(value, bytes):
+        if value[:8] in (b'ASCII\x00\x00\x00', b'UNICODE\x00'):  # UserComment-style prefix
+            value = value[8:].decode('utf-16' if value[:1] == b'U' else 'ascii', errors='ignore')
+            return value.strip('\x00 ') or None
+        if len(value) == 1:
+            return value[0]  # BYTE-typed flags such as GPSAltitudeRef
+        return value.hex() if len(value) <= MAX_BYTES_VALUE else None
+    if isinstance(value, str):
+        return value.strip('\x00 ')
+    return value
+
+def _iso_date(value):
+    # "2021:05:03 10:20:30" -> "2021-05-03T10:20:30"; anything else is kept as written
+    if isinstance(value, str) and len(value) >= 19 and value[4] == ':' and value[7] == ':':
+        return f"{value[:4]}-{value[5:7]}-{value[8:10]}T{value[11:19]}"
+    return value
+
+def _degrees(dms, ref):
+    try:
+        degrees = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+    except (TypeError, ValueError, IndexError, ZeroDivisionError):
+        return None
+    return round(-degrees if ref in ('S', 'W') else degrees, 7)
+
+def typed_tags(exif):
+    """Flat {tag name: JSON value}: main and Exif IFD tags, and GPS with decimal-degree coordinates."""
+    tags = {}
+    for ifd in (exif, exif.get_ifd(ExifTags.IFD.Exif)):
+        for tag_id, value in ifd.items():
+            name = TAGS.get(tag_id)
+            if name is None or name in SKIPPED_TAGS or tag_id in (ExifTags.IFD.Exif, ExifTags.IFD.GPSInfo):
+                continue
+            value = _typed(value)
+            if value is not None:
+                tags[name] = _iso_date(value) if name in DATE_TAGS else value
+    gps = {ExifTags.GPSTAGS.get(tag_id, tag_id): value for tag_id, value in exif.get_ifd(ExifTags.IFD.GPSInfo).items()}
+    for name, value in gps.items():
+        if isinstance(name, str) and name not in ("GPSLatitude", "GPSLongitude", "GPSAltitude"):
+            value = _typed(value)
+            if value is not None:
+                tags[name] = value
+    if "GPSLatitude" in gps and "GPSLongitude" in gps:
+        tags["GPSLatitude"] = _degrees(gps["GPSLatitude"], _typed(gps.get("GPSLatitudeRef")))
+        tags["GPSLongitude"] = _degrees(gps["GPSLongitude"], _typed(gps.get("GPSLongitudeRef")))
+    if "GPSAltitude" in gps:
+        altitude = _typed(gps["GPSAltitude"])
+        if altitude is not None:
+            tags["GPSAltitude"] = -altitude if _typed(gps.get("GPSAltitudeRef")) == 1 else altitude
+    return tags
+
+def select_tags(tags, wanted):
+    return tags if wanted is None else {name: tags[name] for name in wanted if name in tags}
+
+# --- Incremental index ---
+
+class ExifIndex:
+    """Typed tags of every scanned file, keyed by path and valid while its mtime and size are unchanged."""
+
+    def __init__(self, path=DEFAULT_INDEX):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, tags TEXT, error TEXT) WITHOUT ROWID""")
+
+    def close(self):
+        self.conn.close()
+
+    def under(self, root):
+        """{path: (mtime_ns, size, tags json, error)} for everything indexed below `root`."""
+        prefix = os.path.join(root, '')
+        rows = self.conn.execute(
+            "SELECT path, mtime_ns, size, tags, error FROM files WHERE path >= ? AND path < ?",
+            (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+        return {path: (mtime_ns, size, tags, error) for path, mtime_ns, size, tags, error in rows}
+
+    def put_many(self, rows):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files (path, mtime_ns, size, tags, error) VALUES (?, ?, ?, ?, ?)",
+                                  rows)
+
+    def remove_many(self, paths):
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+def scan_files(root, recursive, unreadable):
+    """(path, mtime_ns, size) for the images under `root`, from directory entries only.
+
+    Directories that can't be listed are appended to `unreadable` as
+    (path, error) instead of raising, so one bad folder doesn't end a scan.
+    """
+    try:
+        entries = list(os.scandir(root))
+    except OSError as e:
+        unreadable.append((root, e))
+        return
+    for entry in sorted(entries, key=lambda e: e.name):
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from scan_files(entry.path, recursive, unreadable)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime_ns, stat.st_size
+        except OSError:
+            continue
+
+def _extract(path):
+    # Runs on the thread pool; returns (tags, error)
+    try:
+        return typed_tags(read_exif(path)), None
+    except Exception as e:
+        return None, str(e)
+
+def index_directories(input_data, emit):
+    """Scans directories, re-reading only files whose mtime or size changed since the last scan."""
+    started = time.perf_counter()
+    directories = input_data.get("directories") or [input_data.get("directory")]
+    if not all(directories):
+        raise ValueError("Missing 'directory' or 'directories' in input JSON.")
+    recursive = bool(input_data.get("recursive", True))
+    wanted = input_data.get("tags", list(DEFAULT_TAGS))
+    wanted = None if wanted == "all" else wanted
+    changed_only = bool(input_data.get("changed_only", False))
+    workers = max(1, min(int(input_data.get("workers", DEFAULT_WORKERS)), MAX_WORKERS))
+    index = ExifIndex(input_data.get("index_path") or DEFAULT_INDEX)
+    counts = {"count": 0, "indexed": 0, "unchanged": 0, "failed": 0, "removed": 0, "unreadable": 0}
+
+    def report(path, tags, error, cached):
+        counts["failed"] += error is not None
+        if changed_only and cached:
+            return
+        if error is None:
+            emit({"status": "success", "path": path, "tags": select_tags(tags, wanted), "cached": cached})
+        else:
+            emit({"status": "error", "path": path, "message": error, "cached": cached})
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for directory in directories:
+                root = os.path.abspath(directory)
+                known = index.under(root)
+                futures = {}
+                unreadable = []
+                for path, mtime_ns, size in scan_files(root, recursive, unreadable):
+                    counts["count"] += 1
+                    previous = known.pop(path, None)
+                    if previous is not None and previous[:2] == (mtime_ns, size):
+                        counts["unchanged"] += 1
+                        _, _, tags, error = previous
+                        report(path, json.loads(tags) if tags else None, error, True)
+                    else:
+                        futures[executor.submit(_extract, path)] = (path, mtime_ns, size)
+
+                rows = []
+                for future in as_completed(futures):
+                    path, mtime_ns, size = futures[future]
+                    tags, error = future.result()
+                    counts["indexed"] += 1
+                    rows.append((path, mtime_ns, size, json.dumps(tags) if tags is not None else None, error))
+                    report(path, tags, error, False)
+                    if len(rows) >= WRITE_BATCH:
+                        index.put_many(rows)
+                        rows = []
+                index.put_many(rows)
+
+                for path, error in unreadable:
+                    counts["unreadable"] += 1
+                    emit({"status": "error", "path": path, "message": f"Cannot read directory: {error}"})
+                if unreadable and unreadable[0][0] == root:
+                    continue  # Missing or unreadable root: keep its index entries rather than drop them all
+                # Whatever is left in `known` was indexed before but is gone (or outside a non-recursive scan),
+                # except under folders that couldn't be listed this time
+                skipped = tuple(os.path.join(path, '') for path, _error in unreadable)
+                removed = [path for path in known
+                           if (recursive or os.path.dirname(path) == root) and not path.startswith(skipped)]
+                index.remove_many(removed)
+                counts["removed"] += len(removed)
+                for path in removed:
+                    emit({"status": "removed", "path": path})
+    finally:
+        index.close()
+    emit({"status": "done", **counts, "elapsed": round(time.perf_counter() - started, 4)})
 
 def main():
     try:
         input_line = sys.stdin.readline()
         input_data = json.loads(input_line)
-        
+
+        if input_data.get("directory") or input_data.get("directories"):
+            # Bulk mode: one line per file (cached ones included unless "changed_only"), then a "done" summary line
+            def emit(result):
+                sys.stdout.write(json.dumps(result) + '\n')
+            index_directories(input_data, emit)
+            sys.stdout.flush()
+            return
+
         image_path = input_data.get("image_path")
         if not image_path:
             raise ValueError("Missing 'image_path' in input.")
-            
+
         exif_data = {}
         with Image.open(image_path) as img:
             exif_info = img._getexif()
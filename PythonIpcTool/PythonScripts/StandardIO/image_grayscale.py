@@ -1,8 +1,140 @@
 ﻿# File: PythonScripts/image_grayscale.py
+import os
 import sys
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+OUTPUT_FORMATS = {  # "format" option -> (Pillow format, file extension)
+    'jpeg': ('JPEG', '.jpg'), 'jpg': ('JPEG', '.jpg'), 'png': ('PNG', '.png'),
+    'webp': ('WEBP', '.webp'), 'bmp': ('BMP', '.bmp'), 'tiff': ('TIFF', '.tif'),
+}
+
+def convert_image(input_path, output_path, size=None, fit="thumbnail", image_format=None, quality=None):
+    """Writes a grayscale copy of one image, optionally scaled; returns the output's size.
+
+    `fit` is "thumbnail" (fit within `size`, keeping the aspect ratio, never
+    enlarging) or "resize" (exactly `size`). JPEGs are decoded straight to
+    grayscale, and at 1/2, 1/4 or 1/8 scale when a smaller size is wanted.
+    """
+    with Image.open(input_path) as img:
+        if img.format == 'JPEG':
+            # Only in the decoder: the luma channel, and a DCT-scaled image no smaller than `size`
+            img.draft('L', tuple(size) if size else None)
+        img = img.convert('L')
+        if size:
+            size = (int(size[0]), int(size[1]))
+            if fit == "resize":
+                img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            elif fit == "thumbnail":
+                img.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            else:
+                raise ValueError(f"Unknown fit '{fit}'; expected 'thumbnail' or 'resize'.")
+        save_options = {}
+        pil_format = OUTPUT_FORMATS[image_format.lower()][0] if image_format else None
+        if quality is not None and (pil_format or Image.registered_extensions().get(
+                os.path.splitext(output_path)[1].lower())) in ('JPEG', 'WEBP'):
+            save_options["quality"] = int(quality)
+        img.save(output_path, format=pil_format, **save_options)
+        return img.size
+
+def find_images(input_dir, recursive):
+    if recursive:
+        for root, dirs, files in os.walk(input_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+    else:
+        for name in sorted(os.listdir(input_dir)):
+            path = os.path.join(input_dir, name)
+            if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+                yield path
+
+def plan_outputs(inputs, input_dir, output_dir, image_format):
+    """(input, output) pairs; folder layout under `input_dir` is kept in `output_dir`.
+
+    Without `input_dir`, paths are kept relative to the inputs' common folder,
+    so same-named files from different folders stay apart. Two inputs that
+    would still write the same output (e.g. a.png and a.jpg converted to one
+    format) raise ValueError before anything is converted.
+    """
+    extension = OUTPUT_FORMATS[image_format.lower()][1] if image_format else None
+    if not input_dir and inputs:
+        absolute = [os.path.abspath(path) for path in inputs]
+        base = os.path.commonpath([os.path.dirname(path) for path in absolute])
+    pairs = []
+    owners = {}
+    for i, path in enumerate(inputs):
+        relative = os.path.relpath(path, input_dir) if input_dir else os.path.relpath(absolute[i], base)
+        if extension:
+            relative = os.path.splitext(relative)[0] + extension
+        output_path = os.path.join(output_dir, relative)
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in owners:
+            raise ValueError(f"'{owners[key]}' and '{path}' would both be written to '{output_path}'.")
+        owners[key] = path
+        pairs.append((path, output_path))
+    return pairs
+
+def _convert_one(index, input_path, output_path, options):
+    # Runs in a pool worker; errors come back as results so one bad file doesn't stop the batch
+    try:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        width, height = convert_image(input_path, output_path, **options)
+        return {"status": "success", "index": index, "input_path": input_path, "output_path": output_path,
+                "width": width, "height": height}
+    except Exception as e:
+        return {"status": "error", "index": index, "input_path": input_path, "message": str(e)}
+
+def convert_many(input_data, emit):
+    """Converts a folder (or list) of images on a process pool, emitting one result per file as it completes."""
+    started = time.perf_counter()
+    output_dir = input_data.get("output_dir")
+    if not output_dir:
+        raise ValueError("Missing 'output_dir' in input JSON.")
+    input_dir = input_data.get("input_dir")
+    if input_dir:
+        inputs = list(find_images(input_dir, bool(input_data.get("recursive", False))))
+    else:
+        inputs = list(input_data.get("input_paths") or [])
+    image_format = input_data.get("format")
+    if image_format and image_format.lower() not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported format '{image_format}'.")
+    options = {"size": input_data.get("size"), "fit": input_data.get("fit", "thumbnail"),
+               "image_format": image_format, "quality": input_data.get("quality")}
+    workers = max(1, min(int(input_data.get("workers") or os.cpu_count() or 1), os.cpu_count() or 1))
+    skip_existing = bool(input_data.get("skip_existing", False))
+
+    counts = {"success": 0, "error": 0, "skipped": 0}
+    jobs = []
+    for index, (input_path, output_path) in enumerate(plan_outputs(inputs, input_dir, output_dir, image_format)):
+        try:
+            if skip_existing and os.path.getmtime(output_path) >= os.path.getmtime(input_path):
+                counts["skipped"] += 1
+                emit({"status": "skipped", "index": index, "input_path": input_path, "output_path": output_path})
+                continue
+        except OSError:
+            pass  # No output yet
+        jobs.append((index, input_path, output_path))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            futures = {executor.submit(_convert_one, index, input_path, output_path, options): (index, input_path)
+                       for index, input_path, output_path in jobs}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:  # A worker died (e.g. out of memory on a huge image)
+                    index, input_path = futures[future]
+                    result = {"status": "error", "index": index, "input_path": input_path, "message": str(e)}
+                counts[result["status"]] += 1
+                emit(result)
+    emit({"status": "done", "count": len(inputs), "succeeded": counts["success"], "failed": counts["error"],
+          "skipped": counts["skipped"], "workers": workers, "elapsed": round(time.perf_counter() - started, 4)})
+
 def main():
     try:
         input_line = sys.stdin.readline()
@@ -10,15 +142,22 @@ def main():
             sys.exit(0)
 
         input_data = json.loads(input_line)
+        if input_data.get("input_dir") or input_data.get("input_paths") is not None:
+            # Batch mode: one line per image in completion order, then a "done" summary line
+            def emit(result):
+                sys.stdout.write(json.dumps(result) + '\n')
+                sys.stdout.flush()
+            convert_many(input_data, emit)
+            return
+
         input_path = input_data.get("input_path")
         output_path = input_data.get("output_path")
 
         if not input_path or not output_path:
             raise ValueError("Missing 'input_path' or 'output_path' in input JSON.")
 
-        with Image.open(input_path) as img:
-            grayscale_img = img.convert('L')
-            grayscale_img.save(output_path)
+        convert_image(input_path, output_path, input_data.get("size"), input_data.get("fit", "thumbnail"),
+                      input_data.get("format"), input_data.get("quality"))
 
         response = {"status": "success", "message": f"Image saved to {output_path}"}
 
@@ -1,7 +1,11 @@
 ﻿# File: PythonScripts/sentiment_analyzer.py
+import os
 import sys
 import json
-from textblob import TextBlob
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from nlp_service import SentimentScorer
+
+BATCH_LINE_SIZE = 50_000  # Texts scored, and results written, per output line in batch mode
 
 def main():
     try:
@@ -10,28 +14,31 @@ def main():
             sys.exit(0)
 
         input_data = json.loads(input_line)
-        text = input_data.get("text")
-
-        if text is None:
-            raise ValueError("Missing 'text' in input JSON.")
-
-        blob = TextBlob(text)
-        sentiment = blob.sentiment
-        
-        classification = "Neutral"
-        if sentiment.polarity > 0.1:
-            classification = "Positive"
-        elif sentiment.polarity < -0.1:
-            classification = "Negative"
-
-        response = {
-            "status": "success",
-            "sentiment": {
-                "polarity": sentiment.polarity,
-                "subjectivity": sentiment.subjectivity,
-                "classification": classification
+        texts = input_data.get("texts")
+        if texts is not None:
+            # Batch mode: results in input order, BATCH_LINE_SIZE per line, then a "done" summary line
+            if not isinstance(texts, list):
+                raise ValueError("'texts' must be a list of strings.")
+            scorer = SentimentScorer()
+            try:
+                workers = int(input_data.get("workers", os.cpu_count() or 1))
+                for offset in range(0, len(texts), BATCH_LINE_SIZE):
+                    results = scorer.analyze_many(texts[offset:offset + BATCH_LINE_SIZE], workers)
+                    sys.stdout.write(json.dumps({"status": "partial", "offset": offset, "results": results}) + '\n')
+                    sys.stdout.flush()
+                response = {"status": "done", "count": len(texts), **scorer.stats()}
+            finally:
+                scorer.close()
+        else:
+            text = input_data.get("text")
+
+            if text is None:
+                raise ValueError("Missing 'text' in input JSON.")
+
+            response = {
+                "status": "success",
+                "sentiment": SentimentScorer().analyze_many([text])[0]
             }
-        }
 
     except Exception as e:
         response = {"status": "error", "message": str(e)}
@@ -1,8 +1,165 @@
 ﻿# File: PythonScripts/title_scraper.py
+import os
+import re
 import sys
 import json
+import time
+import codecs
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from http_cache import HttpCache, CachedResponse
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+CHUNK_SIZE = 16 * 1024
+MAX_HEAD_BYTES = 512 * 1024  # Give up looking for a title after this much of the page
+DRAIN_BYTES = 64 * 1024      # Finish reading a body this close to its end so the connection is reused
+DEFAULT_CONCURRENCY = 16
+MAX_CONCURRENCY = 128
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+class TitleParser(HTMLParser):
+    """Incremental parser that only looks for the document's <title>.
+
+    It is done at </title>, or at the end of <head> / start of <body> when
+    the page has no title, so callers can stop reading the response there.
+    """
+
+    def __init__(self, charset=None):
+        super().__init__(convert_charrefs=True)
+        self.charset = charset
+        self._decoder = None
+        self._pending = b''
+        self._in_title = False
+        self._parts = None
+        self.done = False
+
+    def feed_bytes(self, chunk):
+        """Feeds raw body bytes; returns True once the title (or its absence) is known."""
+        if self._decoder is None:
+            # Without a charset header, sniff <meta charset> in the first KB like a browser does
+            self._pending += chunk
+            if self.charset is None and len(self._pending) < 1024 and chunk:
+                return False
+            self._start_decoding()
+            chunk, self._pending = self._pending, b''
+        self.feed(self._decoder.decode(chunk, final=not chunk))
+        return self.done
+
+    def _start_decoding(self):
+        charset = self.charset
+        if charset is None:
+            match = _META_CHARSET.search(self._pending[:1024])
+            charset = match.group(1).decode('ascii') if match else 'utf-8'
+        try:
+            self._decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'title' and self._parts is None:
+            self._in_title = True
+            self._parts = []
+        elif tag == 'body':
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            self.done = True
+        elif tag == 'head':
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._parts.append(data)
+
+    def title(self):
+        text = ''.join(self._parts or ()).strip()
+        return text or None
+
+def _charset(headers):
+    match = re.search(r'charset\s*=\s*["\']?([\w.:-]+)', headers.get('content-type', ''), re.IGNORECASE)
+    return match.group(1) if match else None
+
+def parse_title(body, headers):
+    parser = TitleParser(_charset(headers))
+    parser.feed_bytes(body)
+    parser.feed_bytes(b'')  # Flush a body shorter than the sniffing window
+    return parser.title()
+
+def make_session(concurrency):
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=max(10, concurrency), pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def fetch_page(url, session, cache):
+    """GETs only as much of `url` as it takes to find the title, through the on-disk HTTP cache."""
+    def download(extra_headers):
+        with session.get(url, headers=extra_headers, timeout=10, stream=True) as http_response:
+            if http_response.status_code >= 400:
+                return CachedResponse(http_response.status_code, http_response.headers, b'', complete=False)
+            parser = TitleParser(_charset(http_response.headers))
+            body = bytearray()
+            chunks = http_response.iter_content(chunk_size=CHUNK_SIZE)
+            complete = True
+            for chunk in chunks:
+                body += chunk
+                if parser.feed_bytes(chunk) or len(body) >= MAX_HEAD_BYTES:
+                    complete = False
+                    break
+            if not complete:
+                # A nearly finished body is cheaper to drain than a new TLS connection is to open
+                length = http_response.headers.get('content-length', '')
+                remaining = int(length) - http_response.raw.tell() if length.isdigit() else None
+                if remaining is not None and 0 <= remaining <= DRAIN_BYTES:
+                    for chunk in chunks:
+                        body += chunk
+                    complete = True
+            return CachedResponse(http_response.status_code, http_response.headers, bytes(body), complete)
+
+    page = cache.request(url, download, HEADERS, accept_partial=True)
+    if page.status_code >= 400:
+        # Same error as raise_for_status(), for cached and fresh responses alike
+        raise requests.HTTPError(f"{page.status_code} Error for url: {url}")
+    return page
+
+def scrape(url, session, cache):
+    page = fetch_page(url, session, cache)
+    title = parse_title(page.body, page.headers) or "No title found"
+    return {"status": "success", "title": title, "cache": page.cache}
+
+def scrape_many(urls, concurrency, emit):
+    """Scrapes every URL on a bounded pool, emitting one result per URL as it completes."""
+    started = time.perf_counter()
+    concurrency = max(1, min(int(concurrency), MAX_CONCURRENCY))
+    session = make_session(concurrency)
+    cache = HttpCache()
+    failed = 0
+
+    def one(index, url):
+        try:
+            return dict(scrape(url, session, cache), index=index, url=url)
+        except Exception as e:
+            return {"status": "error", "index": index, "url": url, "message": str(e)}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(one, index, url) for index, url in enumerate(urls)]
+        for future in as_completed(futures):
+            result = future.result()
+            failed += result["status"] != "success"
+            emit(result)
+    session.close()
+    emit({"status": "done", "count": len(urls), "succeeded": len(urls) - failed, "failed": failed,
+          "elapsed": round(time.perf_counter() - started, 4)})
 
 def main():
     try:
@@ -11,22 +168,24 @@ def main():
             sys.exit(0)
 
         input_data = json.loads(input_line)
+        urls = input_data.get("urls")
+        if urls is not None:
+            # Bulk mode: one line per URL in completion order, then a "done" summary line
+            lock = threading.Lock()
+            def emit(result):
+                with lock:
+                    sys.stdout.write(json.dumps(result) + '\n')
+                    sys.stdout.flush()
+            scrape_many(urls, input_data.get("concurrency", DEFAULT_CONCURRENCY), emit)
+            return
+
         url = input_data.get("url")
 
         if not url:
             raise ValueError("Missing 'url' in input JSON.")
 
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        http_response = requests.get(url, headers=headers, timeout=10)
-        http_response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-
-        soup = BeautifulSoup(http_response.text, 'html.parser')
-        
-        title = "No title found"
-        if soup.title and soup.title.string:
-            title = soup.title.string.strip()
-
-        response = {"status": "success", "title": title}
+        session = make_session(1)
+        response = scrape(url, session, HttpCache())
 
     except Exception as e:
         response = {"status": "error", "message": str(e)}
@@ -38,4 +197,4 @@ def main():
     sys.stdout.flush()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,336 @@
+﻿# http_cache.py
+# Private HTTP cache (memory + disk) shared by scripts in LocalSocket/ and
+# StandardIO/. Scripts import it by putting this directory on sys.path.
+#
+# Honours Cache-Control / Expires for freshness, revalidates stale entries
+# with If-None-Match / If-Modified-Since, and collapses concurrent identical
+# requests (same URL and headers) into one upstream fetch (single-flight).
+# Entries are keyed by URL and credentials, and responses to authorized
+# requests are only stored when the server marks them shareable.
+import os, json, time, hashlib, threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+DEFAULT_DIRECTORY = os.environ.get(
+    "PYTHON_IPC_HTTP_CACHE", os.path.join(os.path.expanduser("~"), ".python_ipc_tool", "http_cache"))
+MAX_MEMORY_BYTES = 32 * 1024 * 1024
+MAX_DISK_BYTES = 256 * 1024 * 1024
+MAX_ENTRY_BYTES = 4 * 1024 * 1024
+HEURISTIC_FRACTION = 0.1  # Of the time since Last-Modified, when no explicit lifetime is given
+MAX_HEURISTIC_LIFETIME = 24 * 3600
+CACHEABLE_STATUSES = (200, 203, 300, 301, 308, 404, 410)
+CREDENTIAL_HEADERS = ("authorization", "cookie")  # Part of the storage key: one caller's entries never serve another
+
+class CachedResponse:
+    """What a fetch produced, or what the cache answered with instead.
+
+    `cache` is "hit" (served without contacting the server), "revalidated"
+    (server answered 304), "miss" (fetched and stored), "bypass" (fetched,
+    not cacheable) or "coalesced" (shared with a concurrent identical
+    request). `complete` is False when the body is only a prefix of the
+    real one (the fetcher stopped reading early).
+    """
+
+    def __init__(self, status_code, headers, body, complete=True, cache="miss"):
+        self.status_code = status_code
+        self.headers = {k.lower(): v for k, v in headers.items()}
+        self.body = body
+        self.complete = complete
+        self.cache = cache
+
+def _parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') or True
+    return directives
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError, IndexError):
+        return None
+
+class _Entry:
+    def __init__(self, url, status_code, headers, body, complete, vary, stored_at):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.complete = complete
+        self.vary = vary
+        self.stored_at = stored_at
+
+    def lifetime(self):
+        cc = _parse_cache_control(self.headers.get("cache-control"))
+        if "no-cache" in cc:
+            return 0.0
+        if "max-age" in cc:
+            try:
+                return float(cc["max-age"])
+            except ValueError:
+                return 0.0
+        date = _http_date(self.headers.get("date")) or self.stored_at
+        expires = self.headers.get("expires")
+        if expires is not None:
+            expires = _http_date(expires)
+            return max(0.0, expires - date) if expires else 0.0  # Invalid Expires means "already expired"
+        modified = _http_date(self.headers.get("last-modified"))
+        if modified and modified < date:
+            return min(HEURISTIC_FRACTION * (date - modified), MAX_HEURISTIC_LIFETIME)
+        return 0.0
+
+    def age(self, now):
+        try:
+            initial = float(self.headers.get("age", 0))
+        except ValueError:
+            initial = 0.0
+        return initial + max(0.0, now - self.stored_at)
+
+    def fresh(self, now):
+        return self.age(now) < self.lifetime()
+
+    def validators(self):
+        headers = {}
+        if "etag" in self.headers:
+            headers["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+    def size(self):
+        return len(self.body) + 512
+
+    def meta(self):
+        return {"url": self.url, "status_code": self.status_code, "headers": self.headers,
+                "complete": self.complete, "vary": self.vary, "stored_at": self.stored_at}
+
+class HttpCache:
+    """Memory LRU in front of a size-bounded directory of cached responses.
+
+    Call `request(url, fetch, headers)`, where `fetch(extra_headers)` performs
+    the real GET (adding the given conditional headers) and returns a
+    CachedResponse. The cache decides whether `fetch` needs to run at all.
+    `headers` must be everything the request will carry, session defaults
+    and credentials included, since they decide which entry may answer.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_memory_bytes=MAX_MEMORY_BYTES,
+                 max_disk_bytes=MAX_DISK_BYTES, max_entry_bytes=MAX_ENTRY_BYTES):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = None  # Measured lazily on the first disk write
+        self.counts = {"hit": 0, "revalidated": 0, "miss": 0, "bypass": 0, "coalesced": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # --- Public API ---
+
+    def request(self, url, fetch, headers=None, accept_partial=False):
+        """Returns a CachedResponse for GET `url`, contacting the server only if needed."""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        request_cc = _parse_cache_control(headers.get("cache-control"))
+        if "no-store" in request_cc:
+            return self._count(fetch({}), "bypass")
+
+        key = self._key(url, [headers.get(name) for name in CREDENTIAL_HEADERS])
+        # Single-flight: the first caller fetches, everyone else with the same headers waits for its result
+        flight_key = self._key(url, sorted(headers.items()))
+        with self._lock:
+            flight = self._inflight.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[flight_key] = {"done": threading.Event(), "result": None, "error": None}
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            result = flight["result"]
+            if result.complete or accept_partial:
+                return self._count(CachedResponse(result.status_code, result.headers, result.body,
+                                                  result.complete), "coalesced")
+            return self.request(url, fetch, headers, accept_partial)  # Leader only read a prefix
+
+        try:
+            result = self._request(key, url, fetch, headers, request_cc, accept_partial)
+            flight["result"] = result
+            return result
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[flight_key]
+            flight["done"].set()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+            served = counts["hit"] + counts["revalidated"] + counts["coalesced"]
+            lookups = served + counts["miss"]
+            counts.update(memory_entries=len(self._memory), memory_bytes=self._memory_bytes,
+                          hit_ratio=round(served / lookups, 4) if lookups else None)
+        return counts
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.directory:
+            with self._disk_lock:
+                for name in os.listdir(self.directory):
+                    if name.endswith((".json", ".body")):
+                        os.remove(os.path.join(self.directory, name))
+                self._disk_bytes = 0
+
+    # --- Internals ---
+
+    @staticmethod
+    def _key(url, parts):
+        return hashlib.sha256(json.dumps([url, parts]).encode("utf-8")).hexdigest()
+
+    def _count(self, response, outcome):
+        response.cache = outcome
+        with self._lock:
+            self.counts[outcome] += 1
+        return response
+
+    def _request(self, key, url, fetch, headers, request_cc, accept_partial):
+        now = time.time()
+        entry = self._load(key)
+        if entry is not None and not self._matches(entry, url, headers, accept_partial):
+            entry = None
+
+        force_revalidate = "no-cache" in request_cc or request_cc.get("max-age") == "0"
+        if entry is not None and not force_revalidate and entry.fresh(now):
+            self._remember(key, entry)
+            return self._count(CachedResponse(entry.status_code, entry.headers, entry.body,
+                                              entry.complete), "hit")
+
+        conditional = entry.validators() if entry is not None and entry.complete else {}
+        response = fetch(conditional)
+        if response.status_code == 304 and conditional:
+            # Still valid: keep the body, take the new headers (and so the new lifetime)
+            entry.headers.update(response.headers)
+            entry.stored_at = time.time()
+            self._store(key, entry)
+            return self._count(CachedResponse(entry.status_code, entry.headers, entry.body,
+                                              entry.complete), "revalidated")
+
+        if self._storable(response, headers):
+            vary = {name: headers.get(name) for name in self._vary_names(response.headers)}
+            self._store(key, _Entry(url, response.status_code, response.headers, response.body,
+                                    response.complete, vary, time.time()))
+            return self._count(response, "miss")
+        return self._count(response, "bypass")
+
+    @staticmethod
+    def _vary_names(headers):
+        return [name.strip().lower() for name in headers.get("vary", "").split(",") if name.strip()]
+
+    def _matches(self, entry, url, headers, accept_partial):
+        if entry.url != url or (not entry.complete and not accept_partial):
+            return False
+        return all(headers.get(name) == value for name, value in entry.vary.items())
+
+    def _storable(self, response, headers):
+        cc = _parse_cache_control(response.headers.get("cache-control"))
+        if response.status_code not in CACHEABLE_STATUSES or "no-store" in cc:
+            return False
+        if "authorization" in headers and not ("public" in cc or "s-maxage" in cc):
+            return False  # Authorized responses are per-user unless the server says otherwise
+        if "*" in self._vary_names(response.headers) or len(response.body) > self.max_entry_bytes:
+            return False
+        # Worth keeping only if it can be served fresh or revalidated later
+        return bool(cc.get("max-age") or "expires" in response.headers or "etag" in response.headers
+                    or "last-modified" in response.headers)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old.size()
+            self._memory[key] = entry
+            self._memory_bytes += entry.size()
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                _key, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.size()
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        if not self.directory:
+            return None
+        base = os.path.join(self.directory, key)
+        try:
+            with open(base + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(base + ".body", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        entry = _Entry(meta["url"], meta["status_code"], meta["headers"], body, meta.get("complete", True),
+                       meta.get("vary", {}), meta["stored_at"])
+        self._remember(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        self._remember(key, entry)
+        if not self.directory:
+            return
+        base = os.path.join(self.directory, key)
+        with self._disk_lock:
+            try:
+                previous = os.path.getsize(base + ".body") if os.path.exists(base + ".body") else 0
+                # Body first, then metadata: a reader never sees metadata for a missing body
+                for suffix, payload in ((".body", entry.body),
+                                        (".json", json.dumps(entry.meta()).encode("utf-8"))):
+                    temp = f"{base}{suffix}.{threading.get_ident()}.tmp"
+                    with open(temp, "wb") as f:
+                        f.write(payload)
+                    os.replace(temp, base + suffix)
+                if self._disk_bytes is None:
+                    self._disk_bytes = self._measure_disk()
+                else:
+                    self._disk_bytes += len(entry.body) - previous
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk()
+            except OSError:
+                pass  # The disk tier is best-effort; memory still has the entry
+
+    def _measure_disk(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory) if name.endswith(".body"))
+
+    def _evict_disk(self):
+        """Deletes least recently written entries until the directory is 10% under its limit."""
+        bodies = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".body"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                bodies.append((stat.st_mtime, stat.st_size, path[:-len(".body")]))
+        bodies.sort()
+        total = sum(size for _mtime, size, _base in bodies)
+        target = self.max_disk_bytes * 0.9
+        for _mtime, size, base in bodies:
+            if total <= target:
+                break
+            for suffix in (".json", ".body"):
+                try:
+                    os.remove(base + suffix)
+                except OSError:
+                    pass
+            total -= size
+        self._disk_bytes = total
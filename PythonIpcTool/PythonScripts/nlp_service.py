@@ -0,0 +1,114 @@
+﻿# nlp_service.py
+# Sentiment scoring shared by StandardIO/sentiment_analyzer.py and
+# LocalSocket/chatbot.py. Scripts import it by putting this directory on
+# sys.path, like http_cache.py.
+#
+# The lexicon is loaded once per process and texts are scored straight
+# through TextBlob's pattern analyzer (what `TextBlob(text).sentiment` ends
+# up calling), without building a TextBlob per text. Batches are
+# de-duplicated, repeated texts are answered from an LRU cache, and large
+# batches can be spread over a process pool.
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+CACHE_SIZE = 100_000       # Distinct texts whose scores are remembered
+POOL_MIN_TEXTS = 10_000    # Smaller batches are scored in-process; a pool costs more to start than it saves
+POOL_CHUNK = 1_000         # Texts per task handed to a pool worker
+POSITIVE_THRESHOLD = 0.1   # Polarity above this is "Positive", below its negative "Negative"
+
+def classify(polarity, threshold=POSITIVE_THRESHOLD):
+    if polarity > threshold:
+        return "Positive"
+    if polarity < -threshold:
+        return "Negative"
+    return "Neutral"
+
+def _load_analyzer():
+    from textblob.en import sentiment
+    sentiment.load()  # The lexicon is otherwise read lazily, on the first text scored
+    return sentiment
+
+class SentimentScorer:
+    """Polarity / subjectivity for texts, with the lexicon kept loaded.
+
+    `score_many` returns one (polarity, subjectivity) pair per input text,
+    in order. Identical texts are scored once per batch and remembered
+    across batches; with `workers` > 1, big batches of new texts are split
+    across that many processes.
+    """
+
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.analyzer = _load_analyzer()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pool = None
+        self._pool_workers = 0
+        self.counts = {"scored": 0, "cached": 0}
+
+    def score(self, text):
+        return self.score_many([text])[0]
+
+    def score_many(self, texts, workers=1):
+        texts = [str(text) for text in texts]
+        scores = {}
+        pending = []
+        for text in dict.fromkeys(texts):  # Unique texts, first-seen order
+            cached = self._cache.get(text)
+            if cached is None:
+                pending.append(text)
+            else:
+                self._cache.move_to_end(text)
+                scores[text] = cached
+        self.counts["cached"] += len(texts) - len(pending)
+        self.counts["scored"] += len(pending)
+
+        workers = max(1, min(int(workers), os.cpu_count() or 1))
+        if workers > 1 and len(pending) >= POOL_MIN_TEXTS:
+            chunks = [pending[i:i + POOL_CHUNK] for i in range(0, len(pending), POOL_CHUNK)]
+            fresh = [pair for chunk in self._get_pool(workers).map(_score_chunk, chunks) for pair in chunk]
+        else:
+            fresh = [tuple(self.analyzer(text)) for text in pending]
+        for text, pair in zip(pending, fresh):
+            scores[text] = pair
+            self._remember(text, pair)
+        return [scores[text] for text in texts]
+
+    def analyze_many(self, texts, workers=1):
+        """Like score_many, as the dicts the scripts reply with."""
+        return [{"polarity": polarity, "subjectivity": subjectivity, "classification": classify(polarity)}
+                for polarity, subjectivity in self.score_many(texts, workers)]
+
+    def stats(self):
+        return dict(self.counts, cache_entries=len(self._cache), pool_workers=self._pool_workers)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool, self._pool_workers = None, 0
+
+    def _remember(self, text, pair):
+        if self.cache_size <= 0:
+            return
+        self._cache[text] = pair
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _get_pool(self, workers):
+        if self._pool is None or self._pool_workers != workers:
+            self.close()
+            # Workers load the lexicon once in the initializer, not per task
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            self._pool_workers = workers
+        return self._pool
+
+# --- Pool worker side ---
+
+_worker_analyzer = None
+
+def _init_worker():
+    global _worker_analyzer
+    _worker_analyzer = _load_analyzer()
+
+def _score_chunk(texts):
+    return [tuple(_worker_analyzer(text)) for text in texts]